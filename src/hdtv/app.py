@@ -141,6 +141,7 @@ class App:
         import hdtv.plugins.fitlist
         import hdtv.plugins.fitmap
         import hdtv.plugins.fittex
+        import hdtv.plugins.listmode
         import hdtv.plugins.ls
         import hdtv.plugins.matInterface
         import hdtv.plugins.peakfinder
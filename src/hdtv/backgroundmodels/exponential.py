@@ -42,9 +42,10 @@ class BackgroundModelExponential(BackgroundModel):
         """
         self.fParStatus["nparams"] = 2
 
-    def GetFitter(self, integrate, likelihood, nparams=None, nbg=None):
+    def GetFitter(self, integrate, likelihood, engine=None, nparams=None, nbg=None):
         """
         Creates a C++ Fitter object, which can then do the real work
+        engine is ignored (always fitted with TH1::Fit)
         """
         if nparams is not None:
             self.fFitter = ROOT.HDTV.Fit.ExpBg(nparams, integrate, likelihood)
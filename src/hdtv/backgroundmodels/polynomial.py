@@ -42,31 +42,34 @@ class BackgroundModelPolynomial(BackgroundModel):
         """
         self.fParStatus["nparams"] = 2
 
-    def GetFitter(self, integrate, likelihood, nparams=None, nbg=None):
+    def GetFitter(self, integrate, likelihood, engine=None, nparams=None, nbg=None):
         """
         Creates a C++ Fitter object, which can then do the real work
         """
+        options = (
+            (integrate, likelihood)
+            if engine is None
+            else (integrate, likelihood, engine)
+        )
         if nparams is not None:
             if nparams == "free":
                 if nbg is None:
                     raise ValueError(
                         "Free number of background parameters specified, but no number of background regions given."
                     )
-                self.fFitter = ROOT.HDTV.Fit.PolyBg(nbg, integrate, likelihood)
+                self.fFitter = ROOT.HDTV.Fit.PolyBg(nbg, *options)
                 self.fParStatus["nparams"] = nbg
             else:
-                self.fFitter = ROOT.HDTV.Fit.PolyBg(nparams, integrate, likelihood)
+                self.fFitter = ROOT.HDTV.Fit.PolyBg(nparams, *options)
                 self.fParStatus["nparams"] = nparams
         elif isinstance(self.fParStatus["nparams"], int):
-            self.fFitter = ROOT.HDTV.Fit.PolyBg(
-                self.fParStatus["nparams"], integrate, likelihood
-            )
+            self.fFitter = ROOT.HDTV.Fit.PolyBg(self.fParStatus["nparams"], *options)
         elif self.fParStatus["nparams"] == "free":
             if nbg is None:
                 raise ValueError(
                     "Free number of background parameters specified, but no number of background regions given."
                 )
-            self.fFitter = ROOT.HDTV.Fit.PolyBg(nbg, integrate, likelihood)
+            self.fFitter = ROOT.HDTV.Fit.PolyBg(nbg, *options)
         else:
             msg = (
                 "Status specifier %s of background fitter is invalid."
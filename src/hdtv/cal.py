@@ -22,6 +22,7 @@ import re
 from array import array
 from html import escape
 
+import numpy as np
 import ROOT
 
 import hdtv.options
@@ -89,6 +90,51 @@ def GetCoeffs(cal):
     return list(cal.GetCoeffs())
 
 
+def Ch2E(cal, ch):
+    """
+    Convert channels to energies, like cal.Ch2E(), but for numpy arrays
+    """
+    if cal is None or cal.IsTrivial():
+        return np.asarray(ch, dtype=np.float64)
+    # Horner scheme, same order of operations as HDTV::Calibration::Ch2E
+    return np.polyval(list(cal.GetCoeffs())[::-1], np.asarray(ch, dtype=np.float64))
+
+
+def E2Ch(cal, e):
+    """
+    Convert energies to channels, like cal.E2Ch(), but for numpy arrays
+    """
+    e = np.asarray(e, dtype=np.float64)
+    if cal is None or cal.IsTrivial():
+        return e
+    coeffs = list(cal.GetCoeffs())[::-1]
+    deriv = np.polyder(coeffs) if len(coeffs) > 1 else [0.0]
+    # Newton's method, same starting point and stopping criterion as
+    # HDTV::Calibration::E2Ch
+    ch = np.ones_like(e)
+    de = np.polyval(coeffs, ch) - e
+    scale = np.maximum(np.abs(e), 1.0)
+    for _ in range(10):
+        todo = np.abs(de / scale) > 1e-10
+        if not todo.any():
+            break
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ch = np.where(todo, ch - de / np.polyval(deriv, ch), ch)
+        de = np.polyval(coeffs, ch) - e
+    if (np.abs(de / scale) > 1e-10).any():
+        hdtv.ui.warning("Solver failed to converge in E2Ch()")
+    return ch
+
+
+def PolyFitCalibration(channels, energies, degree):
+    """
+    Create a calibration from an unweighted linear least squares fit of a
+    polynomial of the given degree to arrays of channels and energies
+    """
+    poly = np.polynomial.Polynomial.fit(channels, energies, degree)
+    return MakeCalibration(poly.convert().coef)
+
+
 def PrintCal(cal):
     """
     Get the calibration as string
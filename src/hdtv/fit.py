@@ -73,6 +73,8 @@ class Fit(Drawable):
         self._spec = None
         self.active = False
         self.integral = None
+        # Previous fit, for warm starts (see GetStartValues())
+        self._start = None
 
     # ID property
     def _get_ID(self):
@@ -145,7 +147,8 @@ class Fit(Drawable):
             return
         # use weakref to prevent problems with cyclic reference
         self._spec = weakref(spec)
-        self.Erase()
+        # Start values of a fit moved to another spectrum need to be mapped
+        self.Erase(cal=self.cal)
         if spec is None:
             self.FixMarkerInCal()
             self.cal = None
@@ -168,6 +171,22 @@ class Fit(Drawable):
             ids.append(ID(self.ID.major, i))
         return ids
 
+    @property
+    def extent(self):
+        """
+        Range (uncalibrated) covered by the region and background markers,
+        i.e. the part of the spectrum the fit depends on, or None
+        """
+        positions = [
+            p.pos_uncal
+            for m in list(self.regionMarkers) + list(self.bgMarkers)
+            for p in (m.p1, m.p2)
+            if p is not None
+        ]
+        if not positions:
+            return None
+        return (min(positions), max(positions))
+
     def __str__(self):
         """
         show fit results in a nice table
@@ -351,6 +370,9 @@ class Fit(Drawable):
             markers.SetMarker(pos)
         if action == "remove":
             markers.RemoveNearest(pos)
+        # A fit of another region does not start from the previous one
+        if mtype == "region":
+            self.ResetStartValues()
 
     def FixMarkerInCal(self):
         """
@@ -416,6 +438,15 @@ class Fit(Drawable):
         Do the actual peak fit and extract the functions for display
         Note: You still need to call Draw afterwards.
         """
+        self.PrepareFit(spec)
+        self.RunFitter()
+        self.ExtractPeakFunc()
+
+    def PrepareFit(self, spec=None):
+        """
+        First step of FitPeakFunc(): reset the fit and remove peak markers
+        outside of the region
+        """
         # Call pre hooks
         for func in Fit.FitPeakPreHooks:
             func(self)
@@ -423,11 +454,30 @@ class Fit(Drawable):
         if spec is not None:
             self.spec = spec
         self.Erase()
+        if self.regionMarkers.IsFull():
+            region = sorted(
+                [self.regionMarkers[0].p1.pos_uncal, self.regionMarkers[0].p2.pos_uncal]
+            )
+            # remove peak marker that are outside of region
+            for m in self.peakMarkers[:]:
+                # we need to loop over a copy here,
+                # otherwise we get out of sync after deleting items
+                if m.p1.pos_uncal < region[0] or m.p1.pos_uncal > region[1]:
+                    self.peakMarkers.remove(m)
+
+    def RunFitter(self, hist=None):
+        """
+        Second step of FitPeakFunc(): the fit itself, of hist (default: the
+        histogram of the spectrum). This only works on the fitter of this
+        fit, so that several fits can run concurrently (see Fitter.FitMany()).
+        """
         # fit background
         if len(self.bgMarkers) > 0:
             backgrounds = self._get_background_pairs()
             try:
-                self.fitter.FitBackground(spec=self.spec, backgrounds=backgrounds)
+                self.fitter.FitBackground(
+                    spec=self.spec, backgrounds=backgrounds, hist=hist
+                )
             except ValueError:
                 raise hdtv.cmdline.HDTVCommandAbort("Background fit failed.")
         # fit peaks
@@ -435,14 +485,81 @@ class Fit(Drawable):
             region = sorted(
                 [self.regionMarkers[0].p1.pos_uncal, self.regionMarkers[0].p2.pos_uncal]
             )
-            # remove peak marker that are outside of region
-            for m in self.peakMarkers[:]:
-                # we need to loop over a copy here,
-                # otherwise we get out of sync after deleting items
-                if m.p1.pos_uncal < region[0] or m.p1.pos_uncal > region[1]:
-                    self.peakMarkers.remove(m)
             peaks = sorted(m.p1.pos_uncal for m in self.peakMarkers)
-            self.fitter.FitPeaks(spec=self.spec, region=region, peaklist=peaks)
+            start, bgstart = self.GetStartValues()
+            self.fitter.FitPeaks(
+                spec=self.spec,
+                region=region,
+                peaklist=peaks,
+                hist=hist,
+                start=start,
+                bgstart=bgstart,
+            )
+
+    def GetStartValues(self):
+        """
+        Parameters of the previous peak fit (or of the fit this one was
+        copied from) as initial values for the next one, if the peak model
+        has the warm start option set (see Fitter.FitPeaks()). They are mapped
+        through the change of calibration for copied fits.
+
+        Returns a list of dicts with the uncalibrated parameters, one per peak
+        (sorted by position), and the coefficients of the internal
+        background, or None for both if there is no previous fit.
+        """
+        if self._start is None or not self.fitter.GetWarmStart():
+            return None, None
+        peaks, cal, bgParams = self._start
+        start = []
+        for peak in sorted(peaks):
+            values = {}
+            for name in ["vol", "width", "tl", "tr", "sh", "sw"]:
+                value = getattr(peak, name, None)
+                if value is not None:
+                    values[name] = value.nominal_value
+            if cal is not None and self.cal is not None and values.get("width"):
+                # Same energies with the new calibration: widths and tails
+                # scale like the channels at the position of the peak
+                pos = peak.pos.nominal_value
+                hwhm = values["width"] / 2.0
+                lower = self.cal.E2Ch(cal.Ch2E(pos - hwhm))
+                upper = self.cal.E2Ch(cal.Ch2E(pos + hwhm))
+                scale = (upper - lower) / values["width"]
+                for name in ["width", "tl", "tr"]:
+                    if name in values:
+                        values[name] *= scale
+            start.append(values)
+        # The internal background is a polynomial in channels, which is only
+        # valid for the same calibration
+        bgstart = None
+        if bgParams is not None and cal is None:
+            bgstart = [p.nominal_value for p in bgParams]
+        return start, bgstart
+
+    def ResetStartValues(self):
+        """
+        Forget the previous fit, so that the next one is not warm started
+        """
+        self._start = None
+
+    def _GetStart(self, cal=None):
+        """
+        Results of the peak fit to be kept as start values of a later one
+        (cal: calibration of the fit, if they need to be mapped), or the ones
+        kept before if there are none
+        """
+        if not self.peaks:
+            return self._start
+        # Coefficients of an external background are not start values
+        bgParams = None if self.fitter.bgFitter else list(self.bgParams)
+        return (list(self.peaks), cal, bgParams)
+
+    def ExtractPeakFunc(self):
+        """
+        Last step of FitPeakFunc(): extract the results and the functions for
+        display from the fitter
+        """
+        if len(self.peakMarkers) > 0 and self.regionMarkers.IsFull():
             # get background function
             self.bgParams = []
             nparams = self.fitter.backgroundModel.fParStatus["nparams"]
@@ -594,10 +711,16 @@ class Fit(Drawable):
             self.bgMarkers.Refresh()
             self.Show()
 
-    def Erase(self, bg_only=False):
+    def Erase(self, bg_only=False, cal=None):
         """
         Erase previous fit. NOTE: the fitter is *not* resetted
+
+        The peak fit is kept as start values of the next one (see
+        GetStartValues()); cal is the calibration it was done with, if they
+        need to be mapped because the fit changes its spectrum.
         """
+        if not bg_only:
+            self._start = self._GetStart(cal)
         # remove bg fit
         self.dispBgFunc = None
         self.fitter.bgFitter = None
@@ -715,6 +838,7 @@ class Fit(Drawable):
         """
         new = Fit(copy.copy(self.fitter), cal=self.cal, color=self.color)
         new.FixMarkerInCal()
+        new._start = self._GetStart(self.cal)
         for marker in self.bgMarkers:
             new.bgMarkers.SetMarker(marker.p1.pos_cal)
             if marker.p2:
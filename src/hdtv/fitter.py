@@ -17,10 +17,15 @@
 # along with HDTV; if not, write to the Free Software Foundation,
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import ROOT
 
 import hdtv.backgroundmodels
 import hdtv.peakmodels
+import hdtv.ui
+from hdtv.histogram import CloneRegion
 from hdtv.util import Pairs
 
 
@@ -50,15 +55,31 @@ class Fitter:
         # Look in peakModel for unknown attributes
         return getattr(self.peakModel, name)
 
-    def FitBackground(self, spec, backgrounds=None):
+    def GetEngine(self):
+        """
+        Fit engine option of the peak model, if it has one
         """
-        Create Background Fitter object and do the background fit
+        if "engine" in self.peakModel.fOptStatus:
+            return self.peakModel.GetOption("engine")
+        return None
+
+    def GetWarmStart(self):
+        """
+        Warm start option of the peak model, if it has one
+        """
+        return bool(self.peakModel.fOptStatus.get("warmstart", False))
+
+    def FitBackground(self, spec, backgrounds=None, hist=None):
+        """
+        Create Background Fitter object and do the background fit (of hist,
+        default: histogram of spec)
         """
         backgrounds = backgrounds or Pairs()
         # create fitter
         self.bgFitter = self.backgroundModel.GetFitter(
             integrate=self.peakModel.GetOption("integrate"),
             likelihood=self.peakModel.GetOption("likelihood"),
+            engine=self.GetEngine(),
             nparams=self.backgroundModel.fParStatus["nparams"],
             nbg=len(backgrounds),
         )
@@ -69,7 +90,7 @@ class Fitter:
             for bg in backgrounds:
                 self.bgFitter.AddRegion(bg[0], bg[1])
             # do the background fit
-            self.bgFitter.Fit(spec.hist.hist)
+            self.bgFitter.Fit(spec.hist.hist if hist is None else hist)
 
     def RestoreBackground(self, backgrounds=None, params=None, chisquare=0.0):
         """
@@ -81,6 +102,7 @@ class Fitter:
         self.bgFitter = self.backgroundModel.GetFitter(
             integrate=self.peakModel.GetOption("integrate"),
             likelihood=self.peakModel.GetOption("likelihood"),
+            engine=self.GetEngine(),
             nparams=len(params),
             nbg=len(backgrounds),
         )
@@ -92,23 +114,42 @@ class Fitter:
             errorArray[i] = param.std_dev
         self.bgFitter.Restore(valueArray, errorArray, chisquare)
 
-    def FitPeaks(self, spec, region=None, peaklist=None):
+    def FitPeaks(
+        self, spec, region=None, peaklist=None, hist=None, start=None, bgstart=None
+    ):
         """
-        Create the Peak Fitter object and do the peak fit
+        Create the Peak Fitter object and do the peak fit (of hist, default:
+        histogram of spec)
+
+        If the peak model has the warm start option set, the parameters of a
+        previous fit (start: one dict per peak, bgstart: coefficients of the
+        internal background) are used as initial values, instead of
+        estimating them from the histogram.
         """
         region = region or Pairs()
         peaklist = peaklist or []
+        if hist is None:
+            hist = spec.hist.hist
+        warmstart = self.GetWarmStart()
         # create the fitter
-        self.peakFitter = self.peakModel.GetFitter(region, peaklist, spec.cal)
+        if warmstart and start is not None and len(start) == len(peaklist):
+            self.peakFitter = self.peakModel.GetFitter(
+                region, peaklist, spec.cal, start=start
+            )
+        else:
+            self.peakFitter = self.peakModel.GetFitter(region, peaklist, spec.cal)
         # Do the peak fit
         if self.bgFitter:
             # external background
-            self.peakFitter.Fit(spec.hist.hist, self.bgFitter)
+            self.peakFitter.Fit(hist, self.bgFitter)
         else:
             # internal background
-            self.peakFitter.Fit(
-                spec.hist.hist, self.backgroundModel.fParStatus["nparams"]
-            )
+            if warmstart and bgstart:
+                values = ROOT.TArrayD(len(bgstart))
+                for i, value in enumerate(bgstart):
+                    values[i] = value
+                self.peakFitter.SetIntBgStart(values)
+            self.peakFitter.Fit(hist, self.backgroundModel.fParStatus["nparams"])
 
     def RestorePeaks(
         self, cal=None, region=None, peaks=None, chisquare=0.0, coeffs=None
@@ -140,6 +181,63 @@ class Fitter:
         for i, peak in enumerate(peaks):
             self.peakModel.RestoreParams(peak, self.peakFitter.GetPeak(i))
 
+    @staticmethod
+    def FitMany(spec, fits, nworkers=None):
+        """
+        Repeat the peak fits of several fits of a spectrum concurrently in
+        nworkers threads (default: number of CPUs), like Fit.FitPeakFunc().
+        Each fit works on a copy of the part of the histogram it depends on,
+        and the results are merged into the fits in the given order.
+
+        TMinuit uses global state and cannot run in several threads, so if it
+        is the default minimizer, Minuit2 is used instead while fitting. The
+        results may therefore differ slightly from serial fits.
+
+        Returns:
+            List with the exception raised by each fit, or None on success
+        """
+        if nworkers is None:
+            nworkers = os.cpu_count() or 1
+        ROOT.ROOT.EnableThreadSafety()
+        # Do not hold the GIL while fitting
+        for fitter in (
+            ROOT.HDTV.Fit.TheuerkaufFitter,
+            ROOT.HDTV.Fit.EEFitter,
+            ROOT.HDTV.Fit.PolyBg,
+            ROOT.HDTV.Fit.ExpBg,
+            ROOT.HDTV.Fit.InterpolationBg,
+        ):
+            fitter.Fit.__release_gil__ = True
+        errors = []
+        minimizer = str(ROOT.Math.MinimizerOptions.DefaultMinimizerType())
+        try:
+            # TMinuit uses global state and must not run in several threads
+            if minimizer in ("Minuit", "TMinuit"):
+                hdtv.ui.info(
+                    "Using Minuit2 instead of TMinuit for parallel fits; "
+                    "results may differ slightly from serial fits"
+                )
+                ROOT.Math.MinimizerOptions.SetDefaultMinimizer("Minuit2")
+            with ThreadPoolExecutor(max_workers=nworkers) as pool:
+                futures = []
+                for fit in fits:
+                    fit.PrepareFit(spec)
+                    hist = spec.hist.hist
+                    if fit.extent is not None:
+                        hist = CloneRegion(hist, *fit.extent)
+                    futures.append(pool.submit(fit.RunFitter, hist))
+                for fit, future in zip(fits, futures):
+                    try:
+                        future.result()
+                        fit.ExtractPeakFunc()
+                    except Exception as err:
+                        errors.append(err)
+                    else:
+                        errors.append(None)
+        finally:
+            ROOT.Math.MinimizerOptions.SetDefaultMinimizer(minimizer)
+        return errors
+
     def SetPeakModel(self, model):
         """
         Sets the peak model to be used for fitting.
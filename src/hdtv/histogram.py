@@ -18,6 +18,8 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
 import copy
+import hashlib
+import json
 import os
 
 import numpy as np
@@ -26,12 +28,20 @@ from scipy.interpolate import InterpolatedUnivariateSpline
 
 import hdtv.cal
 import hdtv.color
+import hdtv.options
 import hdtv.rootext.calibration
 import hdtv.rootext.display
+import hdtv.rootext.dlmgr
 import hdtv.rootext.fit
 import hdtv.rootext.mfile
 from hdtv.drawable import Drawable
-from hdtv.specreader import SpecReader, SpecReaderError
+from hdtv.specreader import (
+    CutMany,
+    MappedTriangle,
+    MergeRegions,
+    SpecReader,
+    SpecReaderError,
+)
 from hdtv.util import LockViewport
 
 # Don't add created spectra to the ROOT directory
@@ -39,12 +49,172 @@ ROOT.TH1.AddDirectory(ROOT.kFALSE)
 
 
 def HasPrimitiveBinning(hist):
-    if hist.GetNbinsX() != (hist.GetXaxis().GetXmax() - hist.GetXaxis().GetXmin()):
+    axis = hist.GetXaxis()
+    if hist.GetNbinsX() != (axis.GetXmax() - axis.GetXmin()):
         return False
-    for bin in range(hist.GetNbinsX()):
-        if hist.GetBinWidth(bin) != 1.0:
-            return False
-    return True
+    # Fixed bin width is (xmax - xmin) / nbins, so only variable bins can differ
+    if not axis.IsVariableBinSize():
+        return True
+    return bool(np.all(np.diff(BinEdges(hist)) == 1.0))
+
+
+# numpy types of the bin content arrays of the different TH1 flavours, most
+# common first (TArrayL64 only exists in recent ROOT versions)
+_ARRAY_DTYPES = (
+    ("TArrayD", np.float64),
+    ("TArrayF", np.float32),
+    ("TArrayI", np.int32),
+    ("TArrayS", np.int16),
+    ("TArrayC", np.int8),
+    ("TArrayL64", np.int64),
+)
+# numpy types found for histogram classes, see ContentsView()
+_class_dtypes = {}
+
+
+def _ArrayView(buf, size, dtype):
+    """
+    Wrap a C array of given size into a numpy array, without copying
+    """
+    buf.reshape((size,))
+    return np.frombuffer(buf, dtype=dtype, count=size)
+
+
+def ContentsView(hist):
+    """
+    Return the bin contents of a ROOT histogram as numpy array, including
+    the underflow (index 0) and overflow (index -1) bins. The array is a view
+    of the internal buffer of the histogram, so that modifications apply to
+    the histogram directly. For 2D histograms, the array is flat, with the
+    bins of the x axis running fastest.
+    """
+    classname = hist.ClassName()
+    dtype = _class_dtypes.get(classname)
+    if dtype is None:
+        # Ask ROOT by name, which also works for array types it does not know
+        dtype = next(
+            (dt for arraytype, dt in _ARRAY_DTYPES if hist.InheritsFrom(arraytype)),
+            None,
+        )
+        if dtype is None:
+            raise TypeError(f"Unsupported histogram type {classname}")
+        _class_dtypes[classname] = dtype
+    return _ArrayView(hist.GetArray(), hist.GetNcells(), dtype)
+
+
+def _Sumw2View(hist):
+    """
+    Return the sum of squares of weights of a 1D ROOT histogram as numpy array
+    view, creating the structure if necessary
+    """
+    if hist.GetSumw2N() == 0:
+        hist.Sumw2()
+    return _ArrayView(hist.GetSumw2().GetArray(), hist.GetSumw2N(), np.float64)
+
+
+def ErrorsArray(hist):
+    """
+    Return the bin errors of a 1D ROOT histogram as numpy array, including
+    the underflow and overflow bins.
+    """
+    if hist.GetSumw2N() == 0:
+        return np.sqrt(np.abs(ContentsView(hist), dtype=np.float64))
+    return np.sqrt(_ArrayView(hist.GetSumw2().GetArray(), hist.GetSumw2N(), np.float64))
+
+
+def BinEdges(hist):
+    """
+    Return the lower edges of all bins of a 1D ROOT histogram plus the upper
+    edge of the last bin as numpy array
+    """
+    axis = hist.GetXaxis()
+    nbins = axis.GetNbins()
+    if axis.IsVariableBinSize():
+        return np.array(_ArrayView(axis.GetXbins().GetArray(), nbins + 1, np.float64))
+    return np.linspace(axis.GetXmin(), axis.GetXmax(), nbins + 1)
+
+
+def FillHist(hist, counts, errors=None):
+    """
+    Set the contents (and optionally the errors) of all regular bins of a 1D
+    ROOT histogram from numpy arrays in one go
+    """
+    ContentsView(hist)[1:-1] = counts
+    if errors is not None:
+        _Sumw2View(hist)[1:-1] = np.square(errors)
+    # Recompute the statistics (integral, mean, ...) from the new contents
+    hist.ResetStats()
+    # SetBinContent() counts one entry per call
+    hist.SetEntries(hist.GetNbinsX())
+
+
+def CloneRegion(hist, x1, x2):
+    """
+    Copy the bins of a 1D ROOT histogram between x1 and x2 into a new
+    histogram with the same bin edges, e.g. for fitting this region
+    independently of the original histogram
+    """
+    nbins = hist.GetNbinsX()
+    axis = hist.GetXaxis()
+    b1 = min(max(axis.FindFixBin(min(x1, x2)), 1), nbins)
+    b2 = max(min(axis.FindFixBin(max(x1, x2)), nbins), b1)
+    edges = BinEdges(hist)[b1 - 1 : b2 + 1]
+    clone = ROOT.TH1D(hist.GetName(), hist.GetTitle(), b2 - b1 + 1, edges)
+    errors = ErrorsArray(hist)[b1 : b2 + 1] if hist.GetSumw2N() else None
+    FillHist(clone, ContentsView(hist)[b1 : b2 + 1], errors)
+    return clone
+
+
+def CutWeights(nbins, regions, bgregions):
+    """
+    Weights of the bins of the cut axis (nbins, including under- and
+    overflow) for a cut: 1 for each region containing the bin, minus the
+    ratio of the number of region and background bins for each background
+    region containing it
+    """
+    weights = np.zeros(nbins)
+    for b1, b2 in regions:
+        weights[b1 : b2 + 1] += 1.0
+    numFgBins = sum(b2 - b1 + 1 for b1, b2 in regions)
+    numBgBins = sum(b2 - b1 + 1 for b1, b2 in bgregions)
+    for b1, b2 in bgregions:
+        weights[b1 : b2 + 1] -= numFgBins / numBgBins
+    return weights
+
+
+def CutTH2(hist, weights, axis):
+    """
+    Execute cuts on a TH2 in a single pass over the used part of its bin
+    array: Each row of weights (see CutWeights()) holds the weights of the bins
+    of the cut axis ("x" or "y") for one cut.
+
+    Returns:
+        Contents and sums of squares of weights (one row per cut) of the
+        projections on the other axis, including under- and overflow bins
+    """
+    shape = (hist.GetNbinsY() + 2, hist.GetNbinsX() + 2)
+    contents = ContentsView(hist).reshape(shape)
+    if hist.GetSumw2N():
+        sumw2 = _Sumw2View(hist).reshape(shape)
+    else:
+        sumw2 = None
+    if axis == "x":
+        contents, sumw2 = contents.T, None if sumw2 is None else sumw2.T
+
+    # Only the lines with non-zero weight are read
+    used = np.flatnonzero(np.any(weights, axis=0))
+    if len(used) == 0:
+        zeros = np.zeros((len(weights), contents.shape[1]))
+        return zeros, zeros.copy()
+    lines = slice(used[0], used[-1] + 1)
+    weights = weights[:, lines]
+    block = contents[lines]
+    if sumw2 is None:
+        # Poisson errors, like TH1::GetBinError()
+        sumw2 = np.abs(block, dtype=np.float64)
+    else:
+        sumw2 = sumw2[lines]
+    return weights @ block, np.square(weights) @ sumw2
 
 
 class Histogram(Drawable):
@@ -110,6 +280,81 @@ class Histogram(Drawable):
 
     norm = property(_get_norm, _set_norm)
 
+    def Refresh(self, force=False):
+        """
+        Refresh the histogram data
+
+        Returns:
+            List of (x1, x2) ranges (uncalibrated) of bins with changed
+            contents, or None if unknown
+        """
+        return None
+
+    @classmethod
+    def FromArrays(
+        cls,
+        counts,
+        errors=None,
+        edges=None,
+        name="",
+        title="",
+        color=hdtv.color.default,
+        cal=None,
+    ):
+        """
+        Create a histogram from an array of bin contents and, optionally,
+        an array of bin errors and an array of the (nbins + 1) bin edges
+        (in uncalibrated units). Without edges, the center of the first bin
+        is placed at 0.0, like for spectra read from text files.
+        """
+        counts = np.asarray(counts, dtype=np.float64)
+        nbins = len(counts)
+        if edges is None:
+            hist = ROOT.TH1D(name, title or name, nbins, -0.5, nbins - 0.5)
+        else:
+            edges = np.ascontiguousarray(edges, dtype=np.float64)
+            if len(edges) != nbins + 1:
+                raise ValueError("Number of bin edges must be number of bins + 1")
+            hist = ROOT.TH1D(name, title or name, nbins, edges)
+        FillHist(hist, counts, errors)
+        return cls(hist, color=color, cal=cal)
+
+    # counts property
+    def _get_counts(self):
+        return ContentsView(self._hist)[1:-1]
+
+    def _set_counts(self, counts):
+        FillHist(self._hist, counts)
+        if self.displayObj:
+            self.displayObj.SetHist(self._hist)
+
+    counts = property(
+        _get_counts,
+        _set_counts,
+        doc="Bin contents (without under- and overflow) as numpy array view",
+    )
+
+    # errors property
+    def _get_errors(self):
+        return ErrorsArray(self._hist)[1:-1]
+
+    def _set_errors(self, errors):
+        _Sumw2View(self._hist)[1:-1] = np.square(errors)
+
+    errors = property(
+        _get_errors,
+        _set_errors,
+        doc="Bin errors (without under- and overflow) as numpy array",
+    )
+
+    @property
+    def edges(self):
+        """
+        Lower edges of all bins plus the upper edge of the last bin
+        (uncalibrated)
+        """
+        return BinEdges(self._hist)
+
     @property
     def info(self):
         """
@@ -156,17 +401,7 @@ class Histogram(Drawable):
         # by integrating the other spectrum
         else:
             hdtv.ui.info("Adding calibrated")
-            nbins = self._hist.GetNbinsX()
-            for n in range(nbins):
-                integral = ROOT.HDTV.TH1IntegrateWithPartialBins(
-                    spec._hist,
-                    spec.cal.E2Ch(self.cal.Ch2E(n - 0.5)),
-                    spec.cal.E2Ch(self.cal.Ch2E(n + 0.5)),
-                )
-                # Note: Can't use Fill due to bin errors?
-                self._hist.SetBinContent(
-                    n + 1, self._hist.GetBinContent(n + 1) + integral
-                )
+            self.AddCalibrated(spec, 1.0)
 
         # update display
         if self.displayObj:
@@ -189,23 +424,68 @@ class Histogram(Drawable):
         # by integrating the other spectrum
         else:
             hdtv.ui.info("Subtracting calibrated")
-            nbins = self._hist.GetNbinsX()
-            for n in range(nbins):
-                integral = ROOT.HDTV.TH1IntegrateWithPartialBins(
-                    spec._hist,
-                    spec.cal.E2Ch(self.cal.Ch2E(n - 0.5)),
-                    spec.cal.E2Ch(self.cal.Ch2E(n + 0.5)),
-                )
-                # Note: Can't use Fill due to bin errors?
-                self._hist.SetBinContent(
-                    n + 1, self._hist.GetBinContent(n + 1) - integral
-                )
+            self.AddCalibrated(spec, -1.0)
 
         # update display
         if self.displayObj:
             self.displayObj.SetHist(self._hist)
         self.typeStr = "spectrum, modified (difference)"
 
+    def AddCalibrated(self, spec, factor=1.0):
+        """
+        Add factor times other spectrum to this one, taking into account the
+        calibrations of both spectra. The amount added to each bin is the
+        integral of the other spectrum over the energy range of the bin,
+        assuming a constant density within each bin of the other spectrum.
+        The bin errors are propagated accordingly.
+        """
+        nbins = self._hist.GetNbinsX()
+        # Bin boundaries of this spectrum in channels of the other spectrum
+        bounds = hdtv.cal.E2Ch(
+            spec.cal, hdtv.cal.Ch2E(self.cal, np.arange(nbins + 1) - 0.5)
+        )
+        lower = np.minimum(bounds[:-1], bounds[1:])
+        upper = np.maximum(bounds[:-1], bounds[1:])
+
+        edges = spec.edges
+        contents = np.asarray(spec.counts, dtype=np.float64)
+        variances = np.square(spec.errors)
+        cumcontents = np.concatenate(([0.0], np.cumsum(contents)))
+        cumvariances = np.concatenate(([0.0], np.cumsum(variances)))
+
+        def Locate(x):
+            # Bin of the other spectrum and fraction of that bin below x
+            x = np.clip(x, edges[0], edges[-1])
+            idx = np.clip(
+                np.searchsorted(edges, x, side="right") - 1, 0, len(contents) - 1
+            )
+            return idx, (x - edges[idx]) / (edges[idx + 1] - edges[idx])
+
+        ilo, flo = Locate(lower)
+        ihi, fhi = Locate(upper)
+        integral = (
+            cumcontents[ihi]
+            + fhi * contents[ihi]
+            - cumcontents[ilo]
+            - flo * contents[ilo]
+        )
+        # Partially covered bins enter the variance with their squared fraction
+        variance = np.where(
+            ilo == ihi,
+            np.square(fhi - flo) * variances[ilo],
+            np.square(1.0 - flo) * variances[ilo]
+            + cumvariances[ihi]
+            - cumvariances[np.minimum(ilo + 1, ihi)]
+            + np.square(fhi) * variances[ihi],
+        )
+
+        errors = np.sqrt(np.square(self.errors) + factor**2 * variance)
+        # Update the bins in place (the counts setter would copy them again)
+        ContentsView(self._hist)[1:-1] += factor * integral
+        _Sumw2View(self._hist)[1:-1] = np.square(errors)
+        self._hist.ResetStats()
+        self._hist.SetEntries(nbins)
+
     def Multiply(self, factor):
         """
         Multiply spectrum with factor
@@ -270,28 +550,23 @@ class Histogram(Drawable):
             self._hist.GetName(), self._hist.GetTitle(), nbins, -0.5, nbins - 0.5
         )
 
-        input_bins_center, input_hist = np.transpose(
-            [
-                [
-                    self.cal.Ch2E(n - 1),
-                    self._hist.GetBinContent(n)
-                    / (self.cal.Ch2E(n) - self.cal.Ch2E(n - 1)),
-                ]
-                for n in range(1, self._hist.GetNbinsX() + 1)
-            ]
-        )
+        input_bins_energy = hdtv.cal.Ch2E(self.cal, np.arange(nbins_old + 1))
+        input_bins_center = input_bins_energy[:-1]
+        input_hist = self.counts / np.diff(input_bins_energy)
 
-        output_bins_low = np.arange(nbins) * binsize + lower
-        output_bins_high = output_bins_low + binsize
+        output_bins_edges = np.arange(nbins + 1) * binsize + lower
 
         inter = InterpolatedUnivariateSpline(
             input_bins_center, input_hist, k=spline_order
         )
 
-        inter_integral_v = np.vectorize(inter.integral)
-        output_hist = np.maximum(
-            inter_integral_v(output_bins_low, output_bins_high), 0.0
+        # Integrate the spline over all output bins at once, using its
+        # antiderivative. Like inter.integral(), treat the spline as zero
+        # outside of the range of the input data.
+        antiderivative = inter.antiderivative()(
+            np.clip(output_bins_edges, input_bins_center[0], input_bins_center[-1])
         )
+        output_hist = np.maximum(np.diff(antiderivative), 0.0)
 
         # Suppress bins outside of original histogram range
         min_bin = int((lower_old - lower) / binsize)
@@ -305,8 +580,7 @@ class Histogram(Drawable):
                 "Bins with negative energies in original spectrum were discarded."
             )
 
-        for i in range(nbins):
-            newhist.SetBinContent(i + 1, output_hist[i])
+        FillHist(newhist, output_hist)
 
         self._hist = newhist
         if use_tv_binning:
@@ -327,14 +601,24 @@ class Histogram(Drawable):
         """
         Randomize each bin content assuming a Poissonian distribution.
         """
-        for i in range(self._hist.GetNbinsX() + 1):
-            counts = self._hist.GetBinContent(i)
-            # error = self._hist.GetBinError(i)
-            varied = np.random.poisson(counts)
-            self._hist.SetBinContent(i, varied)
+        nbins = self._hist.GetNbinsX()
+        contents = ContentsView(self._hist)
+        contents[: nbins + 1] = np.random.poisson(contents[: nbins + 1])
         if self.displayObj:
             self.displayObj.SetHist(self._hist)
 
+    def PoissonReplicas(self, nreplicas):
+        """
+        Draw nreplicas random samples of the spectrum, assuming a Poissonian
+        distribution of each bin content. All samples are drawn from the
+        same random number stream.
+
+        Returns:
+            Array of shape (nreplicas, nbins)
+        """
+        counts = self.counts
+        return np.random.poisson(counts, size=(nreplicas, len(counts)))
+
     def Draw(self, viewport):
         """
         Draw this spectrum to the viewport
@@ -390,33 +674,32 @@ class Histogram(Drawable):
             self._hist = ROOT.TH1D(
                 hist.GetName(), hist.GetTitle(), hist.GetNbinsX(), 0, hist.GetNbinsX()
             )
+            nbins = hist.GetNbinsX()
+            ContentsView(self._hist)[:nbins] = ContentsView(hist)[:nbins]
+            # Original comment by JM in commit #dd438b7c44265072bf8b0528170cecc95780e38c:
+            # "TODO: Copy Errors?"
+            #
+            # Edit by UG: It makes sense to simply copy the uncertainties. There are two
+            # possible cases:
+            # 1. The ROOT histogram contains user-defined uncertainties per bin that can
+            #    be retrieved by calling hist.GetBinError(). In this case, it can be
+            #    assumed that the user knew what he was doing when the uncertainties
+            #    were assigned.
+            # 2. The ROOT histogram contains no user-defined uncertainties. In this case,
+            #    a call of hist.GetBinError() will return the square root of the bin
+            #    content, which is a sensible assumption.
+            #
+            # Since text spectra are loaded in a completely analogous way, implicitly
+            # assuming that the uncertainties are Poissonian, there is no need to issue
+            # an additional warning.
+            _Sumw2View(self._hist)[:nbins] = np.square(ErrorsArray(hist)[:nbins])
+            self._hist.SetEntries(nbins)
             if caldegree:
-                cf = hdtv.cal.CalibrationFitter()
-            # TODO: Slow
-            for bin in range(hist.GetNbinsX()):
-                if caldegree:
-                    cf.AddPair(bin, hist.GetXaxis().GetBinUpEdge(bin))
-                self._hist.SetBinContent(bin, hist.GetBinContent(bin))
-                # Original comment by JM in commit #dd438b7c44265072bf8b0528170cecc95780e38c:
-                # "TODO: Copy Errors?"
-                #
-                # Edit by UG: It makes sense to simply copy the uncertainties. There are two
-                # possible cases:
-                # 1. The ROOT histogram contains user-defined uncertainties per bin that can
-                #    be retrieved by calling hist.GetBinError(). In this case, it can be
-                #    assumed that the user knew what he was doing when the uncertainties
-                #    were assigned.
-                # 2. The ROOT histogram contains no user-defined uncertainties. In this case,
-                #    a call of hist.GetBinError() will return the square root of the bin
-                #    content, which is a sensible assumption.
-                #
-                # Since text spectra are loaded in a completely analogous way, implicitly
-                # assuming that the uncertainties are Poissonian, there is no need to issue
-                # an additional warning.
-                self._hist.SetBinError(bin, hist.GetBinError(bin))
-            if caldegree:
-                cf.FitCal(caldegree)
-                self.cal = cf.calib
+                # Channel bin is mapped to the upper edge of bin
+                # (bins 0, ..., nbins - 1)
+                self.cal = hdtv.cal.PolyFitCalibration(
+                    np.arange(nbins), BinEdges(hist)[:-1], min(caldegree, nbins - 1)
+                )
 
 
 class FileHistogram(Histogram):
@@ -426,9 +709,10 @@ class FileHistogram(Histogram):
     A spectrum that comes from a file in any of the formats supported by hdtv.
     """
 
-    def __init__(self, fname, fmt=None, color=hdtv.color.default, cal=None):
+    def __init__(self, fname, fmt=None, color=hdtv.color.default, cal=None, hist=None):
         """
-        Read a spectrum from file
+        Read a spectrum from file, unless the ROOT histogram was already read
+        from it (e.g. by SpecReader.ReadSpectra())
         """
         # check if file exists
         try:
@@ -437,13 +721,15 @@ class FileHistogram(Histogram):
             hdtv.ui.error("File %s not found" % fname)
             raise
         # call to SpecReader to get the hist
-        try:
-            hist = SpecReader.GetSpectrum(fname, fmt)
-        except SpecReaderError as msg:
-            hdtv.ui.error(str(msg))
-            raise
+        if hist is None:
+            try:
+                hist = SpecReader.GetSpectrum(fname, fmt)
+            except SpecReaderError as msg:
+                hdtv.ui.error(str(msg))
+                raise
         self.fmt = fmt
         self.filename = fname
+        self._fileState = self.GetFileState()
         Histogram.__init__(self, hist, color, cal)
         self.typeStr = "spectrum, read from file"
 
@@ -458,24 +744,98 @@ class FileHistogram(Histogram):
             s += "File format: autodetected\n"
         return s
 
-    def Refresh(self):
+    def GetFileState(self, digest=True):
         """
-        Reload the spectrum from disk
+        Modification time, size and (optionally) blake2b hash of the file, or
+        None if it cannot be accessed
         """
         try:
-            os.path.exists(self.filename)
+            stat = os.stat(self.filename)
+            if not digest:
+                return (stat.st_mtime_ns, stat.st_size, None)
+            h = hashlib.blake2b()
+            with open(self.filename, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 24), b""):
+                    h.update(chunk)
+            return (stat.st_mtime_ns, stat.st_size, h.hexdigest())
         except OSError:
+            return None
+
+    def FileChanged(self):
+        """
+        Check if the file changed since it was read. The contents are hashed
+        only if modification time or size changed, so that rewriting a file
+        with identical contents does not count as change.
+        """
+        state = self.GetFileState(digest=False)
+        if state is None or self._fileState is None:
+            return state is not self._fileState
+        if state[:2] == self._fileState[:2]:
+            return False
+        state = self.GetFileState()
+        if state is not None and state[2] == self._fileState[2]:
+            self._fileState = state
+            return False
+        return True
+
+    def Refresh(self, force=False):
+        """
+        Reload the spectrum from disk, if the file changed (or if force is
+        True). As long as the binning stays the same, the contents of the
+        existing ROOT histogram are updated in place.
+
+        Returns:
+            List of (x1, x2) ranges (uncalibrated) of bins with changed
+            contents, merged where adjacent; the full range if force is True
+        """
+        if not force and not self.FileChanged():
+            return []
+        # Remember the state also if reading fails, so that it is reported
+        # only once until the file changes again
+        state = self.GetFileState()
+        self._fileState = state
+        if state is None:
             hdtv.ui.warning("File %s not found, keeping previous data" % self.filename)
-            return
+            return []
         # call to SpecReader to get the hist
         try:
             hist = SpecReader.GetSpectrum(self.filename, self.fmt)
-        except SpecReaderError as msg:
+        except (SpecReaderError, OSError) as msg:
             hdtv.ui.warning(
                 f"Failed to load spectrum: {msg} (file: {self.filename}), keeping previous data"
             )
-            return
-        self.hist = hist
+            return []
+
+        edges = BinEdges(hist)
+        old = self._hist
+        if (
+            force
+            or old is None
+            or old.__class__ is not hist.__class__
+            or old.GetSumw2N() != hist.GetSumw2N()
+            or not np.array_equal(BinEdges(old), edges)
+        ):
+            self.hist = hist
+            return [(edges[0], edges[-1])]
+
+        # Compare and copy all bins, including under- and overflow
+        contents = ContentsView(hist)
+        changed = ContentsView(old) != contents
+        ContentsView(old)[:] = contents
+        if hist.GetSumw2N():
+            sumw2 = _Sumw2View(hist)
+            changed |= _Sumw2View(old) != sumw2
+            _Sumw2View(old)[:] = sumw2
+        old.ResetStats()
+        old.SetEntries(hist.GetEntries())
+
+        # Runs of changed regular bins
+        changed = np.diff(changed[1:-1].astype(np.int8), prepend=0, append=0)
+        (starts,) = np.nonzero(changed == 1)
+        (stops,) = np.nonzero(changed == -1)
+        if len(starts) and self.displayObj:
+            self.displayObj.SetHist(old)
+        return [(edges[b1], edges[b2]) for b1, b2 in zip(starts, stops)]
 
 
 class CutHistogram(Histogram):
@@ -497,16 +857,125 @@ class CutHistogram(Histogram):
         return s
 
 
+class CompressedMatrix:
+    """
+    Filled bins of a 2D histogram in compressed sparse row and column order:
+    For either axis, the entries are sorted by their bin on that axis, so that
+    the entries of a range of bins (lines) form a contiguous slice, located via
+    an index pointer array. The memory used is proportional to the number of
+    filled bins.
+    """
+
+    def __init__(self, nbins, lines=None):
+        # Number of bins of the x and y axes, including under- and overflow
+        self.nbins = tuple(nbins)
+        # For each axis: index pointers, bins on the other axis, contents and
+        # sums of squares of weights (or None) of the entries
+        self.lines = lines or {}
+
+    @classmethod
+    def FromBins(cls, nbins, x, y, contents, sumw2=None):
+        """
+        Create from the bin numbers on both axes, contents and (optionally)
+        sums of squares of weights of the filled bins
+        """
+        matrix = cls(nbins)
+        for axis, lines, bins, nlines in (
+            ("x", x, y, nbins[0]),
+            ("y", y, x, nbins[1]),
+        ):
+            order = np.argsort(lines, kind="stable")
+            indptr = np.zeros(nlines + 1, dtype=np.int64)
+            np.cumsum(np.bincount(lines, minlength=nlines), out=indptr[1:])
+            matrix.lines[axis] = (
+                indptr,
+                bins[order],
+                contents[order],
+                None if sumw2 is None else sumw2[order],
+            )
+        return matrix
+
+    @classmethod
+    def Load(cls, fname):
+        with np.load(fname) as f:
+            lines = {}
+            for axis in ("x", "y"):
+                sumw2 = f[f"{axis}_sumw2"] if f"{axis}_sumw2" in f else None
+                lines[axis] = tuple(
+                    f[f"{axis}_{field}"] for field in ("indptr", "bins", "contents")
+                ) + (sumw2,)
+            return cls(f["nbins"], lines)
+
+    def Save(self, fname):
+        arrays = {"nbins": np.array(self.nbins)}
+        for axis, (indptr, bins, contents, sumw2) in self.lines.items():
+            arrays[f"{axis}_indptr"] = indptr
+            arrays[f"{axis}_bins"] = bins
+            arrays[f"{axis}_contents"] = contents
+            if sumw2 is not None:
+                arrays[f"{axis}_sumw2"] = sumw2
+        with open(fname, "wb") as f:
+            np.savez(f, **arrays)
+
+    def Cut(self, weights, axis):
+        """
+        Execute cuts on the lines of axis ("x" or "y"), like CutTH2(), using
+        only the slice of entries between the first and last used line
+        """
+        indptr, bins, contents, sumw2 = self.lines[axis]
+        nbins = self.nbins[1] if axis == "x" else self.nbins[0]
+        cuts = np.zeros((len(weights), nbins))
+        errors = np.zeros((len(weights), nbins))
+        used = np.flatnonzero(np.any(weights, axis=0))
+        if len(used) == 0:
+            return cuts, errors
+
+        l1, l2 = used[0], used[-1] + 1
+        entries = slice(indptr[l1], indptr[l2])
+        counts = np.diff(indptr[l1 : l2 + 1])
+        bins, contents = bins[entries], contents[entries]
+        if sumw2 is None:
+            # Poisson errors, like TH1::GetBinError()
+            sumw2 = np.abs(contents)
+        else:
+            sumw2 = sumw2[entries]
+        for i, w in enumerate(weights):
+            w = np.repeat(w[l1:l2], counts)
+            cuts[i] = np.bincount(bins, contents * w, minlength=nbins)
+            errors[i] = np.bincount(bins, sumw2 * np.square(w), minlength=nbins)
+        return cuts, errors
+
+
+def _AxisHist(name, axis, contents, sumw2):
+    """
+    Create TH1D with the binning of axis from contents and sums of squares of
+    weights (including under- and overflow bins)
+    """
+    if axis.IsVariableBinSize():
+        rhist = ROOT.TH1D(name, name, axis.GetNbins(), axis.GetXbins().GetArray())
+    else:
+        rhist = ROOT.TH1D(name, name, axis.GetNbins(), axis.GetXmin(), axis.GetXmax())
+    ContentsView(rhist)[:] = contents
+    _Sumw2View(rhist)[:] = sumw2
+    rhist.SetEntries(rhist.GetNbinsX())
+    return rhist
+
+
 class THnSparseWrapper:
     """
     Wrapper around a 2d THnSparse object, providing ProjectionX and
-    ProjectionY.
+    ProjectionY. The filled bins are converted once into a CompressedMatrix,
+    on which projections and cuts only use the entries of the lines involved.
     """
 
+    sparseCache = hdtv.options.Option(default=False, parse=hdtv.options.parse_bool)
+    hdtv.options.RegisterOption("matrix.sparse.cache", sparseCache)
+
     def __init__(self, hist):
         if not (isinstance(hist, ROOT.THnSparse) and hist.GetNdimensions() == 2):
             raise RuntimeError("Class needs a THnSparse histogram of dimension 2")
         self.__dict__["_hist"] = hist
+        self.__dict__["_matrix"] = None
 
     def __setattr__(self, name, value):
         self.__dict__["_hist"].__setattr__(name, value)
@@ -521,30 +990,87 @@ class THnSparseWrapper:
         return self._hist.GetAxis(1)
 
     def ProjectionX(self, name, b1, b2, opt):
-        a = self._hist.GetAxis(1)
-        if b1 > b2:
-            a.SetRange(0, a.GetNbins())
-        else:
-            a.SetRange(b1, b2)
-
-        proj = self._hist.Projection(0, opt)
-        a.SetRange(0, a.GetNbins())
-
-        proj.SetName(name)
-        return proj
+        return self.Projection(name, "y", b1, b2)
 
     def ProjectionY(self, name, b1, b2, opt):
-        a = self._hist.GetAxis(0)
+        return self.Projection(name, "x", b1, b2)
+
+    def Projection(self, name, axis, b1, b2):
+        """
+        Project bins b1 to b2 of axis (all, if b1 > b2) on the other axis,
+        always with errors
+        """
+        nlines = self.GetMatrix().nbins[0 if axis == "x" else 1]
+        weights = np.zeros((1, nlines))
         if b1 > b2:
-            a.SetRange(0, a.GetNbins())
+            weights[0] = 1.0
         else:
-            a.SetRange(b1, b2)
+            weights[0, b1 : b2 + 1] = 1.0
+        contents, sumw2 = self.Cut(weights, axis)
+        projAxis = self.GetYaxis() if axis == "x" else self.GetXaxis()
+        return _AxisHist(name, projAxis, contents[0], sumw2[0])
+
+    def GetMatrix(self):
+        """
+        Return the filled bins as CompressedMatrix, which is created on first
+        use (or loaded from the on-disk cache, see matrix.sparse.cache)
+        """
+        if self._matrix is not None:
+            return self._matrix
+
+        cachefile = None
+        if self.sparseCache.Get():
+            cachefile = self.GetCacheFile()
+            try:
+                self.__dict__["_matrix"] = CompressedMatrix.Load(cachefile)
+                hdtv.ui.debug(f"Loaded sparse matrix from {cachefile}")
+                return self._matrix
+            except (OSError, ValueError, KeyError):
+                pass
+
+        hist = self._hist
+        n = ROOT.SparseBins.GetN(hist)
+        x = np.empty(n, dtype=np.int32)
+        y = np.empty(n, dtype=np.int32)
+        contents = np.empty(n)
+        sumw2 = np.empty(n) if hist.GetCalculateErrors() else None
+        if not ROOT.SparseBins.Read(
+            hist, x, y, contents, ROOT.nullptr if sumw2 is None else sumw2
+        ):
+            raise RuntimeError("Failed to read bins of sparse histogram")
+        nbins = (hist.GetAxis(0).GetNbins() + 2, hist.GetAxis(1).GetNbins() + 2)
+        self.__dict__["_matrix"] = CompressedMatrix.FromBins(
+            nbins, x, y, contents, sumw2
+        )
 
-        proj = self._hist.Projection(1, opt)
-        a.SetRange(0, a.GetNbins())
+        if cachefile is not None:
+            try:
+                os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+                self._matrix.Save(cachefile)
+            except OSError as error:
+                hdtv.ui.warning(f"Could not cache sparse matrix: {error}")
+        return self._matrix
 
-        proj.SetName(name)
-        return proj
+    def GetCacheFile(self):
+        """
+        Name of the cache file, derived from the name, binning and statistics
+        of the histogram
+        """
+        hist = self._hist
+        key = [hist.GetName(), hist.GetTitle(), hist.GetNbins(), hist.GetEntries()]
+        key += [hist.GetSumw(), hist.GetSumw2()]
+        for dim in range(2):
+            axis = hist.GetAxis(dim)
+            key += [axis.GetNbins(), axis.GetXmin(), axis.GetXmax()]
+            key += [hist.GetSumwx(dim), hist.GetSumwx2(dim)]
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+        return os.path.join(hdtv.rootext.dlmgr.cachedir, "sparse", digest + ".npz")
+
+    def Cut(self, weights, axis):
+        """
+        Execute cuts on the compressed matrix, like CutTH2()
+        """
+        return self.GetMatrix().Cut(weights, axis)
 
 
 class Histo2D:
@@ -563,9 +1089,42 @@ class Histo2D:
     def yproj(self):
         return None
 
+    @property
+    def state(self):
+        """
+        State of the underlying data; cached cuts become invalid on change
+        """
+        return None
+
+    def CutBins(self, regionMarkers, bgMarkers, axis):
+        """
+        Cut axis and binned cut and background regions, which identify the
+        result of a cut; None if not supported
+        """
+        return None
+
+    def ClearCache(self):
+        pass
+
+    def CutCal(self, axis):
+        """
+        Current calibration of cut spectra for cuts on axis
+        """
+        return None
+
     def ExecuteCut(self, regionMarkers, bgMarkers, axis):
         return None
 
+    def ExecuteCuts(self, gates, axis):
+        """
+        Execute several cuts on the same axis, given as list of pairs of region
+        and background markers. Returns a list of cut histograms.
+        """
+        return [
+            self.ExecuteCut(regionMarkers, bgMarkers, axis)
+            for regionMarkers, bgMarkers in gates
+        ]
+
 
 class RHisto2D(Histo2D):
     """
@@ -605,7 +1164,7 @@ class RHisto2D(Histo2D):
             pry.typeStr = "y projection"
         return pry
 
-    def ExecuteCut(self, regionMarkers, bgMarkers, axis):
+    def CutBins(self, regionMarkers, bgMarkers, axis):
         # _axis_ is the axis the markers refer to, so we project on the *other*
         # axis. We call _axis_ the cut axis and the other axis the projection
         # axis. If the matrix is symmetric, this does not matter, so _axis_ is
@@ -622,48 +1181,58 @@ class RHisto2D(Histo2D):
 
         if axis == "x":
             cutAxis = self.rhist.GetXaxis()
-            projector = self.rhist.ProjectionY
         else:
             cutAxis = self.rhist.GetYaxis()
-            projector = self.rhist.ProjectionX
 
-        b1 = cutAxis.FindBin(regionMarkers[0].p1.pos_uncal)
-        b2 = cutAxis.FindBin(regionMarkers[0].p2.pos_uncal)
+        def FindBins(markers):
+            bins = []
+            for m in markers:
+                b1 = cutAxis.FindBin(m.p1.pos_uncal)
+                b2 = cutAxis.FindBin(m.p2.pos_uncal)
+                bins.append((min(b1, b2), max(b1, b2)))
+            return tuple(sorted(bins))
 
-        name = self.rhist.GetName() + "_cut"
-        rhist = projector(name, min(b1, b2), max(b1, b2), "e")
-        # Ensure proper garbage collection for ROOT histogram objects
-        ROOT.SetOwnership(rhist, True)
-
-        numFgBins = abs(b2 - b1) + 1
-        for r in regionMarkers[1:]:
-            b1 = cutAxis.FindBin(r.p1.pos_uncal)
-            b2 = cutAxis.FindBin(r.p2.pos_uncal)
-            numFgBins += abs(b2 - b1) + 1
+        return axis, FindBins(regionMarkers), FindBins(bgMarkers)
 
-            tmp = projector("proj_tmp", min(b1, b2), max(b1, b2), "e")
-            ROOT.SetOwnership(tmp, True)
-            rhist.Add(tmp, 1.0)
+    def ExecuteCut(self, regionMarkers, bgMarkers, axis):
+        return self.ExecuteCuts([(regionMarkers, bgMarkers)], axis)[0]
 
-        bgBins = []
-        numBgBins = 0
-        for b in bgMarkers:
-            b1 = cutAxis.FindBin(b.p1.pos_uncal)
-            b2 = cutAxis.FindBin(b.p2.pos_uncal)
-            numBgBins += abs(b2 - b1) + 1
-            bgBins.append((min(b1, b2), max(b1, b2)))
+    def ExecuteCuts(self, gates, axis):
+        """
+        Execute several cuts on the same axis in a single pass over the bins
+        of the histogram (see CutTH2())
+        """
+        if not gates:
+            return []
+        keys = [self.CutBins(r, b, axis) for r, b in gates]
+        axis = keys[0][0]
+        if axis == "x":
+            cutAxis, projAxis = self.rhist.GetXaxis(), self.rhist.GetYaxis()
+        else:
+            cutAxis, projAxis = self.rhist.GetYaxis(), self.rhist.GetXaxis()
 
-        if numBgBins > 0:
-            bgFactor = -float(numFgBins) / float(numBgBins)
+        weights = np.array(
+            [
+                CutWeights(cutAxis.GetNbins() + 2, regions, bgregions)
+                for _, regions, bgregions in keys
+            ]
+        )
+        if isinstance(self.rhist, THnSparseWrapper):
+            cuts, sumw2 = self.rhist.Cut(weights, axis)
+        else:
+            cuts, sumw2 = CutTH2(self.rhist, weights, axis)
 
-            for b in bgBins:
-                tmp = projector("proj_tmp", b[0], b[1], "e")
-                ROOT.SetOwnership(tmp, True)
-                rhist.Add(tmp, bgFactor)
+        name = self.rhist.GetName() + "_cut"
+        hists = []
+        for (regionMarkers, _), cut, cutSumw2 in zip(gates, cuts, sumw2):
+            rhist = _AxisHist(name, projAxis, cut, cutSumw2)
+            # Ensure proper garbage collection for ROOT histogram objects
+            ROOT.SetOwnership(rhist, True)
 
-        hist = CutHistogram(rhist, axis, regionMarkers)
-        hist.typeStr = "cut"
-        return hist
+            hist = CutHistogram(rhist, axis, regionMarkers)
+            hist.typeStr = "cut"
+            hists.append(hist)
+        return hists
 
 
 class MHisto2D(Histo2D):
@@ -671,7 +1240,10 @@ class MHisto2D(Histo2D):
     MFile-backed matrix for projection
     """
 
-    def __init__(self, fname, sym):
+    matrixThreads = hdtv.options.Option(default=0, parse=int)
+    hdtv.options.RegisterOption("matrix.threads", matrixThreads)
+
+    def __init__(self, fname, sym, integral=False):
         # check if file exists
         try:
             os.stat(fname)
@@ -679,7 +1251,7 @@ class MHisto2D(Histo2D):
             hdtv.ui.error(str(error))
             raise
 
-        self.GenerateFiles(fname, sym)
+        self.GenerateFiles(fname, sym, integral)
 
         basename = self.GetBasename(fname)
 
@@ -690,12 +1262,16 @@ class MHisto2D(Histo2D):
             hdtv.ui.error(str(msg))
             raise
 
+        # Memory-mapped access for uncompressed matrices
+        self.mmatrix = self.GetMappedMatrix(fname)
+
         self._xproj = FileHistogram(basename + ".prx")
         self._xproj.typeStr = "Projection"
 
         if sym:
             self._yproj = None
             self.tvmatrix = self.vmatrix  # Fixme
+            self.tmmatrix = self.mmatrix
         else:
             self._yproj = FileHistogram(basename + ".pry")
             self._yproj.typeStr = "Projection"
@@ -705,9 +1281,46 @@ class MHisto2D(Histo2D):
             except SpecReaderError as msg:
                 hdtv.ui.error(str(msg))
                 raise
+            self.tmmatrix = self.GetMappedMatrix(basename + ".tmtx")
+
+        # Integral matrices for cuts with a fixed cost, independent of the
+        # gate width
+        self._integrals = []
+        if integral:
+            self.UseIntegral(self.vmatrix, self.mmatrix, basename + ".imtx")
+            if not sym:
+                self.UseIntegral(self.tvmatrix, self.tmmatrix, basename + ".timtx")
 
         self.filename = fname
 
+    def UseIntegral(self, vmatrix, mmatrix, fname):
+        """
+        Use integral matrix from fname for cuts on vmatrix/mmatrix
+        """
+        try:
+            if mmatrix is not None:
+                mmatrix.SetIntegral(SpecReader.GetMappedMatrix(fname))
+            else:
+                mhist = SpecReader.GetMFileHist(fname)
+                if not vmatrix.SetIntegral(mhist):
+                    raise SpecReaderError(f"{fname}: Integral does not match matrix")
+                # The MFileHist has to live as long as the matrix uses it
+                self._integrals.append(mhist)
+        except SpecReaderError as msg:
+            hdtv.ui.error(str(msg))
+            raise
+
+    @staticmethod
+    def GetMappedMatrix(fname):
+        """
+        Map matrix file into memory, if its format allows it
+        """
+        try:
+            return SpecReader.GetMappedMatrix(fname)
+        except SpecReaderError as msg:
+            hdtv.ui.debug(f"Not using memory-mapped access: {msg}")
+            return None
+
     @property
     def xproj(self):
         return self._xproj
@@ -716,7 +1329,17 @@ class MHisto2D(Histo2D):
     def yproj(self):
         return self._yproj
 
-    def ExecuteCut(self, regionMarkers, bgMarkers, axis):
+    @property
+    def state(self):
+        stat = os.stat(self.filename)
+        return stat.st_size, stat.st_mtime_ns
+
+    def ClearCache(self):
+        for mmatrix in (self.mmatrix, self.tmmatrix):
+            if mmatrix is not None:
+                mmatrix.ClearCache()
+
+    def CutBins(self, regionMarkers, bgMarkers, axis):
         # _axis_ is the axis the markers refer to, so we project on the *other*
         # axis. We call _axis_ the cut axis and the other axis the projection
         # axis. If the matrix is symmetric, this does not matter, so _axis_ is
@@ -732,33 +1355,58 @@ class MHisto2D(Histo2D):
             raise ValueError("Bad value for axis parameter")
 
         if axis == "x":
-            # FIXME: Calibrations for gated spectra asym/sym
             thiscal = self._xproj.cal
+            matrix = self.tvmatrix
+        else:
+            thiscal = self._yproj.cal
+            matrix = self.vmatrix
+
+        # FIXME: The region markers are not used correctly in many parts
+        # of the code. Workaround by explicitly using the cal here
+        def FindBins(markers):
+            bins = []
+            for m in markers:
+                b1 = matrix.FindCutBin(thiscal.E2Ch(m.p1.pos_cal))
+                b2 = matrix.FindCutBin(thiscal.E2Ch(m.p2.pos_cal))
+                bins.append((min(b1, b2), max(b1, b2)))
+            return tuple(sorted(bins))
+
+        return axis, FindBins(regionMarkers), FindBins(bgMarkers)
+
+    def CutMatrices(self, axis):
+        """
+        Calibration of the cut spectra, matrix and memory-mapped matrix (or
+        None) for cuts on axis ("x" or "y")
+        """
+        if axis == "x":
+            # FIXME: Calibrations for gated spectra asym/sym
             if self._yproj:
                 othercal = self._yproj.cal
             else:
                 othercal = self._xproj.cal
-            matrix = self.tvmatrix
+            return othercal, self.tvmatrix, self.tmmatrix
         else:
-            thiscal = self._yproj.cal
-            othercal = self._xproj.cal
-            matrix = self.vmatrix
+            return self._xproj.cal, self.vmatrix, self.mmatrix
 
-        matrix.ResetRegions()
+    def CutCal(self, axis):
+        return self.CutMatrices(axis)[0]
 
-        for r in regionMarkers:
-            # FIXME: The region markers are not used correctly in many parts
-            # of the code. Workaround by explicitly using the cal here
-            b1 = matrix.FindCutBin(thiscal.E2Ch(r.p1.pos_cal))
-            b2 = matrix.FindCutBin(thiscal.E2Ch(r.p2.pos_cal))
-            matrix.AddCutRegion(b1, b2)
+    def ExecuteCut(self, regionMarkers, bgMarkers, axis):
+        axis, regions, bgregions = self.CutBins(regionMarkers, bgMarkers, axis)
+        othercal, matrix, mmatrix = self.CutMatrices(axis)
 
-        for b in bgMarkers:
-            b1 = matrix.FindCutBin(thiscal.E2Ch(b.p1.pos_cal))
-            b2 = matrix.FindCutBin(thiscal.E2Ch(b.p2.pos_cal))
-            matrix.AddBgRegion(b1, b2)
+        if mmatrix is not None:
+            cut = mmatrix.Cut(regions, bgregions)
+            if cut is None:
+                raise RuntimeError("Cut regions are outside of the matrix")
+            return self.MakeCutHistogram(cut, axis, regionMarkers, othercal)
 
         name = self.filename + "_cut"
+        matrix.ResetRegions()
+        for b1, b2 in regions:
+            matrix.AddCutRegion(b1, b2)
+        for b1, b2 in bgregions:
+            matrix.AddBgRegion(b1, b2)
         rhist = matrix.Cut(name, name)
         # Ensure proper garbage collection for ROOT histogram objects
         ROOT.SetOwnership(rhist, True)
@@ -768,32 +1416,165 @@ class MHisto2D(Histo2D):
         hist._cal = othercal
         return hist
 
+    def ExecuteCuts(self, gates, axis):
+        """
+        Execute several cuts on the same axis in a single sweep over the
+        matrix, reading each line used by any of the gates only once (see
+        specreader.CutMany()). Gates outside of the matrix yield None.
+        """
+        if not gates:
+            return []
+        keys = [self.CutBins(r, b, axis) for r, b in gates]
+        axis = keys[0][0]
+        binned = [(regions, bgregions) for _, regions, bgregions in keys]
+        othercal, matrix, mmatrix = self.CutMatrices(axis)
+
+        if mmatrix is not None:
+            cuts = mmatrix.CutMany(binned)
+        elif matrix.HasIntegral():
+            # Each cut only reads two lines per region anyway
+            return super().ExecuteCuts(gates, axis)
+        else:
+            lines = matrix.GetCutHighBin() + 1
+            columns = matrix.GetProjXbins()
+
+            def Read(l1, l2):
+                buf = np.empty((l2 - l1) * columns)
+                if not matrix.GetLines(buf, l1, l2 - l1):
+                    raise RuntimeError("Failed to read lines from matrix")
+                return buf.reshape(l2 - l1, columns)
+
+            cuts = CutMany(
+                Read,
+                columns,
+                [
+                    (MergeRegions(regions, lines), MergeRegions(bgregions, lines))
+                    for regions, bgregions in binned
+                ],
+            )
+
+        return [
+            None
+            if cut is None
+            else self.MakeCutHistogram(cut, axis, regionMarkers, othercal)
+            for (regionMarkers, _), cut in zip(gates, cuts)
+        ]
+
+    def MakeCutHistogram(self, cut, axis, regionMarkers, cal):
+        """
+        Create cut histogram from numpy array
+        """
+        name = self.filename + "_cut"
+        rhist = ROOT.TH1D(name, name, len(cut), -0.5, len(cut) - 0.5)
+        FillHist(rhist, cut)
+        hist = CutHistogram(rhist, axis, regionMarkers)
+        hist.typeStr = "cut"
+        hist._cal = cal
+        return hist
+
     def GetBasename(self, fname):
         if fname.endswith(".mtx"):
             return fname[:-4]
         else:
             return fname
 
-    def GenerateFiles(self, fname, sym):
+    def GenerateFiles(self, fname, sym, integral=False):
         """
         Generate projection(s) and possibly transpose (for asymmetric matrices),
-        if they do not exist yet.
+        and, if requested, the integral matrices of both, if there are no valid
+        ones yet.
+
+        Uncompressed matrices are processed in a single, multithreaded pass,
+        all other formats by MatOp. The state of the matrix and the generated
+        files is recorded in <basename>.mtxinfo to detect stale files later.
         """
         basename = self.GetBasename(fname)
+        if not sym and isinstance(self.GetMappedMatrix(fname), MappedTriangle):
+            msg = f"{fname}: Matrix stores only one triangle and must be symmetric"
+            hdtv.ui.error(msg)
+            raise SpecReaderError(msg)
+        sidecars = {"x projection": basename + ".prx"}
+        if not sym:
+            sidecars["y projection"] = basename + ".pry"
+            sidecars["transpose"] = basename + ".tmtx"
+        if integral:
+            sidecars["integral"] = basename + ".imtx"
+            if not sym:
+                sidecars["transpose integral"] = basename + ".timtx"
+
+        info = self.ReadSidecarInfo(basename)
+        source = self.CheckSidecarSource(fname, info)
+
+        missing = {}
+        for what, sidecar in sidecars.items():
+            if self.CheckSidecar(fname, sidecar, info, source):
+                hdtv.ui.info(f"Using {sidecar} for {what}")
+            else:
+                missing[what] = sidecar
+
+        digest = source.get("blake2b") if source else None
+        if missing:
+            mmatrix = self.GetMappedMatrix(fname)
+            # Triangular matrices of any number of levels can only be
+            # projected here (of all levels, only the first one is used)
+            if isinstance(mmatrix, MappedTriangle) or (
+                mmatrix is not None and mmatrix.levels == 1
+            ):
+                digest = self.GenerateFilesMapped(mmatrix, missing)
+            else:
+                self.GenerateFilesMatOp(fname, missing)
 
-        # Generate projection(s)
-        prx_fname = basename + ".prx"
-        pry_fname = ""
-        if os.path.exists(prx_fname):
-            hdtv.ui.info("Using %s for x projection" % prx_fname)
-            prx_fname = ""
+        # Remember the state of all files, as long as they were generated by us
+        if info is not None or missing:
+            previous = info["files"] if source else {}
+            self.WriteSidecarInfo(basename, fname, sidecars.values(), digest, previous)
 
-        if not sym:
-            pry_fname = basename + ".pry"
-            if os.path.exists(pry_fname):
-                hdtv.ui.info("Using %s for y projection" % pry_fname)
-                pry_fname = ""
+    def GenerateFilesMapped(self, mmatrix, missing):
+        """
+        Generate missing projection(s), transpose and integrals in one pass
+        over a memory-mapped matrix
 
+        Returns:
+            Hash of the matrix file
+        """
+        prx, pry, digest = mmatrix.Project(
+            missing.get("transpose"),
+            missing.get("integral"),
+            missing.get("transpose integral"),
+            nthreads=self.matrixThreads.Get() or None,
+        )
+        for what in ("transpose", "integral", "transpose integral"):
+            if what in missing:
+                hdtv.ui.info(f"Generated {what}: {missing[what]}")
+
+        if mmatrix.data.dtype.kind in "iu":
+            fmt = "lc"
+        else:
+            fmt = "lf%d" % mmatrix.data.itemsize
+        for what, proj in (("x projection", prx[0]), ("y projection", pry[0])):
+            if what not in missing:
+                continue
+            hist = ROOT.TH1D(what, what, len(proj), -0.5, len(proj) - 0.5)
+            FillHist(hist, proj)
+            SpecReader.WriteSpectrum(hist, missing[what], fmt)
+            hdtv.ui.info(f"Generated {what}: {missing[what]}")
+        return digest
+
+    def GenerateFilesMatOp(self, fname, missing):
+        """
+        Generate missing projection(s) and transpose using MatOp, and
+        integrals by reading the matrix and its transpose line by line
+        """
+        # MatOp would only project the stored lower triangle
+        mhist = SpecReader.GetMFileHist(fname)
+        triangular = ROOT.TriMatrix.IsTriangular(mhist.GetFileType())
+        mhist.Close()
+        if triangular:
+            msg = f"{fname}: Triangular matrix cannot be memory-mapped for projection"
+            hdtv.ui.error(msg)
+            raise SpecReaderError(msg)
+        prx_fname = missing.get("x projection", "")
+        pry_fname = missing.get("y projection", "")
         if prx_fname or pry_fname:
             errno = ROOT.MatOp.Project(fname, prx_fname, pry_fname)
             if errno != ROOT.MatOp.ERR_SUCCESS:
@@ -804,13 +1585,99 @@ class MHisto2D(Histo2D):
             if pry_fname:
                 hdtv.ui.info("Generated y projection: %s" % pry_fname)
 
-        # Generate transpose
-        if not sym:
-            trans_fname = basename + ".tmtx"
-            if os.path.exists(trans_fname):
-                hdtv.ui.info("Using %s for transpose" % trans_fname)
-            else:
-                errno = ROOT.MatOp.Transpose(fname, trans_fname)
-                if errno != ROOT.MatOp.ERR_SUCCESS:
-                    raise RuntimeError("Transpose: " + ROOT.MatOp.GetErrorString(errno))
-                hdtv.ui.info("Generated transpose: %s" % trans_fname)
+        if "transpose" in missing:
+            trans_fname = missing["transpose"]
+            errno = ROOT.MatOp.Transpose(fname, trans_fname)
+            if errno != ROOT.MatOp.ERR_SUCCESS:
+                raise RuntimeError("Transpose: " + ROOT.MatOp.GetErrorString(errno))
+            hdtv.ui.info("Generated transpose: %s" % trans_fname)
+
+        basename = self.GetBasename(fname)
+        for what, source in (
+            ("integral", fname),
+            ("transpose integral", basename + ".tmtx"),
+        ):
+            if what in missing:
+                SpecReader.WriteIntegral(source, missing[what])
+                hdtv.ui.info(f"Generated {what}: {missing[what]}")
+
+    @staticmethod
+    def FileState(fname):
+        stat = os.stat(fname)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    @staticmethod
+    def FileDigest(fname):
+        digest = hashlib.blake2b()
+        with open(fname, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 24), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def ReadSidecarInfo(basename):
+        """
+        Read record of matrix and generated files, None if there is none
+        """
+        try:
+            with open(basename + ".mtxinfo") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(info, dict) or not {"source", "files"} <= info.keys():
+            return None
+        return info
+
+    def WriteSidecarInfo(self, basename, fname, sidecars, digest, previous):
+        """
+        Record state of matrix and generated files, keeping the previous
+        records of files not used this time
+        """
+        info = {"source": self.FileState(fname), "files": dict(previous)}
+        if digest:
+            info["source"]["blake2b"] = digest
+        for sidecar in sidecars:
+            info["files"][os.path.basename(sidecar)] = self.FileState(sidecar)
+        try:
+            with open(basename + ".mtxinfo", "w") as f:
+                json.dump(info, f, indent=2)
+        except OSError as error:
+            hdtv.ui.warning(f"Could not record state of generated files: {error}")
+
+    def CheckSidecarSource(self, fname, info):
+        """
+        Check whether the matrix is still the one the recorded files were
+        generated from. Only if the size matches, but the modification time
+        does not, the file has to be hashed.
+
+        Returns:
+            Recorded state of the matrix, or None if it changed
+        """
+        if info is None:
+            return None
+        source = info["source"]
+        state = self.FileState(fname)
+        if source.get("size") != state["size"]:
+            return None
+        if source.get("mtime_ns") == state["mtime_ns"]:
+            return source
+        if source.get("blake2b") and source["blake2b"] == self.FileDigest(fname):
+            hdtv.ui.debug(f"{fname} was touched, but its contents did not change")
+            return source
+        return None
+
+    def CheckSidecar(self, fname, sidecar, info, source):
+        """
+        Check whether a previously generated file can be used
+        """
+        try:
+            state = self.FileState(sidecar)
+        except OSError:
+            return False
+        if info is None:
+            # No record (e.g. generated by an older version): Only trust
+            # files newer than the matrix
+            return state["mtime_ns"] >= self.FileState(fname)["mtime_ns"]
+        if source is None:
+            return False
+        return info["files"].get(os.path.basename(sidecar)) == state
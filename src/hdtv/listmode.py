@@ -0,0 +1,268 @@
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+Sorting of listmode (event-by-event) data into spectra and matrices
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from hdtv.specreader import WriteMFileTrailer
+
+
+class ListmodeError(Exception):
+    pass
+
+
+class ListmodeFile:
+    """
+    Binary file of fixed-size event records, e.g. (E1, E2, t) for
+    coincidences, optionally following a header of fixed size. All fields
+    of a record have the same numpy data type.
+
+    The file is read in chunks of events, so that files much larger than
+    the available memory can be sorted.
+    """
+
+    def __init__(self, fname, fields=("e1", "e2", "t"), dtype="<f4", header=0):
+        self.fname = fname
+        self.fields = tuple(fields)
+        self.header = header
+        try:
+            self.dtype = np.dtype([(field, dtype) for field in self.fields])
+        except (TypeError, ValueError) as msg:
+            raise ListmodeError(f"Invalid record format: {msg}")
+        size = os.path.getsize(fname) - header
+        if size < 0:
+            raise ListmodeError(f"{fname}: File is smaller than its header")
+        if size % self.dtype.itemsize:
+            raise ListmodeError(
+                f"{fname}: File size does not match records of {self.dtype.itemsize} bytes"
+            )
+        self.nevents = size // self.dtype.itemsize
+
+    def Read(self, start, stop):
+        """
+        Read events start to stop - 1 as structured array
+        """
+        return np.fromfile(
+            self.fname,
+            dtype=self.dtype,
+            count=stop - start,
+            offset=self.header + start * self.dtype.itemsize,
+        )
+
+    def Chunks(self, start, stop, chunksize):
+        """
+        Iterate over events start to stop - 1 in chunks of chunksize events
+        """
+        for first in range(start, stop, chunksize):
+            yield self.Read(first, min(first + chunksize, stop))
+
+
+class Gate:
+    """
+    Predicate selecting events with low <= value <= high in one field, e.g.
+    an energy or time window
+    """
+
+    def __init__(self, field, low, high):
+        self.field = field
+        self.low = min(low, high)
+        self.high = max(low, high)
+
+    def __str__(self):
+        return f"{self.field}:{self.low:g}:{self.high:g}"
+
+    @classmethod
+    def Parse(cls, string):
+        """
+        Parse gate from string of the form field:low:high
+        """
+        try:
+            field, low, high = string.split(":")
+            return cls(field, float(low), float(high))
+        except ValueError:
+            raise ListmodeError(f"Invalid gate {string} (expected field:low:high)")
+
+    def Mask(self, events):
+        values = events[self.field]
+        return (values >= self.low) & (values <= self.high)
+
+
+class Sorter:
+    """
+    Sort events into a spectrum (one axis) or matrix (two axes, x and y).
+
+    Each axis is a field of the event records; for spectra, each of several
+    fields contributes one count per event (e.g. both energies of a
+    coincidence). Matrices may be symmetrized by counting each event also
+    with x and y exchanged. All axes have nbins bins of width binsize, with
+    the center of the first one at zero (like the channels of a spectrum
+    read from file). Only events passing all gates are counted.
+
+    Matrices are stored as lines (y) x columns (x), like mfile matrices.
+    """
+
+    # Number of events read at once
+    CHUNKSIZE = 1 << 20
+
+    def __init__(
+        self, lmfile, axes, nbins, binsize=1.0, gates=(), matrix=False, sym=False
+    ):
+        self.lmfile = lmfile
+        self.axes = list(axes)
+        self.nbins = nbins
+        self.binsize = binsize
+        self.gates = list(gates)
+        self.matrix = matrix
+        self.sym = sym
+
+        for field in self.axes + [gate.field for gate in self.gates]:
+            if field not in lmfile.fields:
+                raise ListmodeError(f"Unknown field {field}")
+        if nbins < 1 or binsize <= 0:
+            raise ListmodeError("Invalid binning")
+        if matrix and len(self.axes) != 2:
+            raise ListmodeError("Matrices need exactly two axes")
+        if not matrix and (sym or not self.axes):
+            raise ListmodeError(
+                "Spectra need at least one axis and cannot be symmetric"
+            )
+
+    @property
+    def shape(self):
+        return (self.nbins, self.nbins) if self.matrix else (self.nbins,)
+
+    def Bins(self, values):
+        """
+        Bin numbers of values, -1 for values outside of the histogram
+        """
+        bins = np.floor(values / self.binsize + 0.5)
+        return np.where((bins >= 0) & (bins < self.nbins), bins, -1).astype(np.int64)
+
+    def SortChunk(self, events, counts):
+        """
+        Add events to counts (flattened histogram)
+        """
+        if self.gates:
+            mask = np.logical_and.reduce([gate.Mask(events) for gate in self.gates])
+            events = events[mask]
+
+        bins = [self.Bins(events[field]) for field in self.axes]
+        if self.matrix:
+            x, y = bins
+            pairs = [(x, y), (y, x)] if self.sym else [(x, y)]
+            bins = [
+                np.where((x >= 0) & (y >= 0), y * self.nbins + x, -1) for x, y in pairs
+            ]
+        for b in bins:
+            b = b[b >= 0]
+            # np.bincount() allocates a full histogram, which only pays off
+            # if there are more events than bins (i.e. rather for spectra)
+            if b.size > counts.size:
+                np.add(
+                    counts,
+                    np.bincount(b, minlength=counts.size),
+                    out=counts,
+                    casting="unsafe",
+                )
+            else:
+                np.add.at(counts, b, 1)
+
+    def CountType(self, nevents):
+        """
+        Smallest integer type of a histogram holding all counts of nevents
+        events
+        """
+        ncounts = (
+            nevents * (2 if self.sym else 1) * (1 if self.matrix else len(self.axes))
+        )
+        return np.uint32 if ncounts <= np.iinfo(np.uint32).max else np.int64
+
+    def SortRange(self, start, stop):
+        """
+        Sort events start to stop - 1
+
+        Returns:
+            Flattened histogram
+        """
+        counts = np.zeros(np.prod(self.shape), dtype=self.CountType(stop - start))
+        for events in self.lmfile.Chunks(start, stop, self.CHUNKSIZE):
+            self.SortChunk(events, counts)
+        return counts
+
+    def Sort(self, nprocs=None):
+        """
+        Sort the whole file, splitting it into ranges of events that are
+        sorted in nprocs processes (default: number of CPUs, limited by the
+        available memory for their partial histograms) and merging the
+        partial histograms afterwards.
+
+        Returns:
+            Histogram (see shape)
+        """
+        if nprocs is None:
+            nprocs = os.cpu_count() or 1
+        nevents = self.lmfile.nevents
+        # Do not bother starting processes for less than one chunk each
+        nprocs = max(1, min(nprocs, -(-nevents // self.CHUNKSIZE)))
+        # Each process holds a partial histogram, which is copied once more
+        # when it is sent back
+        nbytes = int(np.prod(self.shape)) * np.dtype(self.CountType(nevents)).itemsize
+        available = AvailableMemory()
+        if available is not None:
+            nprocs = max(1, min(nprocs, available // (2 * nbytes) - 1))
+        if nprocs == 1:
+            return self.SortRange(0, nevents).reshape(self.shape)
+
+        edges = np.linspace(0, nevents, nprocs + 1).astype(int)
+        counts = np.zeros(np.prod(self.shape), dtype=self.CountType(nevents))
+        with ProcessPoolExecutor(max_workers=nprocs) as pool:
+            for partial in pool.map(self.SortRange, edges[:-1], edges[1:]):
+                counts += partial
+        return counts.reshape(self.shape)
+
+
+def AvailableMemory():
+    """
+    Available physical memory in bytes, or None if unknown
+    """
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def WriteMatrix(fname, counts):
+    """
+    Write matrix as uncompressed mfile matrix (le4, or lf8 if there are too
+    many counts for 32 bit integers)
+    """
+    if counts.max(initial=0) <= np.iinfo(np.int32).max:
+        dtype, fmtname = "<i4", "le4"
+    else:
+        dtype, fmtname = "<f8", "lf8"
+    counts.astype(dtype).tofile(fname)
+    lines, columns = counts.shape
+    WriteMFileTrailer(fname, 1, lines, columns, fmtname)
+    return fmtname
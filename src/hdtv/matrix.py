@@ -17,13 +17,72 @@
 # along with HDTV; if not, write to the Free Software Foundation,
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
+from collections import OrderedDict
+
 import hdtv.color
+import hdtv.options
+import hdtv.ui
 from hdtv.drawable import DrawableManager
+from hdtv.histogram import CutHistogram
 from hdtv.spectrum import CutSpectrum
 from hdtv.weakref_proxy import weakref
 
 
+class CutCache:
+    """
+    LRU cache of cut histograms, limited by the memory used by their bin
+    contents and errors
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.state = None
+
+    @staticmethod
+    def Size(rhist):
+        return rhist.GetNcells() * 8 * (2 if rhist.GetSumw2N() else 1)
+
+    def Get(self, key, cal=None):
+        """
+        Return a copy of the cached cut histogram for key, with calibration
+        cal, or None. The calibration is not cached, because the projections
+        may have been recalibrated since.
+        """
+        try:
+            rhist, axis, typeStr = self.entries[key]
+        except KeyError:
+            return None
+        self.entries.move_to_end(key)
+        hist = CutHistogram(rhist.__class__(rhist), axis, None, cal=cal)
+        hist.typeStr = typeStr
+        return hist
+
+    def Put(self, key, hist, budget):
+        """
+        Store a copy of hist under key and evict the least recently used
+        entries until the cache fits into budget (bytes)
+        """
+        rhist = hist.hist.__class__(hist.hist)
+        size = self.Size(rhist)
+        if size > budget:
+            return
+        if key in self.entries:
+            self.nbytes -= self.Size(self.entries.pop(key)[0])
+        self.entries[key] = (rhist, hist.axis, hist.typeStr)
+        self.nbytes += size
+        while self.nbytes > budget:
+            self.nbytes -= self.Size(self.entries.popitem(last=False)[1][0])
+
+    def Clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+
 class Matrix(DrawableManager):
+    cutCacheSize = hdtv.options.Option(default=256.0, parse=float)
+    hdtv.options.RegisterOption("matrix.cutcache.size", cutCacheSize)
+
     def __init__(self, histo2D, sym, viewport):
         DrawableManager.__init__(self, viewport)
         self.histo2D = histo2D
@@ -32,6 +91,7 @@ class Matrix(DrawableManager):
         self._xproj = None
         self._yproj = None
         self._color = hdtv.color.default
+        self.cutCache = CutCache()
 
     # color property
     def _set_color(self, color):
@@ -82,10 +142,53 @@ class Matrix(DrawableManager):
             return getattr(self, "_%sproj" % axis)
 
     def ExecuteCut(self, cut):
-        cutHisto = self.histo2D.ExecuteCut(cut.regionMarkers, cut.bgMarkers, cut.axis)
-        if cut.axis == "x":
+        cutHisto = self.GetCutHistogram(cut)
+        return self.MakeCutSpectrum(cutHisto, cut.axis)
+
+    def ExecuteCuts(self, cuts):
+        """
+        Execute many cuts at once, reading the matrix only once for all cuts
+        on the same axis (see Histo2D.ExecuteCuts). Cached results are used
+        where available.
+
+        Returns:
+            List of cut spectra, None for cuts outside of the matrix
+        """
+        self.CheckCutCache()
+        budget = int(self.cutCacheSize.Get() * 1024 * 1024)
+
+        cutHistos = [None] * len(cuts)
+        pending = OrderedDict()
+        for i, cut in enumerate(cuts):
+            key = None
+            if budget > 0:
+                key = self.histo2D.CutBins(cut.regionMarkers, cut.bgMarkers, cut.axis)
+                cutHistos[i] = self.cutCache.Get(key, self.histo2D.CutCal(key[0]))
+            if cutHistos[i] is not None:
+                cutHistos[i].gates = cut.regionMarkers
+            else:
+                pending.setdefault(cut.axis, []).append((i, key))
+
+        for axis, items in pending.items():
+            gates = [(cuts[i].regionMarkers, cuts[i].bgMarkers) for i, _ in items]
+            hdtv.ui.debug("Executing %d cuts on %s axis" % (len(gates), axis))
+            for (i, key), cutHisto in zip(items, self.histo2D.ExecuteCuts(gates, axis)):
+                if cutHisto is not None and key is not None:
+                    self.cutCache.Put(key, cutHisto, budget)
+                cutHistos[i] = cutHisto
+
+        return [
+            None if cutHisto is None else self.MakeCutSpectrum(cutHisto, cut.axis)
+            for cut, cutHisto in zip(cuts, cutHistos)
+        ]
+
+    def MakeCutSpectrum(self, cutHisto, axis):
+        """
+        Create spectrum for a cut on axis, i.e. projected on the other axis
+        """
+        if axis == "x":
             axis = "y"
-        elif cut.axis == "y":
+        elif axis == "y":
             axis = "x"
         elif self.sym:
             axis = "0"
@@ -95,6 +198,39 @@ class Matrix(DrawableManager):
         cutSpec.color = self.color
         return cutSpec
 
+    def CheckCutCache(self):
+        """
+        Invalidate cached cuts if the underlying 2D histogram has changed
+        """
+        state = self.histo2D.state
+        if state != self.cutCache.state:
+            self.cutCache.Clear()
+            self.cutCache.state = state
+            self.histo2D.ClearCache()
+
+    def GetCutHistogram(self, cut):
+        """
+        Execute cut on the underlying 2D histogram, unless the result for the
+        same binned regions is still in the cache (matrix.cutcache.size, in MiB)
+        """
+        self.CheckCutCache()
+
+        budget = int(self.cutCacheSize.Get() * 1024 * 1024)
+        key = None
+        if budget > 0:
+            key = self.histo2D.CutBins(cut.regionMarkers, cut.bgMarkers, cut.axis)
+        if key is not None:
+            cutHisto = self.cutCache.Get(key, self.histo2D.CutCal(key[0]))
+            if cutHisto is not None:
+                hdtv.ui.debug("Using cached cut on %s axis" % key[0])
+                cutHisto.gates = cut.regionMarkers
+                return cutHisto
+
+        cutHisto = self.histo2D.ExecuteCut(cut.regionMarkers, cut.bgMarkers, cut.axis)
+        if key is not None:
+            self.cutCache.Put(key, cutHisto, budget)
+        return cutHisto
+
     # overwrite some functions from Drawable
     def Insert(self, obj, ID=None):
         """
@@ -190,11 +190,17 @@ class PeakModelTheuerkauf(PeakModel):
             "integrate": False,
             "likelihood": "normal",
             "onlypositivepeaks": False,
+            "gradient": False,
+            "engine": "root",
+            "warmstart": False,
         }
         self.fValidOptStatus = {
             "integrate": [False, True],
             "likelihood": ["normal", "poisson"],
             "onlypositivepeaks": [False, True],
+            "gradient": [False, True],
+            "engine": ["root", "direct"],
+            "warmstart": [False, True],
         }
 
         self.ResetParamStatus()
@@ -278,6 +284,9 @@ class PeakModelTheuerkauf(PeakModel):
         self.fOptStatus["integrate"] = False
         self.fOptStatus["likelihood"] = "normal"
         self.fOptStatus["onlypositivepeaks"] = False
+        self.fOptStatus["gradient"] = False
+        self.fOptStatus["engine"] = "root"
+        self.fOptStatus["warmstart"] = False
 
     def Uncal(self, parname, value, pos_uncal, cal):
         """
@@ -299,9 +308,31 @@ class PeakModelTheuerkauf(PeakModel):
         else:
             raise RuntimeError("Unexpected parameter name")
 
-    def GetFitter(self, region, peaklist, cal):
+    def StartValues(self, peak_id, start):
+        """
+        Initial values of the parameters of a peak from the parameters of a
+        previous fit (None: estimate). Only free parameters are taken over,
+        held parameters keep their estimate.
+        """
+        ivals = {}
+        for name in ["vol", "width", "tl", "tr", "sh", "sw"]:
+            if isinstance(self.fParStatus[name], list):
+                parStatus = self.fParStatus[name][peak_id]
+            else:
+                parStatus = self.fParStatus[name]
+            ivals[name] = start.get(name) if parStatus in ("free", "equal") else None
+        if ivals["width"] is not None:
+            # width==fwhm (internally the C++ fitter uses sigma)
+            ivals["width"] /= 2.0 * math.sqrt(2.0 * math.log(2.0))
+        return ivals
+
+    def GetFitter(self, region, peaklist, cal, start=None):
         """
         Creates a C++ Fitter object, which can then do the real work
+
+        start is an optional list of dicts with the (uncalibrated) parameters
+        of a previous fit, one for each peak, which are used as initial values
+        of the free parameters (warm start)
         """
         # Define a fitter and a region
         # FIXME: show_inipar seems to create a crash, see ticket #103 for trace
@@ -310,8 +341,19 @@ class PeakModelTheuerkauf(PeakModel):
         integrate = self.GetOption("integrate")
         likelihood = self.GetOption("likelihood")
         onlypositivepeaks = self.GetOption("onlypositivepeaks")
+        # Analytic derivatives for the minimizer (not used for integrate)
+        gradient = self.GetOption("gradient")
+        # Minimize directly instead of using TH1::Fit, with analytic bin
+        # integrals for integrate
+        engine = self.GetOption("engine")
         self.fFitter = ROOT.HDTV.Fit.TheuerkaufFitter(
-            region[0], region[1], integrate, likelihood, onlypositivepeaks
+            region[0],
+            region[1],
+            integrate,
+            likelihood,
+            onlypositivepeaks,
+            gradient,
+            engine,
         )
         self.ResetGlobalParams()
         # Check if enough values are provided in case of per-peak parameters
@@ -322,13 +364,15 @@ class PeakModelTheuerkauf(PeakModel):
         for pid in range(len(peaklist)):
             pos_uncal = peaklist[pid]
 
+            ivals = self.StartValues(pid, start[pid] if start else {})
+
             pos = self.GetParam("pos", pid, pos_uncal, cal, pos_uncal)
-            vol = self.GetParam("vol", pid, pos_uncal, cal)
-            sigma = self.GetParam("width", pid, pos_uncal, cal)
-            tl = self.GetParam("tl", pid, pos_uncal, cal)
-            tr = self.GetParam("tr", pid, pos_uncal, cal)
-            sh = self.GetParam("sh", pid, pos_uncal, cal)
-            sw = self.GetParam("sw", pid, pos_uncal, cal)
+            vol = self.GetParam("vol", pid, pos_uncal, cal, ivals["vol"])
+            sigma = self.GetParam("width", pid, pos_uncal, cal, ivals["width"])
+            tl = self.GetParam("tl", pid, pos_uncal, cal, ivals["tl"])
+            tr = self.GetParam("tr", pid, pos_uncal, cal, ivals["tr"])
+            sh = self.GetParam("sh", pid, pos_uncal, cal, ivals["sh"])
+            sw = self.GetParam("sw", pid, pos_uncal, cal, ivals["sw"])
 
             cpeak = ROOT.HDTV.Fit.TheuerkaufPeak(pos, vol, sigma, tl, tr, sh, sw)
             self.fFitter.AddPeak(cpeak)
@@ -23,9 +23,11 @@ import ROOT
 
 import hdtv.cmdline
 import hdtv.fit
+import hdtv.fitter
 import hdtv.options
 import hdtv.ui
 import hdtv.util
+from hdtv.util import LockViewport
 
 
 class FitInterface:
@@ -174,6 +176,29 @@ class FitInterface:
         hdtv.ui.msg(html=str(fit))
         fit.Draw(self.window.viewport)
 
+    def ExecuteRefits(self, specID, fitIDs, nworkers=None):
+        """
+        Re-Execute peak fits of several stored fits concurrently
+        """
+        try:
+            spec = self.spectra.dict[specID]
+        except KeyError:
+            raise KeyError("invalid spectrum ID")
+        fits = []
+        for fitID in sorted(fitIDs):
+            try:
+                fits.append((fitID, spec.dict[fitID]))
+            except KeyError:
+                hdtv.ui.warning(f"invalid fit ID {fitID}")
+        errors = hdtv.fitter.Fitter.FitMany(spec, [fit for _, fit in fits], nworkers)
+        with LockViewport(self.window.viewport):
+            for (fitID, fit), error in zip(fits, errors):
+                if error is not None:
+                    hdtv.ui.warning(f"Fit {fitID} in spectrum {specID} failed: {error}")
+                    continue
+                hdtv.ui.msg(html=str(fit))
+                fit.Draw(self.window.viewport)
+
     def ExecuteReintegrate(self, specID, fitID, print_result=True):
         """
         Re-Execute Fit on store fits
@@ -630,6 +655,24 @@ class TvFitInterface:
             default=False,
             help="store fit after fitting",
         )
+        parser.add_argument(
+            "-a",
+            "--all",
+            action="store_true",
+            default=False,
+            help="(re)fit all stored fits",
+        )
+        parser.add_argument(
+            "-p",
+            "--parallel",
+            action="store",
+            default=None,
+            type=int,
+            metavar="N",
+            help="refit stored fits in N threads (0 for number of CPUs); "
+            "uses Minuit2 instead of TMinuit, so results may differ slightly "
+            "from serial fits",
+        )
         parser.add_argument(
             "fitids",
             nargs="*",
@@ -1027,7 +1070,8 @@ class TvFitInterface:
 
         for specID in specIDs:
             self.spectra.ActivateObject(specID)
-            fitIDs = hdtv.util.ID.ParseIds(args.fitids, self.spectra.dict[specID])
+            fitids = "all" if args.all else args.fitids
+            fitIDs = hdtv.util.ID.ParseIds(fitids, self.spectra.dict[specID])
             if len(fitIDs) == 0:
                 if args.quick is not None:
                     self.fitIf.QuickFit(args.quick)
@@ -1038,16 +1082,25 @@ class TvFitInterface:
                 if args.store is True:
                     self.spectra.StoreFit()  # Store current fit
 
+            parallel = args.parallel is not None and doPeaks
+            refitIDs = []
             for fitID in fitIDs:
                 try:
                     hdtv.ui.msg(f"Executing fit {fitID} in spectrum {specID}")
                     self.fitIf.ExecuteReintegrate(
                         specID=specID, fitID=fitID, print_result=False
                     )
-                    self.fitIf.ExecuteRefit(specID=specID, fitID=fitID, peaks=doPeaks)
+                    if parallel:
+                        refitIDs.append(fitID)
+                    else:
+                        self.fitIf.ExecuteRefit(
+                            specID=specID, fitID=fitID, peaks=doPeaks
+                        )
                 except (KeyError, RuntimeError) as e:
                     hdtv.ui.warning(e)
                     continue
+            if refitIDs:
+                self.fitIf.ExecuteRefits(specID, refitIDs, args.parallel or None)
 
         if (
             oldActiveID is not None
@@ -0,0 +1,273 @@
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+Sort listmode data into spectra and matrices
+"""
+
+import os
+
+import ROOT
+
+import hdtv.cmdline
+import hdtv.color
+import hdtv.options
+import hdtv.plugins.matInterface
+import hdtv.ui
+import hdtv.util
+from hdtv.histogram import FillHist, Histogram
+from hdtv.listmode import Gate, ListmodeError, ListmodeFile, Sorter, WriteMatrix
+from hdtv.specreader import SpecReader, SpecReaderError
+from hdtv.spectrum import Spectrum
+from hdtv.util import LockViewport
+
+
+class ListmodeInterface:
+    """
+    Commands for sorting binary listmode files
+    """
+
+    # Format of the event records, see ListmodeFile
+    fields = hdtv.options.Option(default="e1,e2,t")
+    hdtv.options.RegisterOption("listmode.fields", fields)
+    dtype = hdtv.options.Option(default="<f4")
+    hdtv.options.RegisterOption("listmode.dtype", dtype)
+    processes = hdtv.options.Option(default=0, parse=int)
+    hdtv.options.RegisterOption("listmode.processes", processes)
+
+    def __init__(self, spectra):
+        hdtv.ui.debug("Loaded plugin for sorting listmode data")
+
+        self.spectra = spectra
+
+        prog = "spectrum sort"
+        description = (
+            "sort events of a binary listmode file into a new spectrum. Each of "
+            "the given fields contributes one count per event."
+        )
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        self.AddSortArguments(parser)
+        parser.add_argument(
+            "-a",
+            "--axis",
+            action="append",
+            default=None,
+            help="field to sort into the spectrum, may be given more than once "
+            "(default: first field)",
+        )
+        parser.add_argument(
+            "-s",
+            "--spectrum",
+            action="store",
+            default=None,
+            help="id for sorted spectrum",
+        )
+        parser.add_argument(
+            "-o", "--output", default=None, help="also write spectrum to file"
+        )
+        parser.add_argument(
+            "--format",
+            default="lc",
+            help="format of the written spectrum (default: %(default)s)",
+        )
+        hdtv.cmdline.AddCommand(
+            prog, self.SpectrumSort, level=2, fileargs=True, parser=parser
+        )
+
+        prog = "matrix sort"
+        description = (
+            "sort coincident events of a binary listmode file into an "
+            "uncompressed matrix file"
+        )
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        self.AddSortArguments(parser)
+        parser.add_argument(
+            "output", metavar="output-file", help="file for the sorted matrix"
+        )
+        parser.add_argument(
+            "-x", "--xaxis", default=None, help="field for x (default: first field)"
+        )
+        parser.add_argument(
+            "-y", "--yaxis", default=None, help="field for y (default: second field)"
+        )
+        parser.add_argument(
+            "--sym",
+            action="store_true",
+            default=False,
+            help="symmetrize matrix by counting each event also with x and y exchanged",
+        )
+        parser.add_argument(
+            "-l",
+            "--load",
+            action="store_true",
+            default=False,
+            help="load the matrix after sorting",
+        )
+        hdtv.cmdline.AddCommand(
+            prog, self.MatrixSort, level=2, fileargs=True, parser=parser
+        )
+
+    @staticmethod
+    def AddSortArguments(parser):
+        """
+        Arguments common to all sort commands
+        """
+        parser.add_argument("filename", metavar="listmode-file", help="file to sort")
+        parser.add_argument(
+            "-f",
+            "--fields",
+            default=None,
+            help="comma separated names of the fields of each record "
+            "(default: listmode.fields)",
+        )
+        parser.add_argument(
+            "-d",
+            "--dtype",
+            default=None,
+            help="numpy data type of the fields (default: listmode.dtype)",
+        )
+        parser.add_argument(
+            "--header",
+            type=int,
+            default=0,
+            help="size of the file header in bytes (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-g",
+            "--gate",
+            action="append",
+            default=[],
+            help="only count events with low <= field <= high, given as "
+            "field:low:high (e.g. t:-50:50), may be given more than once",
+        )
+        parser.add_argument(
+            "-n",
+            "--nbins",
+            type=int,
+            default=8192,
+            help="number of bins per axis (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-b",
+            "--binsize",
+            type=float,
+            default=1.0,
+            help="size of each bin (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-j",
+            "--processes",
+            type=int,
+            default=None,
+            help="number of processes (default: listmode.processes, 0 for number of CPUs)",
+        )
+        parser.add_argument(
+            "-F",
+            "--force",
+            action="store_true",
+            default=False,
+            help="overwrite existing files without asking",
+        )
+
+    def Sort(self, args, axes, matrix=False, sym=False):
+        """
+        Sort listmode file according to the common arguments
+        """
+        fields = (args.fields or self.fields.Get()).split(",")
+        try:
+            lmfile = ListmodeFile(
+                os.path.expanduser(args.filename),
+                fields=[field.strip() for field in fields],
+                dtype=args.dtype or self.dtype.Get(),
+                header=args.header,
+            )
+            axes = [axis or field for axis, field in zip(axes, lmfile.fields)]
+            gates = [Gate.Parse(gate) for gate in args.gate]
+            sorter = Sorter(
+                lmfile, axes, args.nbins, args.binsize, gates, matrix=matrix, sym=sym
+            )
+        except (OSError, ListmodeError) as msg:
+            raise hdtv.cmdline.HDTVCommandError(str(msg))
+
+        nprocs = args.processes
+        if nprocs is None:
+            nprocs = self.processes.Get()
+        hdtv.ui.info(f"Sorting {lmfile.nevents} events from {lmfile.fname}")
+        return sorter.Sort(nprocs or None)
+
+    def SpectrumSort(self, args):
+        """
+        Sort listmode file into a spectrum
+        """
+        if args.spectrum is not None:
+            try:
+                ids = hdtv.util.ID.ParseIds(
+                    args.spectrum, self.spectra, only_existent=False
+                )
+            except ValueError as msg:
+                raise hdtv.cmdline.HDTVCommandError("Invalid ID: %s" % msg)
+            if len(ids) > 1:
+                raise hdtv.cmdline.HDTVCommandError("More than one ID given")
+            ID = ids[0]
+        else:
+            ID = self.spectra.GetFreeID()
+
+        counts = self.Sort(args, args.axis or [None])
+        nbins, binsize = args.nbins, args.binsize
+        name = os.path.basename(args.filename)
+        hist = ROOT.TH1D(name, name, nbins, -binsize / 2, (nbins - 0.5) * binsize)
+        FillHist(hist, counts)
+
+        if args.output is not None:
+            fname = hdtv.util.user_save_file(args.output, args.force)
+            if fname:
+                try:
+                    SpecReader.WriteSpectrum(hist, fname, args.format)
+                except SpecReaderError as msg:
+                    raise hdtv.cmdline.HDTVCommandError(str(msg))
+                hdtv.ui.msg(f"Wrote sorted spectrum to {fname}")
+
+        with LockViewport(
+            self.spectra.window.viewport if self.spectra.window else None
+        ):
+            spec = Spectrum(Histogram(hist))
+            spec.typeStr = "spectrum, sorted from listmode"
+            sid = self.spectra.Insert(spec, ID)
+            spec.color = hdtv.color.ColorForID(sid.major)
+            self.spectra.ActivateObject(sid)
+        hdtv.ui.msg(f"Sorted {args.filename} into {sid}")
+
+    def MatrixSort(self, args):
+        """
+        Sort listmode file into a matrix file
+        """
+        fname = hdtv.util.user_save_file(args.output, args.force)
+        if not fname:
+            return
+        counts = self.Sort(args, [args.xaxis, args.yaxis], matrix=True, sym=args.sym)
+        fmtname = WriteMatrix(fname, counts)
+        hdtv.ui.msg(f"Wrote sorted matrix to {fname} (format {fmtname})")
+        if args.load:
+            hdtv.plugins.matInterface.matrix_interface.LoadMatrix(fname, args.sym)
+
+
+# plugin initialisation
+import __main__
+
+listmode_interface = ListmodeInterface(__main__.spectra)
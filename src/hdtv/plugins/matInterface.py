@@ -25,12 +25,16 @@ Matrix interface for hdtv
 import ROOT
 
 import hdtv.cmdline
+import hdtv.color
 import hdtv.rootext.display
 import hdtv.ui
 import hdtv.util
+from hdtv.cut import Cut
 from hdtv.histogram import MHisto2D
 from hdtv.matrix import Matrix
 from hdtv.specreader import SpecReader, SpecReaderError
+from hdtv.util import LockViewport
+from hdtv.weakref_proxy import weakref
 
 
 class MatInterface:
@@ -162,10 +166,10 @@ class MatInterface:
                 return
         self.spectra.ShowObjects(ID)
 
-    def LoadMatrix(self, fname, sym, ID=None):
+    def LoadMatrix(self, fname, sym, ID=None, integral=False):
         # FIXME: just for testing!
         try:
-            histo = MHisto2D(fname, sym)
+            histo = MHisto2D(fname, sym, integral)
         except (OSError, SpecReaderError):
             hdtv.ui.warning("Could not load %s" % fname)
             return
@@ -250,6 +254,80 @@ class MatInterface:
         )
         return str(table)
 
+    @staticmethod
+    def ReadGateFile(fname):
+        """
+        Read cuts from a gate file: Each line holds the limits of the cut
+        region, optionally followed by pairs of background limits. Everything
+        after "#" is a comment.
+        """
+        cuts = []
+        with open(fname) as f:
+            for num, line in enumerate(f, 1):
+                fields = line.split("#", 1)[0].split()
+                if not fields:
+                    continue
+                try:
+                    positions = [float(field) for field in fields]
+                except ValueError:
+                    positions = []
+                if len(positions) < 2 or len(positions) % 2:
+                    raise hdtv.cmdline.HDTVCommandError(
+                        "%s:%d: Expected pairs of gate and background limits"
+                        % (fname, num)
+                    )
+                cut = Cut()
+                for pos in positions[:2]:
+                    cut.SetMarker("region", pos)
+                for pos in positions[2:]:
+                    cut.SetMarker("bg", pos)
+                cuts.append(cut)
+        return cuts
+
+    def ExecuteGateFile(self, spec, fname, output=None, fmt="lc", force=False):
+        """
+        Execute all cuts from a gate file (see ReadGateFile()) on the matrix of
+        spec at once and store them. If output is given, the cut spectra are
+        also written to the files output.format(id=<cut ID>).
+
+        Returns:
+            List of cut spectra
+        """
+        matrix = spec.matrix
+        cuts = self.ReadGateFile(fname)
+        for cut in cuts:
+            cut.axis = spec.axis
+
+        loaded = []
+        activeID = matrix.activeID
+        with LockViewport(self.spectra.viewport):
+            cutSpecs = matrix.ExecuteCuts(cuts)
+            for cut, cutSpec in zip(cuts, cutSpecs):
+                marker = cut.regionMarkers[0]
+                gate = sorted([marker.p1.pos_cal, marker.p2.pos_cal])
+                if cutSpec is None:
+                    hdtv.ui.warning(
+                        "Gate %s - %s is outside of the matrix" % tuple(gate)
+                    )
+                    continue
+                cut.matrix = matrix
+                cut.spec = weakref(cutSpec)
+                ID = matrix.Insert(cut, matrix.GetFreeID())
+                cut.active = False
+                cutSpec.color = hdtv.color.ColorForID(ID.major)
+                sid = self.spectra.Insert(
+                    cutSpec, ID=hdtv.util.ID(matrix.ID.major, ID.major)
+                )
+                hdtv.ui.msg("Cut %s (gate %s - %s) into %s" % (ID, *gate, sid))
+                loaded.append(cutSpec)
+
+                if output is not None:
+                    ofname = hdtv.util.user_save_file(output.format(id=ID), force)
+                    if ofname and cutSpec.WriteSpectrum(ofname, fmt):
+                        hdtv.ui.msg("Wrote cut spectrum %s to file %s" % (sid, ofname))
+            matrix.ActivateObject(activeID)
+        return loaded
+
 
 class TvMatInterface:
     def __init__(self, matInterface):
@@ -268,6 +346,13 @@ class TvMatInterface:
             default=None,
             help="base id for loaded projections",
         )
+        parser.add_argument(
+            "-i",
+            "--integral",
+            action="store_true",
+            default=False,
+            help="generate and use integral matrix, making cuts independent of the gate width",
+        )
         parser.add_argument("matrix_type", metavar="matrix-type", help="{asym,sym}")
         parser.add_argument(
             "filename", metavar="matrix-file", help="file with matrix to load"
@@ -309,6 +394,29 @@ class TvMatInterface:
             prog, self.MatrixView, level=0, fileargs=True, parser=parser
         )
 
+        prog = "matrix pack"
+        description = (
+            "store only the lower triangle of a symmetric, uncompressed matrix, "
+            "halving its size. Load the result with 'matrix get sym'."
+        )
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument(
+            "filename", metavar="matrix-file", help="file with symmetric matrix"
+        )
+        parser.add_argument(
+            "output", metavar="output-file", help="file for the packed matrix"
+        )
+        parser.add_argument(
+            "-F",
+            "--force",
+            action="store_true",
+            default=False,
+            help="overwrite existing files without asking",
+        )
+        hdtv.cmdline.AddCommand(
+            prog, self.MatrixPack, level=0, fileargs=True, parser=parser
+        )
+
         # FIXME
         prog = "matrix delete"
         description = "delete the matrix, with all cuts and cut spectra"
@@ -329,6 +437,38 @@ class TvMatInterface:
         parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
         hdtv.cmdline.AddCommand(prog, self.CutExecute, level=0, parser=parser)
 
+        prog = "cut batch"
+        description = (
+            "execute all cuts from a gate file at once, reading each line of "
+            "the matrix only once. Each line of the file holds the limits of "
+            "a gate, optionally followed by pairs of background limits."
+        )
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument("filename", help="file with gates")
+        parser.add_argument(
+            "-o",
+            "--output",
+            default=None,
+            help="also write cut spectra to files, {id} is replaced by the cut id "
+            "(e.g. cut_{id}.spc)",
+        )
+        parser.add_argument(
+            "-f",
+            "--format",
+            default="lc",
+            help="format of the written cut spectra (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-F",
+            "--force",
+            action="store_true",
+            default=False,
+            help="overwrite existing files without asking",
+        )
+        hdtv.cmdline.AddCommand(
+            prog, self.CutBatch, level=0, fileargs=True, parser=parser
+        )
+
         prog = "cut clear"
         description = "clear cut marker and remove last cut if it was not stored"
         parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
@@ -389,7 +529,29 @@ class TvMatInterface:
             raise hdtv.cmdline.HDTVCommandError(
                 "Please specify if matrix is of type asym or sym"
             )
-        self.matIf.LoadMatrix(args.filename, sym, ID=ID)
+        self.matIf.LoadMatrix(args.filename, sym, ID=ID, integral=args.integral)
+
+    def MatrixPack(self, args):
+        """
+        Write the lower triangle of a symmetric matrix to file
+        """
+        try:
+            mmatrix = SpecReader.GetMappedMatrix(args.filename)
+        except SpecReaderError as msg:
+            raise hdtv.cmdline.HDTVCommandError(str(msg))
+        fname = hdtv.util.user_save_file(args.output, args.force)
+        if not fname:
+            return
+        try:
+            symmetric = mmatrix.WriteTriangle(fname)
+        except SpecReaderError as msg:
+            raise hdtv.cmdline.HDTVCommandError(str(msg))
+        if not symmetric:
+            hdtv.ui.warning(
+                f"{args.filename}: Matrix is not symmetric, only its lower "
+                "triangle was written"
+            )
+        hdtv.ui.info(f"Wrote packed matrix to {fname}")
 
     def MatrixList(self, args):
         """
@@ -456,6 +618,28 @@ class TvMatInterface:
     def CutExecute(self, args):
         return self.spectra.ExecuteCut()
 
+    def CutBatch(self, args):
+        """
+        Execute cuts from a gate file on the matrix of the active spectrum
+        """
+        spec = self.spectra.GetActiveObject()
+        if spec is None:
+            hdtv.ui.warning("No active spectrum")
+            return
+        if not hasattr(spec, "matrix") or spec.matrix is None:
+            hdtv.ui.warning("Active spectrum does not belong to a matrix")
+            return
+        if args.output is not None and "{id}" not in args.output:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Output file name must contain {id} to tell the cuts apart"
+            )
+        try:
+            self.matIf.ExecuteGateFile(
+                spec, args.filename, args.output, args.format, args.force
+            )
+        except OSError as error:
+            raise hdtv.cmdline.HDTVCommandError(str(error))
+
     def CutClear(self, args):
         return self.spectra.ClearCut()
 
@@ -28,6 +28,7 @@ from matplotlib import transforms
 import hdtv.cal
 import hdtv.cmdline
 import hdtv.color
+import hdtv.histogram
 import hdtv.ui
 
 # TODO: add cut marker
@@ -87,9 +88,7 @@ class PrintOut:
         # calibrate
         en = self.ApplyCalibration(en, spec.cal)
         # extract bin contents to numpy array
-        data = numpy.zeros(nbins)
-        for i in range(nbins):
-            data[i] = spec.hist.hist.GetBinContent(i)
+        data = numpy.array(hdtv.histogram.ContentsView(spec.hist.hist)[:nbins])
         # create spectrum plot
         (r, g, b) = hdtv.color.GetRGB(spec.color)
         pylab.step(en, data, color=(r, g, b), label=spec.name)
@@ -21,6 +21,7 @@ import copy
 import glob
 import os
 
+import numpy as np
 import ROOT
 
 import hdtv.cal
@@ -30,7 +31,7 @@ import hdtv.options
 import hdtv.ui
 import hdtv.util
 from hdtv.histogram import FileHistogram
-from hdtv.specreader import SpecReaderError
+from hdtv.specreader import SpecReader, SpecReaderError, SpectrumCache
 from hdtv.spectrum import Spectrum
 from hdtv.util import LockViewport
 
@@ -81,6 +82,16 @@ class SpecInterface:
         hdtv.options.RegisterOption(
             "spec.get.sort_natural", self.LoadSpectraNaturalSort
         )
+        self.LoadSpectraWorkers = hdtv.options.Option(default=0, parse=int)
+        hdtv.options.RegisterOption("spec.get.workers", self.LoadSpectraWorkers)
+        # Spectra whose files are watched for changes, see WatchSpectra()
+        self.watched = set()
+        self._watchTimer = None
+        self._watchDispatcher = ROOT.TPyDispatcher(self._WatchTimeout)
+        self.WatchInterval = hdtv.options.Option(
+            default=2.0, parse=float, changeCallback=self._WatchIntervalChanged
+        )
+        hdtv.options.RegisterOption("spec.watch.interval", self.WatchInterval)
 
     def _HotkeyShow(self, arg):
         """
@@ -134,61 +145,75 @@ class SpecInterface:
         If ID is specified, the spectrum is stored with id ID, possibly
         replacing a spectrum that was there before.
 
+        The files are read concurrently by spec.get.workers workers (0 for
+        the number of CPUs, see SpecReader.ReadSpectra()), but inserted in
+        the order of the patterns and, for each pattern, of the file names.
+
         Returns:
             A list of the loaded spectra
         """
-        with LockViewport(self.window.viewport if self.window else None):
-            # only one filename is given
-            if isinstance(patterns, str):
-                patterns = [patterns]
+        # only one filename is given
+        if isinstance(patterns, str):
+            patterns = [patterns]
 
-            if ID is not None and len(patterns) > 1:
-                raise hdtv.cmdline.HDTVCommandError(
-                    "If you specify an ID, you can only give one pattern"
-                )
+        if ID is not None and len(patterns) > 1:
+            raise hdtv.cmdline.HDTVCommandError(
+                "If you specify an ID, you can only give one pattern"
+            )
 
-            loaded = []
-            for p in patterns:
-                # put fmt if available
-                p = p.rsplit("'", 1)
-                if len(p) == 1 or not p[1]:
-                    (fpat, fmt) = (p[0], None)
-                else:
-                    (fpat, fmt) = p
+        files = []
+        for p in patterns:
+            # put fmt if available
+            p = p.rsplit("'", 1)
+            if len(p) == 1 or not p[1]:
+                (fpat, fmt) = (p[0], None)
+            else:
+                (fpat, fmt) = p
 
-                files = glob.glob(os.path.expanduser(fpat))
+            fnames = glob.glob(os.path.expanduser(fpat))
 
-                if len(files) == 0:
-                    hdtv.ui.warning("%s: no such file" % fpat)
-                elif ID is not None and len(files) > 1:
-                    raise hdtv.cmdline.HDTVCommandAbort(
-                        "pattern %s is ambiguous and you specified an ID" % fpat
-                    )
-                    break
+            if len(fnames) == 0:
+                hdtv.ui.warning("%s: no such file" % fpat)
+            elif ID is not None and len(fnames) > 1:
+                raise hdtv.cmdline.HDTVCommandAbort(
+                    "pattern %s is ambiguous and you specified an ID" % fpat
+                )
 
-                if self.LoadSpectraNaturalSort.Get():
-                    files.sort(key=hdtv.util.natural_sort_key)
-                else:
-                    files.sort()
+            if self.LoadSpectraNaturalSort.Get():
+                fnames.sort(key=hdtv.util.natural_sort_key)
+            else:
+                fnames.sort()
+            files.extend((fname, fmt) for fname in fnames)
 
-                for fname in files:
+        if len(files) > 1:
+            hists = SpecReader.ReadSpectra(files, self.LoadSpectraWorkers.Get() or None)
+        else:
+            # Not worth the overhead; FileHistogram reads the file itself
+            hists = [None] * len(files)
+
+        with LockViewport(self.window.viewport if self.window else None):
+            loaded = []
+            for (fname, fmt), hist in zip(files, hists):
+                try:
+                    if isinstance(hist, Exception):
+                        hdtv.ui.error(str(hist))
+                        raise hist
+                    # Create spectrum object
+                    spec = Spectrum(FileHistogram(fname, fmt, hist=hist))
+                except (OSError, SpecReaderError):
+                    hdtv.ui.warning(f"Could not load {fname}'{fmt}")
+                else:
+                    sid = self.spectra.Insert(spec, ID)
+                    spec.color = hdtv.color.ColorForID(sid.major)
                     try:
-                        # Create spectrum object
-                        spec = Spectrum(FileHistogram(fname, fmt))
-                    except (OSError, SpecReaderError):
-                        hdtv.ui.warning(f"Could not load {fname}'{fmt}")
+                        spec.cal = self.spectra.caldict[spec.name]
+                    except KeyError:
+                        pass
+                    loaded.append(spec)
+                    if fmt is None:
+                        hdtv.ui.msg(f"Loaded {fname} into {sid}")
                     else:
-                        sid = self.spectra.Insert(spec, ID)
-                        spec.color = hdtv.color.ColorForID(sid.major)
-                        try:
-                            spec.cal = self.spectra.caldict[spec.name]
-                        except KeyError:
-                            pass
-                        loaded.append(spec)
-                        if fmt is None:
-                            hdtv.ui.msg(f"Loaded {fname} into {sid}")
-                        else:
-                            hdtv.ui.msg(f"Loaded {fname}'{fmt} into {sid}")
+                        hdtv.ui.msg(f"Loaded {fname}'{fmt} into {sid}")
 
             if loaded:
                 # activate last loaded spectrum
@@ -255,6 +280,104 @@ class SpecInterface:
         sid = self.spectra.Insert(spec, copyTo)
         hdtv.ui.msg("Copied spectrum " + str(ID) + " to " + str(sid))
 
+    def WatchSpectra(self, ids):
+        """
+        Watch the files of spectra and refresh the spectra whenever their
+        files change (see FileHistogram.Refresh()). The files are polled
+        every spec.watch.interval seconds by a ROOT timer, i.e. from the
+        ROOT event loop, like the hotkeys of the viewer.
+
+        Returns:
+            IDs of the spectra that are watched now
+        """
+        for ID in ids:
+            if isinstance(self.spectra.dict[ID].hist, FileHistogram):
+                self.watched.add(ID)
+            else:
+                hdtv.ui.warning(f"Spectrum {ID} was not read from a file")
+        if self.watched and self._watchTimer is None:
+            self._watchTimer = ROOT.TTimer(self._WatchMilliseconds())
+            self._watchTimer.Connect(
+                "Timeout()", "TPyDispatcher", self._watchDispatcher, "Dispatch()"
+            )
+            self._watchTimer.TurnOn()
+        return sorted(self.watched)
+
+    def UnwatchSpectra(self, ids=None):
+        """
+        Stop watching spectra (default: all)
+        """
+        if ids is None:
+            self.watched.clear()
+        else:
+            self.watched.difference_update(ids)
+        if not self.watched and self._watchTimer is not None:
+            self._watchTimer.TurnOff()
+            self._watchTimer = None
+
+    def PollWatched(self):
+        """
+        Refresh those watched spectra whose files changed
+        """
+        # Forget spectra that were deleted or replaced in the meantime (and
+        # stop the timer if none are left)
+        gone = []
+        for ID in self.watched:
+            spec = self.spectra.dict.get(ID)
+            if spec is None or not isinstance(spec.hist, FileHistogram):
+                gone.append(ID)
+        if gone:
+            self.UnwatchSpectra(gone)
+        changed = [
+            ID for ID in list(self.watched) if self.spectra.dict[ID].FileChanged()
+        ]
+        if changed:
+            self.spectra.RefreshObjects(changed)
+        return changed
+
+    def _WatchMilliseconds(self):
+        return max(1, int(self.WatchInterval.Get() * 1000))
+
+    def _WatchIntervalChanged(self, opt):
+        if self._watchTimer is not None:
+            self._watchTimer.SetTime(self._WatchMilliseconds())
+
+    def _WatchTimeout(self):
+        try:
+            self.PollWatched()
+        except Exception as msg:
+            hdtv.ui.error(f"Failed to refresh watched spectra: {msg}")
+
+    def ResampleSpectrum(self, ID, nreplicas, refit=False):
+        """
+        Create nreplicas Poisson resampled copies of a spectrum as new
+        spectra. If refit is True, the stored fits of the spectrum are
+        copied to each replica and refitted.
+
+        Return IDs of the new spectra
+        """
+        spec = self.spectra.dict[ID]
+        replicas = spec.hist.PoissonReplicas(nreplicas)
+        sids = []
+        with LockViewport(self.window.viewport if self.window else None):
+            for n, counts in enumerate(replicas):
+                hist = copy.copy(spec.hist)
+                hist.counts = counts
+                replica = Spectrum(hist)
+                sid = self.spectra.Insert(replica, self.spectra.GetFreeID())
+                replica.color = hdtv.color.ColorForID(sid.major)
+                replica.typeStr = "spectrum, resampled"
+                replica.name = f"{spec.name} (replica {n})"
+                if refit:
+                    for fit in spec.dict.values():
+                        fit = copy.copy(fit)
+                        fit.FitPeakFunc(replica)
+                        replica.Insert(fit)
+                        if sid not in self.spectra.visible:
+                            fit.Hide()
+                sids.append(sid)
+        return sids
+
 
 class TvSpecInterface:
     """
@@ -339,8 +462,47 @@ class TvSpecInterface:
         parser.add_argument(
             "specid", nargs="*", help="id (or all, shown) of spectrum to update"
         )
+        parser.add_argument(
+            "-f",
+            "--force",
+            action="store_true",
+            default=False,
+            help="reload spectra and repeat their fits even if the files did not change",
+        )
         hdtv.cmdline.AddCommand(prog, self.SpectrumUpdate, parser=parser)
 
+        prog = "spectrum watch"
+        description = (
+            "Watch the files of spectra and update the spectra whenever the files "
+            "change, e.g. while they are written by a data acquisition. Fits whose "
+            "regions see new counts are repeated."
+        )
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument(
+            "specid", nargs="*", help="id of spectrum to watch (default: active)"
+        )
+        parser.add_argument(
+            "-s",
+            "--stop",
+            action="store_true",
+            default=False,
+            help="stop watching the spectra (default: all)",
+        )
+        hdtv.cmdline.AddCommand(prog, self.SpectrumWatch, parser=parser)
+
+        prog = "spectrum cache clear"
+        description = "Remove all parsed spectrum files from the on-disk cache"
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        hdtv.cmdline.AddCommand(prog, self.SpectrumCacheClear, parser=parser)
+
+        prog = "spectrum cache stats"
+        description = (
+            "Show size and usage of the on-disk cache of parsed spectrum files "
+            "(see options spec.cache and spec.cache.size)"
+        )
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        hdtv.cmdline.AddCommand(prog, self.SpectrumCacheStats, parser=parser)
+
         prog = "spectrum write"
         description = "Write a single spectrum to the filesystem (using libmfile)"
         parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
@@ -446,6 +608,26 @@ class TvSpecInterface:
             help="Specify a random distribution function (default: %(default)s)",
         )
         parser.add_argument("--seed", "-s", type=int, help="Set random number seed")
+        parser.add_argument(
+            "--replicas",
+            "-r",
+            type=int,
+            default=None,
+            help="Create this number of resampled copies as new spectra, leaving the original spectrum unchanged",
+        )
+        parser.add_argument(
+            "--refit",
+            action="store_true",
+            default=False,
+            help="Refit the stored fits of the spectrum on each replica (requires --replicas)",
+        )
+        parser.add_argument(
+            "--array",
+            "-a",
+            metavar="FILE",
+            default=None,
+            help="Instead of creating new spectra, write all replicas as one 2D array to FILE (numpy .npy format, requires --replicas)",
+        )
         hdtv.cmdline.AddCommand(
             prog,
             self.SpectrumResample,
@@ -780,7 +962,7 @@ class TvSpecInterface:
 
     def SpectrumResample(self, args):
         """
-        Rebin spectrum
+        Resample spectrum
         """
         if args.specid is None:
             if self.spectra.activeID is not None:
@@ -797,17 +979,26 @@ class TvSpecInterface:
             hdtv.ui.warning("Nothing to do")
             return
 
+        if args.replicas is None and (args.refit or args.array):
+            raise hdtv.cmdline.HDTVCommandError(
+                "--refit and --array require --replicas"
+            )
+        if args.replicas is not None and args.replicas < 1:
+            raise hdtv.cmdline.HDTVCommandError("Number of replicas must be positive")
+
         with hdtv.util.temp_seed(args.seed):
             for i in ids:
                 if i in list(self.spectra.dict.keys()):
                     spec = self.spectra.dict[i]
-                    sum_before = spec._hist.Integral()
-                    if args.distribution == "poisson":
-                        spec.Poisson()
-                    else:
+                    if args.distribution != "poisson":
                         raise hdtv.cmdline.HDTVCommandError(
                             f"Unknown probability distribution: {args.distribution}"
                         )
+                    if args.replicas is not None:
+                        self.ResampleReplicas(i, args.replicas, args.refit, args.array)
+                        continue
+                    sum_before = spec._hist.Integral()
+                    spec.Poisson()
                     sum_after = spec._hist.Integral()
                     change = 100 * (1 - sum_after / sum_before)
                     hdtv.ui.debug(
@@ -821,6 +1012,26 @@ class TvSpecInterface:
                         f"Cannot resample spectrum {i} (Does not exist)"
                     )
 
+    def ResampleReplicas(self, ID, nreplicas, refit=False, fname=None):
+        """
+        Create resampled replicas of a spectrum, either as new spectra or
+        as one 2D array (nreplicas x nbins) written to file
+        """
+        if fname is None:
+            sids = self.specIf.ResampleSpectrum(ID, nreplicas, refit=refit)
+            hdtv.ui.msg(
+                "Resampled spectrum %s into %s"
+                % (ID, ", ".join(str(sid) for sid in sids))
+            )
+            return
+        fname = os.path.expanduser(fname)
+        replicas = self.spectra.dict[ID].hist.PoissonReplicas(nreplicas)
+        try:
+            np.save(fname, replicas)
+        except OSError as msg:
+            raise hdtv.cmdline.HDTVCommandError(f"Failed to write replicas: {msg}")
+        hdtv.ui.msg(f"Wrote {nreplicas} replicas of spectrum {ID} to {fname}")
+
     def SpectrumHide(self, args):
         """
         Hides spectra
@@ -877,7 +1088,67 @@ class TvSpecInterface:
         if len(ids) == 0:
             hdtv.ui.warning("Nothing to do")
             return
-        self.spectra.RefreshObjects(ids)
+        if not args.force:
+            self.spectra.RefreshObjects(ids)
+            return
+        with LockViewport(self.spectra.viewport):
+            for ID in ids:
+                try:
+                    self.spectra.dict[ID].Refresh(force=True)
+                except KeyError:
+                    hdtv.ui.warning("ID %s not found" % ID)
+
+    def SpectrumWatch(self, args):
+        """
+        Start or stop watching spectra
+        """
+        if args.stop:
+            if len(args.specid) == 0:
+                self.specIf.UnwatchSpectra()
+            else:
+                self.specIf.UnwatchSpectra(
+                    hdtv.util.ID.ParseIds(args.specid, self.spectra)
+                )
+            if self.specIf.watched:
+                ids = ", ".join(str(ID) for ID in sorted(self.specIf.watched))
+                hdtv.ui.msg(f"Still watching spectra {ids}")
+            else:
+                hdtv.ui.msg("Not watching any spectra")
+            return
+
+        specids = args.specid or ["active"]
+        ids = hdtv.util.ID.ParseIds(specids, self.spectra)
+        if len(ids) == 0:
+            hdtv.ui.warning("Nothing to do")
+            return
+        watched = self.specIf.WatchSpectra(ids)
+        if watched:
+            interval = self.specIf.WatchInterval.Get()
+            hdtv.ui.msg(
+                "Watching spectra %s every %g s"
+                % (", ".join(str(ID) for ID in watched), interval)
+            )
+
+    def SpectrumCacheClear(self, args):
+        """
+        Clear on-disk cache of parsed spectra
+        """
+        entries = SpectrumCache.Stats()["entries"]
+        SpectrumCache.Clear()
+        hdtv.ui.msg(f"Removed {entries} cached spectra from {SpectrumCache.GetDir()}")
+
+    def SpectrumCacheStats(self, args):
+        """
+        Show statistics of the on-disk cache of parsed spectra
+        """
+        stats = SpectrumCache.Stats()
+        enabled = "enabled" if SpectrumCache.enabled.Get() else "disabled"
+        hdtv.ui.msg(
+            f"Spectrum cache in {SpectrumCache.GetDir()} ({enabled}):\n"
+            f"  {stats['entries']} entries, {stats['size'] / 1024**2:.1f} of "
+            f"{stats['limit'] / 1024**2:.1f} MiB\n"
+            f"  {stats['hits']} hits, {stats['misses']} misses in this session"
+        )
 
     def SpectrumWrite(self, args):
         """
@@ -0,0 +1,244 @@
+/*
+ * HDTV - A ROOT-based spectrum analysis software
+ *  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+ *
+ * This file is part of HDTV.
+ *
+ * HDTV is free software; you can redistribute it and/or modify it
+ * under the terms of the GNU General Public License as published by the
+ * Free Software Foundation; either version 2 of the License, or (at your
+ * option) any later version.
+ *
+ * HDTV is distributed in the hope that it will be useful, but WITHOUT
+ * ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+ * FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+ * for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with HDTV; if not, write to the Free Software Foundation,
+ * Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+ *
+ */
+
+#include "BinnedFit.hh"
+
+#include <cmath>
+
+#include <algorithm>
+#include <limits>
+#include <memory>
+
+#include <Math/Factory.h>
+#include <Math/Functor.h>
+#include <Math/IFunction.h>
+#include <Math/Minimizer.h>
+#include <Math/MinimizerOptions.h>
+#include <TError.h>
+#include <TF1.h>
+#include <TH1.h>
+
+namespace HDTV {
+namespace Fit {
+
+namespace {
+
+//! Objective function of a BinnedFit with gradient, for the minimizer
+class GradObjective : public ROOT::Math::IMultiGradFunction {
+public:
+  GradObjective(BinnedFit &fit, unsigned int npar) : fFit(fit), fNpar(npar) {}
+
+  ROOT::Math::IBaseFunctionMultiDim *Clone() const override { return new GradObjective(fFit, fNpar); }
+  unsigned int NDim() const override { return fNpar; }
+
+  void Gradient(const double *p, double *grad) const override { fFit.EvalGradient(p, grad); }
+  void FdF(const double *p, double &f, double *grad) const override { f = fFit.EvalGradient(p, grad); }
+
+private:
+  double DoEval(const double *p) const override { return fFit.Eval(p); }
+
+  double DoDerivative(const double *p, unsigned int icoord) const override {
+    std::vector<double> grad(fNpar);
+    fFit.EvalGradient(p, grad.data());
+    return grad[icoord];
+  }
+
+  BinnedFit &fFit;
+  unsigned int fNpar;
+};
+
+} // end anonymous namespace
+
+BinnedFit::BinnedFit(const TH1 &hist, const std::vector<std::pair<double, double>> &regions, bool likelihood)
+    : fLikelihood{likelihood}, fChisquare{std::numeric_limits<double>::quiet_NaN()} {
+  for (int bin = 1; bin <= hist.GetNbinsX(); ++bin) {
+    double x = hist.GetBinCenter(bin);
+    bool inside = std::any_of(regions.begin(), regions.end(), [x](const std::pair<double, double> &region) {
+      return x >= std::min(region.first, region.second) && x <= std::max(region.first, region.second);
+    });
+    if (!inside) {
+      continue;
+    }
+    double error = hist.GetBinError(bin);
+    // Like TH1::Fit(), empty bins are only used for likelihood fits
+    if (!likelihood && error <= 0.0) {
+      continue;
+    }
+    fX.push_back(x);
+    fX1.push_back(hist.GetBinLowEdge(bin));
+    fX2.push_back(hist.GetBinLowEdge(bin) + hist.GetBinWidth(bin));
+    fY.push_back(hist.GetBinContent(bin));
+    fWeight.push_back(likelihood ? 1.0 : 1.0 / (error * error));
+  }
+  fModelBuf.resize(fX.size());
+}
+
+//! Value of the objective function (chi^2) for parameters p. Leaves the
+//! model of all bins in fModelBuf.
+double BinnedFit::Eval(const double *p) {
+  const int nbins = fX.size();
+  fModel(fX.data(), fModelBuf.data(), nbins, p);
+
+  double chisquare = 0.0;
+  if (fLikelihood) {
+    for (int i = 0; i < nbins; ++i) {
+      double f = std::max(fModelBuf[i], std::numeric_limits<double>::min());
+      chisquare += f - fY[i];
+      if (fY[i] > 0.0) {
+        chisquare += fY[i] * std::log(fY[i] / f);
+      }
+    }
+    chisquare *= 2.0;
+  } else {
+    for (int i = 0; i < nbins; ++i) {
+      double res = fY[i] - fModelBuf[i];
+      chisquare += fWeight[i] * res * res;
+    }
+  }
+  return chisquare;
+}
+
+//! Value of the objective function for parameters p, storing its gradient in
+//! grad
+double BinnedFit::EvalGradient(const double *p, double *grad) {
+  const int nbins = fX.size();
+  const int npar = fGradBuf.size();
+  std::fill(grad, grad + npar, 0.0);
+  fModel(fX.data(), fModelBuf.data(), nbins, p);
+
+  double chisquare = 0.0;
+  for (int i = 0; i < nbins; ++i) {
+    double f = fModelBuf[i];
+    std::fill(fGradBuf.begin(), fGradBuf.end(), 0.0);
+    fGradient(&fX[i], p, fGradBuf.data());
+
+    // Derivative of the contribution of this bin with respect to f
+    double dchi;
+    if (fLikelihood) {
+      f = std::max(f, std::numeric_limits<double>::min());
+      chisquare += 2.0 * (f - fY[i]);
+      if (fY[i] > 0.0) {
+        chisquare += 2.0 * fY[i] * std::log(fY[i] / f);
+      }
+      dchi = 2.0 * (1.0 - fY[i] / f);
+    } else {
+      double res = fY[i] - f;
+      chisquare += fWeight[i] * res * res;
+      dchi = -2.0 * fWeight[i] * res;
+    }
+    for (int j = 0; j < npar; ++j) {
+      grad[j] += dchi * fGradBuf[j];
+    }
+  }
+  return chisquare;
+}
+
+//! Fit model to the histogram. Initial values and limits of the parameters
+//! are taken from func, and the results (values, errors, chi^2, NDF) are
+//! stored in it. Returns whether the minimization succeeded.
+bool BinnedFit::Fit(TF1 &func, Model model, Gradient gradient) {
+  const int npar = func.GetNpar();
+  fModel = std::move(model);
+  fGradient = std::move(gradient);
+  fGradBuf.assign(npar, 0.0);
+
+  std::unique_ptr<ROOT::Math::Minimizer> minimizer(ROOT::Math::Factory::CreateMinimizer(
+      ROOT::Math::MinimizerOptions::DefaultMinimizerType(), ROOT::Math::MinimizerOptions::DefaultMinimizerAlgo()));
+  if (minimizer == nullptr) {
+    Error("HDTV::Fit::BinnedFit::Fit", "Could not create minimizer %s",
+          ROOT::Math::MinimizerOptions::DefaultMinimizerType().c_str());
+    return false;
+  }
+
+  // Both objective functions are chi^2 like
+  minimizer->SetErrorDef(1.0);
+  minimizer->SetPrintLevel(0);
+
+  ROOT::Math::Functor objective(this, &BinnedFit::Eval, npar);
+  GradObjective gradObjective(*this, npar);
+  if (fGradient) {
+    minimizer->SetFunction(gradObjective);
+  } else {
+    minimizer->SetFunction(objective);
+  }
+
+  // Initial values, step sizes and limits as for TH1::Fit()
+  for (int i = 0; i < npar; ++i) {
+    double value = func.GetParameter(i);
+    double step = 0.3 * std::abs(value);
+    if (step <= 0.0) {
+      step = 0.1;
+    }
+    double lower, upper;
+    func.GetParLimits(i, lower, upper);
+    // TF1::FixParameter() sets lower >= upper (e.g. (1, 0) for a value of 0)
+    if (lower >= upper && (lower != 0.0 || upper != 0.0)) {
+      minimizer->SetFixedVariable(i, func.GetParName(i), value);
+    } else if (lower < upper) {
+      minimizer->SetLimitedVariable(i, func.GetParName(i), value, step, lower, upper);
+    } else {
+      minimizer->SetVariable(i, func.GetParName(i), value, step);
+    }
+  }
+
+  bool ok = minimizer->Minimize();
+  // Parabolic errors
+  ok = minimizer->Hesse() && ok;
+
+  const double *values = minimizer->X();
+  const double *errors = minimizer->Errors();
+  fCovar.assign(npar, std::vector<double>(npar));
+  for (int i = 0; i < npar; ++i) {
+    func.SetParameter(i, values[i]);
+    func.SetParError(i, errors[i]);
+    for (int j = 0; j < npar; ++j) {
+      fCovar[i][j] = minimizer->CovMatrix(i, j);
+    }
+  }
+
+  fChisquare = minimizer->MinValue();
+  func.SetChisquare(fChisquare);
+  func.SetNDF(GetNbins() - minimizer->NFree());
+  func.SetNumberFitPoints(GetNbins());
+
+  return ok;
+}
+
+//! Fit the averages of the model over the bins to the histogram, like
+//! TH1::Fit() with option "I", but with a model that integrates over all bins
+//! in one call (e.g. analytically) instead of numerical integration. No
+//! gradient is used.
+bool BinnedFit::FitIntegral(TF1 &func, BinModel model) {
+  return Fit(func, [this, model](const double * /*x*/, double *out, int n, const double *p) {
+    model(fX1.data(), fX2.data(), out, n, p);
+  });
+}
+
+double BinnedFit::GetCovariance(int i, int j) const {
+  if (i < 0 || j < 0 || i >= static_cast<int>(fCovar.size()) || j >= static_cast<int>(fCovar.size())) {
+    return std::numeric_limits<double>::quiet_NaN();
+  }
+  return fCovar[i][j];
+}
+
+} // end namespace Fit
+} // end namespace HDTV
@@ -0,0 +1,77 @@
+/*
+ * HDTV - A ROOT-based spectrum analysis software
+ *  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+ *
+ * This file is part of HDTV.
+ *
+ * HDTV is free software; you can redistribute it and/or modify it
+ * under the terms of the GNU General Public License as published by the
+ * Free Software Foundation; either version 2 of the License, or (at your
+ * option) any later version.
+ *
+ * HDTV is distributed in the hope that it will be useful, but WITHOUT
+ * ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+ * FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+ * for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with HDTV; if not, write to the Free Software Foundation,
+ * Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+ *
+ */
+
+#ifndef __BinnedFit_h__
+#define __BinnedFit_h__
+
+#include <functional>
+#include <utility>
+#include <vector>
+
+class TF1;
+class TH1;
+
+namespace HDTV {
+namespace Fit {
+
+//! Binned fit of a model function to a histogram, without TH1::Fit()
+/** The bins of the fit regions (all bins with their center inside one of the
+ * regions) are copied from the histogram once. The model is evaluated for all
+ * of them into a preallocated buffer, and the Neyman chi^2 or the Poisson
+ * likelihood ratio (Baker-Cousins chi^2) is minimized by calling
+ * ROOT::Math::Minimizer directly, so that no global ROOT fitter is involved.
+ */
+class BinnedFit {
+public:
+  //! Stores the model at the n positions x in out
+  using Model = std::function<void(const double *x, double *out, int n, const double *p)>;
+  //! Adds the derivatives of the model with respect to the parameters to grad
+  using Gradient = std::function<void(const double *x, const double *p, double *grad)>;
+  //! Stores the averages of the model over the n bins [x1, x2] in out
+  using BinModel = std::function<void(const double *x1, const double *x2, double *out, int n, const double *p)>;
+
+  BinnedFit(const TH1 &hist, const std::vector<std::pair<double, double>> &regions, bool likelihood);
+
+  bool Fit(TF1 &func, Model model, Gradient gradient = nullptr);
+  bool FitIntegral(TF1 &func, BinModel model);
+
+  int GetNbins() const { return fX.size(); }
+  double GetChisquare() const { return fChisquare; }
+  double GetCovariance(int i, int j) const;
+
+  double Eval(const double *p);
+  double EvalGradient(const double *p, double *grad);
+
+private:
+  bool fLikelihood;
+  std::vector<double> fX, fX1, fX2, fY, fWeight;
+  std::vector<double> fModelBuf, fGradBuf;
+  std::vector<std::vector<double>> fCovar;
+  double fChisquare;
+  Model fModel;
+  Gradient fGradient;
+};
+
+} // end namespace Fit
+} // end namespace HDTV
+
+#endif
@@ -137,6 +137,9 @@ TF1 *EEPeak::GetPeakFunc() {
 //!  (see email from Oleksiy Burda <burda@ikp.tu-darmstadt.de>, 2008-12-05)
 void EEPeak::StoreIntegral() {
   // Get fitter
+  // NOTE: This relies on the current fitter being thread-local, as it is in
+  // ROOT 6 (TTHREAD_TLS): with thread safety enabled, fits running
+  // concurrently in other threads (see Fitter.FitMany()) do not replace it.
   TVirtualFitter *fitter = TVirtualFitter::GetFitter();
   if (fitter == nullptr) {
     Error("EEPeak::StoreIntegral", "No existing fitter");
@@ -127,6 +127,9 @@ void ExpBg::Fit(TH1 &hist) {
   fChisquare = fitFunc.GetChisquare();
 
   // Copy covariance matrix (needed for error evaluation)
+  // NOTE: This relies on the current fitter being thread-local, as it is in
+  // ROOT 6 (TTHREAD_TLS): with thread safety enabled, fits running
+  // concurrently in other threads (see Fitter.FitMany()) do not replace it.
   TVirtualFitter *fitter = TVirtualFitter::GetFitter();
   if (fitter == nullptr) {
     Error("ExpBg::Fit", "No existing fitter after fit");
@@ -32,23 +32,26 @@
 #include <TH1.h>
 #include <TVirtualFitter.h>
 
+#include "BinnedFit.hh"
 #include "Util.hh"
 
 namespace HDTV {
 namespace Fit {
 
-PolyBg::PolyBg(int nParams, const Option<bool> integrate, const Option<std::string> likelihood) {
+PolyBg::PolyBg(int nParams, const Option<bool> integrate, const Option<std::string> likelihood,
+               const Option<std::string> engine) {
   //! Constructor
 
   fnParams = nParams;
   fIntegrate = integrate;
   fLikelihood = likelihood;
+  fEngine = engine;
   fChisquare = std::numeric_limits<double>::quiet_NaN();
 }
 
 PolyBg::PolyBg(const PolyBg &src)
     : fBgRegions(src.fBgRegions), fnParams(src.fnParams), fIntegrate(src.fIntegrate), fLikelihood(src.fLikelihood),
-      fChisquare(src.fChisquare), fCovar(src.fCovar) {
+      fEngine(src.fEngine), fChisquare(src.fChisquare), fCovar(src.fCovar) {
   //! Copy constructor
 
   if (src.fFunc != nullptr) {
@@ -75,6 +78,7 @@ PolyBg &PolyBg::operator=(const PolyBg &src) {
   fChisquare = src.fChisquare;
   fCovar = src.fCovar;
   fIntegrate = src.fIntegrate, fLikelihood = src.fLikelihood;
+  fEngine = src.fEngine;
 
   fFunc = std::make_unique<TF1>(GetFuncUniqueName("b", this).c_str(), this, &PolyBg::_Eval, src.fFunc->GetXmin(),
                                 src.fFunc->GetXmax(), fnParams + 1, "PolyBg", "_Eval");
@@ -94,6 +98,11 @@ void PolyBg::Fit(TH1 &hist) {
     return;
   }
 
+  if (fEngine.GetValue() == "direct") {
+    _FitDirect(hist);
+    return;
+  }
+
   // Create function to be used for fitting
   // Note that a polynomial of degree N has N+1 parameters
   TF1 fitFunc(GetFuncUniqueName("b_fit", this).c_str(), this, &PolyBg::_EvalRegion, GetMin(), GetMax(), fnParams + 1,
@@ -112,6 +121,9 @@ void PolyBg::Fit(TH1 &hist) {
   fChisquare = fitFunc.GetChisquare();
 
   // Copy covariance matrix (needed for error evaluation)
+  // NOTE: This relies on the current fitter being thread-local, as it is in
+  // ROOT 6 (TTHREAD_TLS): with thread safety enabled, fits running
+  // concurrently in other threads (see Fitter.FitMany()) do not replace it.
   TVirtualFitter *fitter = TVirtualFitter::GetFitter();
   if (fitter == nullptr) {
     Error("PolyBg::Fit", "No existing fitter after fit");
@@ -134,6 +146,71 @@ void PolyBg::Fit(TH1 &hist) {
   }
 }
 
+void PolyBg::_FitDirect(TH1 &hist) {
+  //! Fit the background function to the histogram hist with BinnedFit
+  //! instead of TH1::Fit(), which also provides the covariance matrix
+  //! without a global fitter
+
+  std::vector<std::pair<double, double>> regions;
+  for (auto iter = fBgRegions.begin(); iter != fBgRegions.end() && std::next(iter) != fBgRegions.end();
+       std::advance(iter, 2)) {
+    regions.emplace_back(*iter, *std::next(iter));
+  }
+
+  fFunc = std::make_unique<TF1>(GetFuncUniqueName("b", this).c_str(), this, &PolyBg::_Eval, GetMin(), GetMax(),
+                                fnParams, "PolyBg", "_Eval");
+  for (int i = 0; i < fnParams; ++i) {
+    fFunc->SetParameter(i, 0.0);
+  }
+
+  BinnedFit fit(hist, regions, fLikelihood.GetValue() == "poisson");
+  if (fIntegrate.GetValue()) {
+    // Averages over the bins from the antiderivative of the polynomial
+    fit.FitIntegral(*fFunc, [this](const double *x1, const double *x2, double *out, int n, const double *p) {
+      auto primitive = [this, p](double x) {
+        double sum = 0.0;
+        for (int i = fnParams - 1; i >= 0; i--) {
+          sum = sum * x + p[i] / (i + 1);
+        }
+        return sum * x;
+      };
+      for (int j = 0; j < n; ++j) {
+        out[j] = (primitive(x2[j]) - primitive(x1[j])) / (x2[j] - x1[j]);
+      }
+    });
+  } else {
+    fit.Fit(
+        *fFunc,
+        [this](const double *x, double *out, int n, const double *p) {
+          for (int j = 0; j < n; ++j) {
+            double bg = 0.0;
+            for (int i = fnParams - 1; i >= 0; i--) {
+              bg = bg * x[j] + p[i];
+            }
+            out[j] = bg;
+          }
+        },
+        [this](const double *x, const double *p, double *grad) {
+          double xi = 1.0;
+          for (int i = 0; i < fnParams; ++i) {
+            grad[i] += xi;
+            xi *= x[0];
+          }
+        });
+  }
+
+  // Copy chisquare
+  fChisquare = fit.GetChisquare();
+
+  // Copy covariance matrix (needed for error evaluation)
+  fCovar = std::vector<std::vector<double>>(fnParams, std::vector<double>(fnParams));
+  for (int i = 0; i < fnParams; ++i) {
+    for (int j = 0; j < fnParams; ++j) {
+      fCovar[i][j] = fit.GetCovariance(i, j);
+    }
+  }
+}
+
 bool PolyBg::Restore(const TArrayD &values, const TArrayD &errors, double ChiSquare) {
   //! Restore state of a PolyBg object from saved values.
   //! NOTE: The covariance matrix is currently NOT restored, so EvalError()
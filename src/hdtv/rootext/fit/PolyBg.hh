@@ -46,7 +46,8 @@ namespace Fit {
 class PolyBg : public Background {
 public:
   explicit PolyBg(int nParams = 2, Option<bool> integrate = Option<bool>{false},
-                  Option<std::string> likelihood = Option<std::string>{"normal"});
+                  Option<std::string> likelihood = Option<std::string>{"normal"},
+                  Option<std::string> engine = Option<std::string>{"root"});
   PolyBg(const PolyBg &src);
   PolyBg &operator=(const PolyBg &src);
 
@@ -79,11 +80,13 @@ public:
 private:
   double _EvalRegion(double *x, double *p);
   double _Eval(double *x, double *p);
+  void _FitDirect(TH1 &hist);
 
   std::list<double> fBgRegions;
   int fnParams;
   Option<bool> fIntegrate;
   Option<std::string> fLikelihood;
+  Option<std::string> fEngine;
 
   std::unique_ptr<TF1> fFunc;
   double fChisquare;
@@ -25,13 +25,19 @@
 #include <cmath>
 
 #include <algorithm>
+#include <limits>
 #include <memory>
 #include <numeric>
 
+#include <Fit/BinData.h>
+#include <Fit/Fitter.h>
+#include <HFitInterface.h>
+#include <Math/IParamFunction.h>
 #include <TError.h>
 #include <TF1.h>
 #include <TH1.h>
 
+#include "BinnedFit.hh"
 #include "Util.hh"
 
 namespace HDTV {
@@ -50,15 +56,17 @@ TheuerkaufPeak::TheuerkaufPeak(const Param &pos, const Param &vol, const Param &
       fSH{sh ? sh : Param::Fixed(0.0)}, fSW{sw ? sw : Param::Fixed(1.0)}, fHasLeftTail{tl},
       fHasRightTail{tr}, fHasStep{sh}, fFunc{nullptr}, fCachedNorm{std::numeric_limits<double>::quiet_NaN()},
       fCachedSigma{std::numeric_limits<double>::quiet_NaN()}, fCachedTL{std::numeric_limits<double>::quiet_NaN()},
-      fCachedTR{std::numeric_limits<double>::quiet_NaN()} {}
+      fCachedTR{std::numeric_limits<double>::quiet_NaN()}, fCachedDVolSigma{std::numeric_limits<double>::quiet_NaN()},
+      fCachedDVolTL{std::numeric_limits<double>::quiet_NaN()}, fCachedDVolTR{std::numeric_limits<double>::quiet_NaN()} {
+}
 
 //! Copy constructor
 //! Does not copy the fPeakFunc pointer, it will be re-generated when needed.
 TheuerkaufPeak::TheuerkaufPeak(const TheuerkaufPeak &src)
     : fPos{src.fPos}, fVol{src.fVol}, fSigma{src.fSigma}, fTL{src.fTL}, fTR{src.fTR}, fSH{src.fSH}, fSW{src.fSW},
       fHasLeftTail{src.fHasLeftTail}, fHasRightTail{src.fHasRightTail}, fHasStep{src.fHasStep}, fFunc{src.fFunc},
-      fCachedNorm{src.fCachedNorm}, fCachedSigma{src.fCachedSigma}, fCachedTL{src.fCachedTL}, fCachedTR{src.fCachedTR} {
-}
+      fCachedNorm{src.fCachedNorm}, fCachedSigma{src.fCachedSigma}, fCachedTL{src.fCachedTL}, fCachedTR{src.fCachedTR},
+      fCachedDVolSigma{src.fCachedDVolSigma}, fCachedDVolTL{src.fCachedDVolTL}, fCachedDVolTR{src.fCachedDVolTR} {}
 
 //! Assignment operator (handles self-assignment implicitly)
 TheuerkaufPeak &TheuerkaufPeak::operator=(const TheuerkaufPeak &src) {
@@ -77,6 +85,9 @@ TheuerkaufPeak &TheuerkaufPeak::operator=(const TheuerkaufPeak &src) {
   fCachedSigma = src.fCachedSigma;
   fCachedTL = src.fCachedTL;
   fCachedTR = src.fCachedTR;
+  fCachedDVolSigma = src.fCachedDVolSigma;
+  fCachedDVolTL = src.fCachedDVolTL;
+  fCachedDVolTR = src.fCachedDVolTR;
 
   // Do not copy the fPeakFunc pointer, it will be generated when needed.
   fPeakFunc.reset(nullptr);
@@ -165,33 +176,241 @@ double TheuerkaufPeak::EvalStep(const double *x, const double *p) const {
   }
 }
 
+//! Add the peak function (including the step) at the n positions x to out.
+//! Everything that only depends on the parameters, in particular the
+//! normalization, is calculated once for all positions.
+void TheuerkaufPeak::EvalRegion(const double *x, double *out, int n, const double *p) const {
+  const double pos = fPos.Value(p);
+  const double sigma = fSigma.Value(p);
+  const double tl = fTL.Value(p);
+  const double tr = fTR.Value(p);
+  const double amp = fVol.Value(p) * GetNorm(sigma, tl, tr);
+  const double c = 1.0 / (sigma * sigma);
+
+  // Boundaries of the gaussian part (see EvalNoStep())
+  const double left = fHasLeftTail ? -tl : -std::numeric_limits<double>::infinity();
+  const double right = fHasRightTail ? tr : std::numeric_limits<double>::infinity();
+
+  for (int i = 0; i < n; ++i) {
+    double dx = x[i] - pos;
+    double _x;
+    if (dx < left) {
+      _x = tl * c * (dx + tl / 2.0);
+    } else if (dx < right) {
+      _x = -dx * dx * c / 2.0;
+    } else {
+      _x = -tr * c * (dx - tr / 2.0);
+    }
+    out[i] += amp * std::exp(_x);
+  }
+
+  if (fHasStep) {
+    const double sh = amp * fSH.Value(p);
+    const double a = fSW.Value(p) / (std::sqrt(2.) * sigma);
+    for (int i = 0; i < n; ++i) {
+      out[i] += sh * (M_PI / 2. + std::atan(a * (x[i] - pos)));
+    }
+  }
+}
+
+//! Add the averages of the peak function (including the step) over the n bins
+//! [x1, x2] to out, as used by TH1::Fit() with option "I". The peak shape and
+//! the step function are integrated analytically.
+void TheuerkaufPeak::EvalBinAverages(const double *x1, const double *x2, double *out, int n, const double *p) const {
+  const double pos = fPos.Value(p);
+  const double sigma = fSigma.Value(p);
+  const double tl = fTL.Value(p);
+  const double tr = fTR.Value(p);
+  const double amp = fVol.Value(p) * GetNorm(sigma, tl, tr);
+  const double sigma2 = sigma * sigma;
+  const double s = std::sqrt(2.) * sigma;
+
+  // Boundaries of the gaussian part (see EvalNoStep())
+  const double left = fHasLeftTail ? -tl : -std::numeric_limits<double>::infinity();
+  const double right = fHasRightTail ? tr : std::numeric_limits<double>::infinity();
+
+  // Integral of the peak shape without normalization from a to b (relative
+  // to pos), see also GetNorm()
+  auto integral = [&](double a, double b) {
+    double sum = 0.0;
+    if (a < left) {
+      double c = std::min(b, left);
+      sum += sigma2 / tl * (std::exp(tl / sigma2 * (c + tl / 2.0)) - std::exp(tl / sigma2 * (a + tl / 2.0)));
+    }
+    double c = std::max(a, left);
+    double d = std::min(b, right);
+    if (c < d) {
+      // Use erfc() on the flanks to avoid cancellation
+      if (c >= 0.0) {
+        sum += std::sqrt(M_PI / 2.0) * sigma * (std::erfc(c / s) - std::erfc(d / s));
+      } else if (d <= 0.0) {
+        sum += std::sqrt(M_PI / 2.0) * sigma * (std::erfc(-d / s) - std::erfc(-c / s));
+      } else {
+        sum += std::sqrt(M_PI / 2.0) * sigma * (std::erf(d / s) - std::erf(c / s));
+      }
+    }
+    if (b > right) {
+      double c = std::max(a, right);
+      sum += sigma2 / tr * (std::exp(-tr / sigma2 * (c - tr / 2.0)) - std::exp(-tr / sigma2 * (b - tr / 2.0)));
+    }
+    return sum;
+  };
+
+  // Antiderivative of the step function without amplitude (see EvalStep())
+  const double sh = fHasStep ? fSH.Value(p) : 0.0;
+  const double alpha = fHasStep ? fSW.Value(p) / s : 0.0;
+  auto step = [alpha](double u) {
+    double result = M_PI / 2. * u;
+    if (alpha != 0.0) {
+      result += u * std::atan(alpha * u) - std::log1p(alpha * alpha * u * u) / (2.0 * alpha);
+    }
+    return result;
+  };
+
+  for (int i = 0; i < n; ++i) {
+    double a = x1[i] - pos;
+    double b = x2[i] - pos;
+    double sum = integral(a, b);
+    if (fHasStep) {
+      sum += sh * (step(b) - step(a));
+    }
+    out[i] += amp * sum / (b - a);
+  }
+}
+
+namespace {
+
+//! Add value to the derivative with respect to param, if it is free
+inline void AddGrad(const Param &param, double *grad, double value) {
+  if (param.IsFree()) {
+    grad[param._Id()] += value;
+  }
+}
+
+//! Average of func over [x1, x2] from the three point Gauss-Legendre rule,
+//! which is exact for polynomials up to fifth degree
+template <class Func> inline double BinAverage(Func func, double x1, double x2) {
+  const double center = (x1 + x2) / 2.0;
+  const double offset = std::sqrt(0.6) * (x2 - x1) / 2.0;
+  return (5.0 * func(center - offset) + 8.0 * func(center) + 5.0 * func(center + offset)) / 18.0;
+}
+
+} // end anonymous namespace
+
+//! Add the derivatives of the peak function (including the step) with respect
+//! to its free parameters to grad. Parameters shared by several peaks (e.g.
+//! an equal width) sum up the derivatives of all of them.
+void TheuerkaufPeak::EvalGrad(const double *x, const double *p, double *grad) const {
+  double dx = *x - fPos.Value(p);
+  double vol = fVol.Value(p);
+  double sigma = fSigma.Value(p);
+  double tl = fTL.Value(p);
+  double tr = fTR.Value(p);
+  double norm = GetNorm(sigma, tl, tr);
+  double sigma2 = sigma * sigma;
+
+  // Relative derivatives of norm, d(norm)/dq / norm = -norm * d(1/norm)/dq,
+  // from the derivatives of 1/norm cached by GetNorm(), so that they are only
+  // recalculated when the parameters change, not for every bin
+  double rNormSigma = -norm * fCachedDVolSigma;
+  double rNormTL = -norm * fCachedDVolTL;
+  double rNormTR = -norm * fCachedDVolTR;
+
+  // Exponent of the peak function (see EvalNoStep()) and its derivatives
+  // with respect to dx and the tails. Its derivative with respect to sigma
+  // is -2 * _x / sigma in all three parts.
+  double _x, dX, dXTL = 0.0, dXTR = 0.0;
+  if (dx < -tl && fHasLeftTail) {
+    _x = tl / sigma2 * (dx + tl / 2.0);
+    dX = tl / sigma2;
+    dXTL = (dx + tl) / sigma2;
+  } else if (dx < tr || !fHasRightTail) {
+    _x = -dx * dx / (2.0 * sigma2);
+    dX = -dx / sigma2;
+  } else {
+    _x = -tr / sigma2 * (dx - tr / 2.0);
+    dX = -tr / sigma2;
+    dXTR = -(dx - tr) / sigma2;
+  }
+
+  double shape = norm * std::exp(_x);
+  double f = vol * shape;
+  AddGrad(fPos, grad, -f * dX);
+  AddGrad(fVol, grad, shape);
+  AddGrad(fSigma, grad, f * (rNormSigma - 2.0 * _x / sigma));
+  if (fHasLeftTail) {
+    AddGrad(fTL, grad, f * (rNormTL + dXTL));
+  }
+  if (fHasRightTail) {
+    AddGrad(fTR, grad, f * (rNormTR + dXTR));
+  }
+
+  // Step function (see EvalStep())
+  if (fHasStep) {
+    double sh = fSH.Value(p);
+    double sw = fSW.Value(p);
+    double a = sw * dx / (std::sqrt(2.) * sigma);
+    double step = M_PI / 2. + std::atan(a);
+    // Derivative with respect to a
+    double dStep = vol * norm * sh / (1.0 + a * a);
+    double g = vol * norm * sh * step;
+
+    AddGrad(fPos, grad, -dStep * sw / (std::sqrt(2.) * sigma));
+    AddGrad(fVol, grad, norm * sh * step);
+    AddGrad(fSigma, grad, g * rNormSigma - dStep * a / sigma);
+    AddGrad(fSH, grad, vol * norm * step);
+    AddGrad(fSW, grad, dStep * dx / (std::sqrt(2.) * sigma));
+    if (fHasLeftTail) {
+      AddGrad(fTL, grad, g * rNormTL);
+    }
+    if (fHasRightTail) {
+      AddGrad(fTR, grad, g * rNormTR);
+    }
+  }
+}
+
 double TheuerkaufPeak::GetNorm(double sigma, double tl, double tr) const {
   if (fCachedSigma == sigma && fCachedTL == tl && fCachedTR == tr) {
     return fCachedNorm;
   }
 
   double vol;
+  // Derivatives of vol, for the gradient (see EvalGrad())
+  double dVolSigma, dVolTL = 0.0, dVolTR = 0.0;
 
   // Contribution from left tail + left half of truncated gaussian
   if (fHasLeftTail) {
-    vol = (sigma * sigma) / tl * std::exp(-(tl * tl) / (2.0 * sigma * sigma));
-    vol += std::sqrt(M_PI / 2.0) * sigma * std::erf(tl / (std::sqrt(2.0) * sigma));
+    double eTL = std::exp(-(tl * tl) / (2.0 * sigma * sigma));
+    double erfTL = std::erf(tl / (std::sqrt(2.0) * sigma));
+    vol = (sigma * sigma) / tl * eTL;
+    vol += std::sqrt(M_PI / 2.0) * sigma * erfTL;
+    dVolSigma = 2.0 * sigma / tl * eTL + std::sqrt(M_PI / 2.0) * erfTL;
+    dVolTL = -(sigma * sigma) / (tl * tl) * eTL;
   } else {
     vol = std::sqrt(M_PI / 2.0) * sigma;
+    dVolSigma = std::sqrt(M_PI / 2.0);
   }
 
   // Contribution from right tail + right half of truncated gaussian
   if (fHasRightTail) {
-    vol += (sigma * sigma) / tr * std::exp(-(tr * tr) / (2.0 * sigma * sigma));
-    vol += std::sqrt(M_PI / 2.0) * sigma * std::erf(tr / (std::sqrt(2.0) * sigma));
+    double eTR = std::exp(-(tr * tr) / (2.0 * sigma * sigma));
+    double erfTR = std::erf(tr / (std::sqrt(2.0) * sigma));
+    vol += (sigma * sigma) / tr * eTR;
+    vol += std::sqrt(M_PI / 2.0) * sigma * erfTR;
+    dVolSigma += 2.0 * sigma / tr * eTR + std::sqrt(M_PI / 2.0) * erfTR;
+    dVolTR = -(sigma * sigma) / (tr * tr) * eTR;
   } else {
     vol += std::sqrt(M_PI / 2.0) * sigma;
+    dVolSigma += std::sqrt(M_PI / 2.0);
   }
 
   fCachedSigma = sigma;
   fCachedTL = tl;
   fCachedTR = tr;
   fCachedNorm = 1. / vol;
+  fCachedDVolSigma = dVolSigma;
+  fCachedDVolTL = dVolTL;
+  fCachedDVolTR = dVolTR;
 
   return fCachedNorm;
 }
@@ -224,6 +443,98 @@ double TheuerkaufFitter::Eval(const double *x, const double *p) const {
                          [x, p](double sum, const TheuerkaufPeak &peak) { return sum + peak.Eval(x, p); });
 }
 
+//! Private: evaluate the fit function at the n positions x (e.g. all bins of
+//! the fit region) and store the result in out. Per-peak constants are
+//! calculated once per call instead of once per position.
+void TheuerkaufFitter::EvalRegion(const double *x, double *out, int n, const double *p) const {
+  const double *bgBegin = p + fNumParams - std::max(fIntNParams, 0);
+  for (int i = 0; i < n; ++i) {
+    // Background function, if it has been given, and internal background
+    double sum = fBackground ? fBackground->Eval(x[i]) : 0.0;
+    out[i] = sum + std::accumulate(std::reverse_iterator<const double *>(p + fNumParams),
+                                   std::reverse_iterator<const double *>(bgBegin), 0.0,
+                                   [&x, i](double bg, double param) { return bg * x[i] + param; });
+  }
+
+  for (const auto &peak : fPeaks) {
+    peak.EvalRegion(x, out, n, p);
+  }
+}
+
+//! Private: evaluate the averages of the fit function over the n bins
+//! [x1, x2] and store them in out. The internal background and the peaks are
+//! integrated analytically, the (fixed) external background numerically.
+void TheuerkaufFitter::EvalBinAverages(const double *x1, const double *x2, double *out, int n, const double *p) const {
+  const int nbg = std::max(fIntNParams, 0);
+  const double *bg = p + fNumParams - nbg;
+
+  // Antiderivative of the internal background
+  auto primitive = [bg, nbg](double x) {
+    double sum = 0.0;
+    for (int k = nbg - 1; k >= 0; --k) {
+      sum = sum * x + bg[k] / (k + 1);
+    }
+    return sum * x;
+  };
+
+  for (int i = 0; i < n; ++i) {
+    double sum = fBackground ? BinAverage([this](double x) { return fBackground->Eval(x); }, x1[i], x2[i]) : 0.0;
+    out[i] = sum + (primitive(x2[i]) - primitive(x1[i])) / (x2[i] - x1[i]);
+  }
+
+  for (const auto &peak : fPeaks) {
+    peak.EvalBinAverages(x1, x2, out, n, p);
+  }
+}
+
+//! Private: add the derivatives of the fit function with respect to the
+//! parameters to grad
+void TheuerkaufFitter::EvalGrad(const double *x, const double *p, double *grad) const {
+  // Internal background: the derivative with respect to the coefficient of
+  // x^i is x^i (the external background has no free parameters)
+  double xi = 1.0;
+  for (int i = fNumParams - std::max(fIntNParams, 0); i < fNumParams; ++i) {
+    grad[i] += xi;
+    xi *= *x;
+  }
+
+  for (const auto &peak : fPeaks) {
+    peak.EvalGrad(x, p, grad);
+  }
+}
+
+//! Fit function for ROOT::Fit::Fitter, which provides the analytic gradient
+//! of TheuerkaufFitter::Eval() with respect to the parameters to the
+//! minimizer, instead of letting it calculate finite differences.
+class TheuerkaufFitter::GradFunc : public ROOT::Math::IParamMultiGradFunction {
+public:
+  GradFunc(const TheuerkaufFitter &fitter, const double *params)
+      : fFitter(fitter), fParams(params, params + fitter.fNumParams) {}
+
+  ROOT::Math::IBaseFunctionMultiDim *Clone() const override { return new GradFunc(fFitter, fParams.data()); }
+  unsigned int NDim() const override { return 1; }
+  unsigned int NPar() const override { return fParams.size(); }
+  const double *Parameters() const override { return fParams.data(); }
+  void SetParameters(const double *p) override { std::copy(p, p + fParams.size(), fParams.begin()); }
+
+  void ParameterGradient(const double *x, const double *p, double *grad) const override {
+    std::fill(grad, grad + fParams.size(), 0.0);
+    fFitter.EvalGrad(x, p, grad);
+  }
+
+private:
+  double DoEvalPar(const double *x, const double *p) const override { return fFitter.Eval(x, p); }
+
+  double DoParameterDerivative(const double *x, const double *p, unsigned int ipar) const override {
+    std::vector<double> grad(fParams.size());
+    ParameterGradient(x, p, grad.data());
+    return grad[ipar];
+  }
+
+  const TheuerkaufFitter &fFitter;
+  std::vector<double> fParams;
+};
+
 double TheuerkaufFitter::EvalBg(const double *x, const double *p) const {
   //! Private: evaluation function for background
 
@@ -300,6 +611,17 @@ void TheuerkaufFitter::Fit(TH1 &hist, int intNParams) {
   _Fit(hist);
 }
 
+//! Use the given coefficients (e.g. of a previous fit) as initial values for
+//! the internal background, instead of estimating them from the histogram.
+//! Ignored if the number of coefficients does not match the internal
+//! background of the fit.
+void TheuerkaufFitter::SetIntBgStart(const TArrayD &values) {
+  fIntBgStart.resize(values.GetSize());
+  for (int i = 0; i < values.GetSize(); ++i) {
+    fIntBgStart[i] = values[i];
+  }
+}
+
 //! Private: worker function to actually do the fit
 void TheuerkaufFitter::_Fit(TH1 &hist) {
   // Allocate additional parameters for internal polynomial background
@@ -356,11 +678,18 @@ void TheuerkaufFitter::_Fit(TH1 &hist) {
       }
     }
 
-    // Set background parameters of sum function
-    fSumFunc->SetParameter(fNumParams - fIntNParams, intBg0);
-    if (fIntNParams >= 2) {
-      for (int i = fNumParams - fIntNParams + 1; i < fNumParams; ++i) {
-        fSumFunc->SetParameter(i, 0.0);
+    // Set background parameters of sum function (from a previous fit, if
+    // given, see SetIntBgStart())
+    if (fIntBgStart.size() == static_cast<std::size_t>(fIntNParams)) {
+      for (int i = 0; i < fIntNParams; ++i) {
+        fSumFunc->SetParameter(fNumParams - fIntNParams + i, fIntBgStart[i]);
+      }
+    } else {
+      fSumFunc->SetParameter(fNumParams - fIntNParams, intBg0);
+      if (fIntNParams >= 2) {
+        for (int i = fNumParams - fIntNParams + 1; i < fNumParams; ++i) {
+          fSumFunc->SetParameter(i, 0.0);
+        }
       }
     }
   }
@@ -520,9 +849,16 @@ void TheuerkaufFitter::_Fit(TH1 &hist) {
 
   if (!fDebugShowInipar) {
     // Now, do the fit
-    char options[7];
-    sprintf(options, "RQNM%s%s", fIntegrate.GetValue() ? "I" : "", fLikelihood.GetValue() == "poisson" ? "L" : "");
-    hist.Fit(fSumFunc.get(), options);
+    if (fEngine.GetValue() == "direct") {
+      _FitDirect(hist);
+    } else if (fGradient.GetValue() && !fIntegrate.GetValue()) {
+      // ROOT does not support gradients for bin integrals
+      _FitGrad(hist);
+    } else {
+      char options[7];
+      sprintf(options, "RQNM%s%s", fIntegrate.GetValue() ? "I" : "", fLikelihood.GetValue() == "poisson" ? "L" : "");
+      hist.Fit(fSumFunc.get(), options);
+    }
 
     // Store Chi^2
     fChisquare = fSumFunc->GetChisquare();
@@ -532,6 +868,66 @@ void TheuerkaufFitter::_Fit(TH1 &hist) {
   fFinal = true;
 }
 
+//! Private: do the fit with ROOT::Fit::Fitter, using the analytic gradient of
+//! the fit function. Mirrors what TH1::Fit() does for the options used in
+//! _Fit(), and stores the result in fSumFunc.
+void TheuerkaufFitter::_FitGrad(TH1 &hist) {
+  bool likelihood = fLikelihood.GetValue() == "poisson";
+
+  ROOT::Fit::DataOptions opt;
+  // Empty bins carry information in likelihood fits only
+  opt.fUseEmpty = likelihood;
+  ROOT::Fit::DataRange range(fMin, fMax);
+  ROOT::Fit::BinData data(opt, range);
+  ROOT::Fit::FillData(data, &hist);
+
+  GradFunc func(*this, fSumFunc->GetParameters());
+  ROOT::Fit::Fitter fitter;
+  fitter.SetFunction(func, true);
+
+  // Initial values, step sizes and limits as set for fSumFunc
+  for (int i = 0; i < fNumParams; ++i) {
+    double value = fSumFunc->GetParameter(i);
+    double step = 0.3 * std::abs(value);
+    auto &settings = fitter.Config().ParSettings(i);
+    settings.Set(fSumFunc->GetParName(i), value, step > 0.0 ? step : 0.1);
+    double lower, upper;
+    fSumFunc->GetParLimits(i, lower, upper);
+    if (lower < upper) {
+      settings.SetLimits(lower, upper);
+    }
+  }
+
+  if (likelihood) {
+    fitter.LikelihoodFit(data);
+  } else {
+    fitter.Fit(data);
+  }
+
+  // Sets parameters, errors and Chi^2 of the sum function
+  fSumFunc->SetFitResult(fitter.Result());
+}
+
+//! Private: do the fit with BinnedFit instead of TH1::Fit(), using analytic
+//! bin integrals or the analytic gradient if requested. Stores the result in
+//! fSumFunc.
+void TheuerkaufFitter::_FitDirect(TH1 &hist) {
+  BinnedFit fit(hist, {{fMin, fMax}}, fLikelihood.GetValue() == "poisson");
+  if (fIntegrate.GetValue()) {
+    fit.FitIntegral(*fSumFunc, [this](const double *x1, const double *x2, double *out, int n, const double *p) {
+      EvalBinAverages(x1, x2, out, n, p);
+    });
+    return;
+  }
+
+  auto model = [this](const double *x, double *out, int n, const double *p) { EvalRegion(x, out, n, p); };
+  if (fGradient.GetValue()) {
+    fit.Fit(*fSumFunc, model, [this](const double *x, const double *p, double *grad) { EvalGrad(x, p, grad); });
+  } else {
+    fit.Fit(*fSumFunc, model);
+  }
+}
+
 //! Restore the fit, using the given background function
 bool TheuerkaufFitter::Restore(const Background &bg, double ChiSquare) {
   fBackground.reset(bg.Clone());
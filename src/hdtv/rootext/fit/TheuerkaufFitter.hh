@@ -61,6 +61,9 @@ public:
   double Eval(const double *x, const double *p) const;
   double EvalNoStep(const double *x, const double *p) const;
   double EvalStep(const double *x, const double *p) const;
+  void EvalGrad(const double *x, const double *p, double *grad) const;
+  void EvalRegion(const double *x, double *out, int n, const double *p) const;
+  void EvalBinAverages(const double *x1, const double *x2, double *out, int n, const double *p) const;
 
   double GetPos() const { return fPos.Value(fFunc); }
   double GetPosError() const { return fPos.Error(fFunc); }
@@ -131,6 +134,8 @@ private:
   std::unique_ptr<TF1> fPeakFunc;
 
   mutable double fCachedNorm, fCachedSigma, fCachedTL, fCachedTR;
+  // Derivatives of 1/norm with respect to sigma, tl and tr (see EvalGrad())
+  mutable double fCachedDVolSigma, fCachedDVolTL, fCachedDVolTR;
 
   void RestoreParam(const Param &param, double value, double error);
 
@@ -141,9 +146,10 @@ private:
 class TheuerkaufFitter : public Fitter {
 public:
   TheuerkaufFitter(double r1, double r2, Option<bool> integrate, Option<std::string> likelihood,
-                   Option<bool> onlypositivepeaks, bool debugShowInipar = false)
+                   Option<bool> onlypositivepeaks, Option<bool> gradient = Option<bool>(false),
+                   Option<std::string> engine = Option<std::string>("root"), bool debugShowInipar = false)
       : Fitter(r1, r2), fIntegrate(integrate), fLikelihood(likelihood), fOnlypositivepeaks(onlypositivepeaks),
-        fDebugShowInipar(debugShowInipar) {}
+        fGradient(gradient), fEngine(engine), fDebugShowInipar(debugShowInipar) {}
 
   // Copying the fitter is not supported
   TheuerkaufFitter(const TheuerkaufFitter &) = delete;
@@ -152,6 +158,7 @@ public:
   void AddPeak(const TheuerkaufPeak &peak);
   void Fit(TH1 &hist, const Background &bg);
   void Fit(TH1 &hist, int intNParams = -1);
+  void SetIntBgStart(const TArrayD &values);
 
   int GetNumPeaks() { return fNumPeaks; }
   const TheuerkaufPeak &GetPeak(int i) { return fPeaks[i]; }
@@ -165,15 +172,26 @@ private:
   using PeakVector_t = std::vector<TheuerkaufPeak>;
   using PeakID_t = PeakVector_t::size_type;
 
+  // Fit function with analytic gradient, see _FitGrad()
+  class GradFunc;
+
   double Eval(const double *x, const double *p) const;
   double EvalBg(const double *x, const double *p) const;
+  void EvalGrad(const double *x, const double *p, double *grad) const;
+  void EvalRegion(const double *x, double *out, int n, const double *p) const;
+  void EvalBinAverages(const double *x1, const double *x2, double *out, int n, const double *p) const;
   void _Fit(TH1 &hist);
+  void _FitGrad(TH1 &hist);
+  void _FitDirect(TH1 &hist);
   void _Restore(double ChiSquare);
 
   std::vector<TheuerkaufPeak> fPeaks;
+  std::vector<double> fIntBgStart;
   Option<bool> fIntegrate;
   Option<std::string> fLikelihood;
   Option<bool> fOnlypositivepeaks;
+  Option<bool> fGradient;
+  Option<std::string> fEngine;
   bool fDebugShowInipar;
 };
 
@@ -22,6 +22,7 @@
 
 #include "Util.hh"
 
+#include <atomic>
 #include <sstream>
 
 #include <TAxis.h>
@@ -29,14 +30,16 @@
 
 namespace HDTV {
 
-static int num = 0;
+static std::atomic<int> num{0};
 
 std::string GetFuncUniqueName(const char *prefix, void *ptr) {
   // Constructs a unique name for a function by concatenation of an
   // instance-unique prefix,
   // a textual representation of this, and an increasing number.
-  // FIXME: not thread safe. The whole requirement of unique names is extremely
-  // ugly anyway.
+  // The counter is atomic, as fits may run in several threads (see
+  // Fitter.FitMany() on the python side); ROOT itself must be made thread
+  // safe by ROOT::EnableThreadSafety(). The whole requirement of unique names
+  // is extremely ugly anyway.
 
   std::ostringstream name;
   name << prefix << "_" << ptr << "_" << ++num;
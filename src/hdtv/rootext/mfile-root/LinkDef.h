@@ -8,7 +8,9 @@
 #pragma link C++ class MFileHist+;
 #pragma link C++ class VMatrix+;
 #pragma link C++ class MFMatrix+;
+#pragma link C++ class TriMatrix+;
 #pragma link C++ class RMatrix+;
+#pragma link C++ class SparseBins+;
 #pragma link C++ class MatOp+;
 
 #endif
@@ -21,12 +21,18 @@
  */
 #include "MFileHist.hh"
 
+#include <algorithm>
 #include <iostream>
+#include <vector>
 
 #include <TArrayD.h>
 #include <TH1.h>
 #include <TH2.h>
 
+extern "C" {
+#include "mat_types.h"
+}
+
 const int MFileHist::ERR_SUCCESS = 0;
 const int MFileHist::ERR_READ_OPEN = 1;
 const int MFileHist::ERR_READ_INFO = 2;
@@ -299,6 +305,113 @@ double *MFileHist::FillBuf1D(double *buf, unsigned int level, unsigned int line)
   return buf;
 }
 
+double *MFileHist::FillBufSegment(double *buf, unsigned int level, unsigned int line, unsigned int col,
+                                  unsigned int num) {
+  if (!fHist || !fInfo) {
+    fErrno = ERR_READ_NOTOPEN;
+    return nullptr;
+  }
+
+  if (level >= fInfo->levels || line >= fInfo->lines || col > fInfo->columns || num > fInfo->columns - col) {
+    fErrno = ERR_READ_BADIDX;
+    return nullptr;
+  }
+
+  int rc = mgetdbl(fHist, buf, level, line, col, num);
+  if (rc < 0 || static_cast<unsigned int>(rc) != num) {
+    fErrno = ERR_READ_GET;
+    return nullptr;
+  }
+
+  fErrno = ERR_SUCCESS;
+  return buf;
+}
+
+namespace {
+
+// Formats storing all lines of a level consecutively, without compression
+bool IsUncompressed(int filetype) {
+  switch (filetype) {
+  case MAT_LE2:
+  case MAT_LE4:
+  case MAT_HE2:
+  case MAT_HE4:
+  case MAT_LF4:
+  case MAT_LF8:
+  case MAT_HF4:
+  case MAT_HF8:
+  case MAT_LE2S:
+  case MAT_HE2S:
+    return true;
+  default:
+    return false;
+  }
+}
+
+// Read num consecutive elements, starting at the beginning of line, using the
+// low-level get function of the format. Unlike mgetdbl(), these are not
+// restricted to a single line, but convert via buffers of MAT_COLMAX elements.
+template <class T>
+bool GetBlock(MFILE *mat, mgetf *getf, double *buf, unsigned int level, unsigned int line, unsigned int num) {
+  std::vector<T> tmp(std::min(num, static_cast<unsigned int>(MAT_COLMAX)));
+  for (unsigned int pos = 0; pos < num; pos += tmp.size()) {
+    int n = std::min(num - pos, static_cast<unsigned int>(tmp.size()));
+    if (getf(mat, tmp.data(), level, line, pos, n) != n) {
+      return false;
+    }
+    std::copy(tmp.begin(), tmp.begin() + n, buf + pos);
+  }
+  return true;
+}
+
+} // end anonymous namespace
+
+//! Read nlines consecutive lines into buf (nlines * columns elements). For
+//! uncompressed formats, this requires only a few large reads.
+double *MFileHist::FillBuf2D(double *buf, unsigned int level, unsigned int line, unsigned int nlines) {
+  if (!fHist || !fInfo) {
+    fErrno = ERR_READ_NOTOPEN;
+    return nullptr;
+  }
+
+  if (level >= fInfo->levels || line >= fInfo->lines || nlines > fInfo->lines - line) {
+    fErrno = ERR_READ_BADIDX;
+    return nullptr;
+  }
+
+  if (!IsUncompressed(fInfo->filetype)) {
+    for (unsigned int l = 0; l < nlines; ++l) {
+      if (!FillBuf1D(buf + l * fInfo->columns, level, line + l)) {
+        return nullptr;
+      }
+    }
+    return buf;
+  }
+
+  mgetf *getf = matproc_getf(fInfo->filetype);
+  unsigned int num = nlines * fInfo->columns;
+  bool success;
+  switch (matproc_datatype(fInfo->filetype)) {
+  case MAT_D_F4:
+    success = GetBlock<float>(fHist, getf, buf, level, line, num);
+    break;
+  case MAT_D_F8:
+    success = GetBlock<double>(fHist, getf, buf, level, line, num);
+    break;
+  default:
+    success = GetBlock<int32_t>(fHist, getf, buf, level, line, num);
+    break;
+  }
+
+  if (!success) {
+    fErrno = ERR_READ_GET;
+    return nullptr;
+  }
+
+  fErrno = ERR_SUCCESS;
+  return buf;
+}
+
 TH2 *MFileHist::FillTH2(TH2 *hist, unsigned int level) {
   unsigned int line, col;
 
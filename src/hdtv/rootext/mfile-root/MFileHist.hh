@@ -50,6 +50,8 @@ public:
   unsigned int GetNColumns() { return fInfo ? fInfo->columns : 0; }
 
   double *FillBuf1D(double *buf, unsigned int level, unsigned int line);
+  double *FillBufSegment(double *buf, unsigned int level, unsigned int line, unsigned int col, unsigned int num);
+  double *FillBuf2D(double *buf, unsigned int level, unsigned int line, unsigned int nlines);
 
   template <class histType> histType *ToTH1(const char *name, const char *title, unsigned int level, unsigned int line);
 
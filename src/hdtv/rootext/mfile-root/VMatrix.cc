@@ -22,13 +22,24 @@
 
 #include "VMatrix.hh"
 
+#include <algorithm>
 #include <cmath>
 
-#include <TArrayD.h>
+namespace {
 
-void VMatrix::AddRegion(std::list<int> &reglist, int l1, int l2) {
-  std::list<int>::iterator iter, next;
-  bool inside = false;
+// Number of elements read at once (8 MiB)
+constexpr int kBlockSize = 1 << 20;
+
+// Simple loop over raw buffers, which the compiler is able to vectorize
+inline void Accumulate(double *__restrict dst, const double *__restrict src, int n) {
+  for (int c = 0; c < n; ++c) {
+    dst[c] += src[c];
+  }
+}
+
+} // end anonymous namespace
+
+void VMatrix::AddRegion(unsigned char type, int l1, int l2) {
   int min = std::min(l1, l2);
   int max = std::max(l1, l2);
 
@@ -39,35 +50,15 @@ void VMatrix::AddRegion(std::list<int> &reglist, int l1, int l2) {
   min = std::max(min, GetCutLowBin());
   max = std::min(max, GetCutHighBin());
 
-  iter = reglist.begin();
-  while (iter != reglist.end() && *iter < min) {
-    inside = !inside;
-    iter++;
-  }
-
-  if (!inside) {
-    iter = reglist.insert(iter, min);
-    iter++;
-  }
-
-  while (iter != reglist.end() && *iter < max) {
-    inside = !inside;
-    next = iter;
-    next++;
-    reglist.erase(iter);
-    iter = next;
+  if (fLines.size() < static_cast<size_t>(GetCutHighBin()) + 1) {
+    fLines.resize(GetCutHighBin() + 1, 0);
   }
-
-  if (!inside) {
-    reglist.insert(iter, max);
+  for (int l = min; l <= max; ++l) {
+    fLines[l] |= type;
   }
 }
 
-class ReadException {};
-
 TH1 *VMatrix::Cut(const char *histname, const char *histtitle) {
-  int l, l1, l2; // lines
-  std::list<int>::iterator iter;
   int nCut = 0, nBg = 0; // total number of cut and background lines
   int pbins = GetProjXbins();
 
@@ -75,41 +66,21 @@ TH1 *VMatrix::Cut(const char *histname, const char *histtitle) {
     return nullptr;
   }
 
-  if (fCutRegions.empty()) {
+  if (std::none_of(fLines.begin(), fLines.end(), [](unsigned char f) { return f & kCutLine; })) {
     return nullptr;
   }
 
-  // Sum of cut lines
-  TArrayD sum(pbins);
-  sum.Reset(0.0);
-
-  // Sum of background lines
-  TArrayD bg(pbins);
-  bg.Reset(0.0);
+  // Sums of cut and background lines
+  std::vector<double> sum(pbins, 0.0);
+  std::vector<double> bg(pbins, 0.0);
 
-  try {
-    // Add up all cut lines
-    iter = fCutRegions.begin();
-    while (iter != fCutRegions.end()) {
-      l1 = *iter++;
-      l2 = *iter++;
-      for (l = l1; l <= l2; l++) {
-        AddLine(sum, l);
-        nCut++;
-      }
-    }
-
-    // Add up all background lines
-    iter = fBgRegions.begin();
-    while (iter != fBgRegions.end()) {
-      l1 = *iter++;
-      l2 = *iter++;
-      for (l = l1; l <= l2; l++) {
-        AddLine(bg, l);
-        nBg++;
-      }
-    }
-  } catch (ReadException &) {
+  bool success;
+  if (HasIntegral()) {
+    success = SumIntegral(sum.data(), nCut, kCutLine) && SumIntegral(bg.data(), nBg, kBgLine);
+  } else {
+    success = SumLines(sum.data(), nCut, bg.data(), nBg);
+  }
+  if (!success) {
     return nullptr;
   }
 
@@ -123,44 +94,168 @@ TH1 *VMatrix::Cut(const char *histname, const char *histtitle) {
   return hist;
 }
 
-RMatrix::RMatrix(TH2 *hist, ProjAxis_t paxis) : VMatrix(), fHist(hist), fProjAxis(paxis) {}
+bool VMatrix::SumLines(double *sum, int &nCut, double *bg, int &nBg) {
+  int pbins = GetProjXbins();
+  int nlines = fLines.size();
 
-void RMatrix::AddLine(TArrayD &dst, int l) {
-  if (fProjAxis == PROJ_X) {
-    int cols = fHist->GetNbinsX();
+  // Single sweep over the union of cut and background regions, reading as
+  // many consecutive lines at once as fit into a block
+  int maxLines = std::max(1, kBlockSize / std::max(pbins, 1));
+  std::vector<double> block;
+  int l1 = 0;
+  while (l1 < nlines) {
+    if (!fLines[l1]) {
+      ++l1;
+      continue;
+    }
+    int l2 = l1;
+    while (l2 < nlines && fLines[l2] && l2 - l1 < maxLines) {
+      ++l2;
+    }
 
-    for (int c = 1; c <= cols; ++c) {
-      // Bad for speed; overloaded operator[] checks array bounds
-      dst[c - 1] += fHist->GetBinContent(c, l);
+    block.resize(static_cast<size_t>(l2 - l1) * pbins);
+    if (!GetLines(block.data(), l1, l2 - l1)) {
+      return false;
     }
-  } else {
-    int cols = fHist->GetNbinsY();
 
-    for (int c = 1; c <= cols; ++c) {
-      // Bad for speed; overloaded operator[] checks array bounds
-      dst[c - 1] += fHist->GetBinContent(l, c);
+    for (int l = l1; l < l2; ++l) {
+      const double *line = block.data() + static_cast<size_t>(l - l1) * pbins;
+      if (fLines[l] & kCutLine) {
+        Accumulate(sum, line, pbins);
+        nCut++;
+      }
+      if (fLines[l] & kBgLine) {
+        Accumulate(bg, line, pbins);
+        nBg++;
+      }
+    }
+    l1 = l2;
+  }
+
+  return true;
+}
+
+bool VMatrix::SumIntegral(double *dst, int &n, unsigned char type) {
+  int pbins = GetProjXbins();
+  int nlines = fLines.size();
+  std::vector<double> lo(pbins), hi(pbins);
+
+  // Each run of consecutive lines [l1, l2) is the difference of two lines of
+  // the integral matrix, independent of its length
+  int l1 = 0;
+  while (l1 < nlines) {
+    if (!(fLines[l1] & type)) {
+      ++l1;
+      continue;
+    }
+    int l2 = l1;
+    while (l2 < nlines && (fLines[l2] & type)) {
+      ++l2;
+    }
+
+    if (!GetIntegralLine(lo.data(), l1) || !GetIntegralLine(hi.data(), l2)) {
+      return false;
+    }
+    for (int c = 0; c < pbins; ++c) {
+      dst[c] += hi[c] - lo[c];
+    }
+    n += l2 - l1;
+    l1 = l2;
+  }
+
+  return true;
+}
+
+RMatrix::RMatrix(TH2 *hist, ProjAxis_t paxis) : VMatrix(), fHist(hist), fProjAxis(paxis) {}
+
+bool RMatrix::GetLines(double *buf, int l, int n) {
+  int cols = GetProjXbins();
+  for (int i = 0; i < n; ++i, buf += cols) {
+    if (fProjAxis == PROJ_X) {
+      for (int c = 1; c <= cols; ++c) {
+        buf[c - 1] = fHist->GetBinContent(c, l + i);
+      }
+    } else {
+      for (int c = 1; c <= cols; ++c) {
+        buf[c - 1] = fHist->GetBinContent(l + i, c);
+      }
+    }
+  }
+  return true;
+}
+
+bool SparseBins::Read(THnSparse *hist, int *x, int *y, double *contents, double *sumw2) {
+  if (hist->GetNdimensions() != 2) {
+    return false;
+  }
+  int coord[2];
+  Long64_t n = hist->GetNbins();
+  for (Long64_t i = 0; i < n; ++i) {
+    contents[i] = hist->GetBinContent(i, coord);
+    x[i] = coord[0];
+    y[i] = coord[1];
+    if (sumw2) {
+      sumw2[i] = hist->GetBinError2(i);
     }
   }
+  return true;
 }
 
-MFMatrix::MFMatrix(MFileHist *mat, unsigned int level) : VMatrix(), fMatrix(mat), fLevel(level), fBuf() {
+MFMatrix::MFMatrix(MFileHist *mat, unsigned int level) : VMatrix(), fMatrix(mat), fLevel(level), fIntegral(nullptr) {
   // Sanity checks
   if (fLevel >= fMatrix->GetNLevels()) {
     fFail = true;
-  } else {
-    fBuf.Set(fMatrix->GetNColumns());
   }
 }
 
-void MFMatrix::AddLine(TArrayD &dst, int l) {
-  if (!fMatrix->FillBuf1D(fBuf.GetArray(), fLevel, l)) {
-    throw ReadException();
+bool MFMatrix::SetIntegral(MFileHist *integral) {
+  if (integral && (fLevel >= integral->GetNLevels() || integral->GetNLines() != fMatrix->GetNLines() + 1 ||
+                   integral->GetNColumns() != fMatrix->GetNColumns())) {
+    return false;
+  }
+  fIntegral = integral;
+  return true;
+}
+
+TriMatrix::TriMatrix(MFileHist *mat, unsigned int level) : MFMatrix(mat, level) {
+  if (!IsTriangular(fMatrix->GetFileType()) || fMatrix->GetNLines() != fMatrix->GetNColumns()) {
+    fFail = true;
+  }
+}
+
+bool TriMatrix::IsTriangular(int filetype) {
+  return filetype == MAT_LE2T || filetype == MAT_LE4T || filetype == MAT_HE2T || filetype == MAT_HE4T;
+}
+
+bool TriMatrix::GetLines(double *buf, int l, int n) {
+  int cols = GetProjXbins();
+
+  // Row segments: columns 0 to l + i of line l + i
+  for (int i = 0; i < n; ++i) {
+    double *line = buf + static_cast<size_t>(i) * cols;
+    if (!fMatrix->FillBufSegment(line, fLevel, l + i, 0, l + i + 1)) {
+      return false;
+    }
+    std::fill(line + l + i + 1, line + cols, 0.0);
   }
 
-  int cols = fMatrix->GetNColumns();
+  // Column segments inside the block, i.e. mirrored row segments
+  for (int i = 0; i < n; ++i) {
+    for (int j = i + 1; j < n; ++j) {
+      buf[static_cast<size_t>(i) * cols + l + j] = buf[static_cast<size_t>(j) * cols + l + i];
+    }
+  }
 
-  for (int c = 0; c < cols; ++c) {
-    // Bad for speed; overloaded operator[] checks array bounds
-    dst[c] += fBuf[c];
+  // Column segments beyond the block: line c holds columns l to l + n - 1
+  std::vector<double> segment(n);
+  for (int c = l + n; c < cols; ++c) {
+    if (!fMatrix->FillBufSegment(segment.data(), fLevel, c, l, n)) {
+      return false;
+    }
+    for (int i = 0; i < n; ++i) {
+      buf[static_cast<size_t>(i) * cols + c] = segment[i];
+    }
   }
+
+  return true;
 }
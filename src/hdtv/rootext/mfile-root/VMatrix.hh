@@ -24,10 +24,11 @@
 #define __VMatrix_h__
 
 #include <cmath>
-#include <list>
+#include <vector>
 
 #include <TH1.h>
 #include <TH2.h>
+#include <THnSparse.h>
 
 #include "MFileHist.hh"
 
@@ -54,12 +55,9 @@ public:
   VMatrix() : fFail(false){};
   virtual ~VMatrix() = default;
 
-  void AddCutRegion(int c1, int c2) { AddRegion(fCutRegions, c1, c2); }
-  void AddBgRegion(int c1, int c2) { AddRegion(fBgRegions, c1, c2); }
-  void ResetRegions() {
-    fCutRegions.clear();
-    fBgRegions.clear();
-  }
+  void AddCutRegion(int c1, int c2) { AddRegion(kCutLine, c1, c2); }
+  void AddBgRegion(int c1, int c2) { AddRegion(kBgLine, c1, c2); }
+  void ResetRegions() { fLines.clear(); }
 
   TH1 *Cut(const char *histname, const char *histtitle);
 
@@ -73,13 +71,22 @@ public:
   virtual double GetProjXmax() = 0;
   virtual int GetProjXbins() = 0;
 
-  virtual void AddLine(TArrayD &dst, int l) = 0;
+  //! Read n consecutive lines, starting at line l, into buf (n * GetProjXbins() elements)
+  virtual bool GetLines(double *buf, int l, int n) = 0;
+
+  //! Integral matrix: line l holds the sum of all lines below l
+  virtual bool HasIntegral() { return false; }
+  virtual bool GetIntegralLine(double *buf, int l) { return false; }
 
   bool Failed() { return fFail; }
 
 private:
-  void AddRegion(std::list<int> &reglist, int c1, int c2);
-  std::list<int> fCutRegions, fBgRegions;
+  enum : unsigned char { kCutLine = 1, kBgLine = 2 };
+  void AddRegion(unsigned char type, int c1, int c2);
+  bool SumLines(double *sum, int &nCut, double *bg, int &nBg);
+  bool SumIntegral(double *dst, int &n, unsigned char type);
+  //! Cut and background flags for each line of the cut axis
+  std::vector<unsigned char> fLines;
 
 protected:
   bool fFail;
@@ -113,13 +120,24 @@ public:
 
   int GetProjXbins() override { return (fProjAxis == PROJ_X) ? fHist->GetNbinsX() : fHist->GetNbinsY(); }
 
-  void AddLine(TArrayD &dst, int l) override;
+  bool GetLines(double *buf, int l, int n) override;
 
 private:
   TH2 *fHist;
   ProjAxis_t fProjAxis;
 };
 
+//! Bulk access to the filled bins of a 2D THnSparse
+class SparseBins {
+public:
+  //! Number of filled bins, i.e. the size of the arrays passed to Read()
+  static Long64_t GetN(THnSparse *hist) { return hist->GetNbins(); }
+
+  //! Copy the bin numbers on both axes (including under- and overflow), contents and sums of squares of weights
+  //! (unless sumw2 is nullptr) of all filled bins
+  static bool Read(THnSparse *hist, int *x, int *y, double *contents, double *sumw2);
+};
+
 //! MFile-histogram-backed VMatrix
 class MFMatrix : public VMatrix {
 public:
@@ -138,12 +156,32 @@ public:
   double GetProjXmax() override { return fMatrix->GetNColumns() - .5; }
   int GetProjXbins() override { return fMatrix->GetNColumns(); }
 
-  void AddLine(TArrayD &dst, int l) override;
+  bool GetLines(double *buf, int l, int n) override { return fMatrix->FillBuf2D(buf, fLevel, l, n) != nullptr; }
 
-private:
+  //! Use integral matrix (lines + 1 lines), pass nullptr to disable
+  bool SetIntegral(MFileHist *integral);
+  bool HasIntegral() override { return fIntegral != nullptr; }
+  bool GetIntegralLine(double *buf, int l) override { return fIntegral->FillBuf1D(buf, fLevel, l) != nullptr; }
+
+protected:
   MFileHist *fMatrix;
   unsigned int fLevel;
-  TArrayD fBuf;
+  MFileHist *fIntegral;
+};
+
+//! Symmetric matrix stored as triangle (mfile formats le2t, le4t, he2t and he4t)
+/*!
+  Line l of the file only holds columns 0 to l. The remaining columns of the
+  symmetric line are collected from column l of all following lines.
+*/
+class TriMatrix : public MFMatrix {
+public:
+  TriMatrix(MFileHist *mat, unsigned int level);
+  ~TriMatrix() override = default;
+
+  bool GetLines(double *buf, int l, int n) override;
+
+  static bool IsTriangular(int filetype);
 };
 
 #endif
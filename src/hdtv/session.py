@@ -189,6 +189,7 @@ class Session(DrawableManager):
                 self.workFit.fitter.SetParameter("pos", "free")
                 hdtv.ui.msg("'pos' fit parameter reset to 'free'")
             self.workFit.spec = None
+            self.workFit.ResetStartValues()
 
     def ActivateFit(self, ID, sid=None):
         """
@@ -18,11 +18,21 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
 import array
+import hashlib
 import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+import numpy as np
 import ROOT
+from scipy.signal import lfilter
 
+import hdtv.options
+import hdtv.rootext.dlmgr
 import hdtv.rootext.mfile
+import hdtv.textspec
 import hdtv.ui
 
 
@@ -95,15 +105,22 @@ class TextSpecReader:
         # n+1 unknowns), so that there is a somewhat arbitrary choice being
         # made.
         xbins = array.array("d")
-        w = (centers[1] - centers[0]) / 2.0
-        xbins.append(centers[0] - w)
-        for i in range(1, len(centers)):
-            w = centers[i] - centers[i - 1] - w
-            xbins.append(centers[i] - w)
-        xbins.append(centers[-1] + w)
-
+        xbins.frombytes(self._BinLowEdges(np.asarray(centers, dtype=float)).tobytes())
         return xbins
 
+    @staticmethod
+    def _BinLowEdges(centers):
+        """
+        Vectorized implementation of GetBinLowEdges, returning a numpy array.
+        """
+        # The half widths obey the recurrence w_i = (c_i - c_{i-1}) - w_{i-1},
+        # which is evaluated by lfilter in exactly the same order of floating
+        # point operations as an explicit loop would.
+        w0 = (centers[1] - centers[0]) / 2.0
+        w = lfilter([1.0, 0.0], [1.0, 1.0], np.diff(centers), zi=[-w0])[0]
+        w = np.concatenate(([w0], w))
+        return np.concatenate((centers - w, [centers[-1] + w[-1]]))
+
     def StripComments(self, line):
         end = len(line)
 
@@ -115,10 +132,90 @@ class TextSpecReader:
 
         return line[:end]
 
-    def GetSpectrum(self, fname, histname, histtitle):
+    def GetSpectrum(self, fname, histname, histtitle, data=None):
         """
         Process a text file into a ROOT histogram object, using the format
-        specified in the constructor.
+        specified in the constructor. If the columns of the file were already
+        read (see LoadColumns()), they can be passed as data.
+        """
+        if data is None:
+            data = self._ReadColumns(fname)
+        else:
+            data = self._CheckColumns(data)
+        if data is None:
+            # Let the line-by-line parser produce a helpful error message
+            return self._GetSpectrumByLine(fname, histname, histtitle)
+
+        nbins = len(data)
+        y = data[:, self.ycol]
+        e = data[:, self.ecol] if self.ecol is not None else None
+
+        if self.xcol is not None:
+            # Sort by increasing x value (stable, like list.sort())
+            order = np.argsort(data[:, self.xcol], kind="stable")
+            y = y[order]
+            if e is not None:
+                e = e[order]
+            xbins = self._BinLowEdges(data[order, self.xcol])
+            hist = ROOT.TH1D(histname, histtitle, nbins, xbins)
+        else:
+            hist = ROOT.TH1D(histname, histtitle, nbins, -0.5, nbins - 0.5)
+
+        # Fill ROOT histogram object (including under- and overflow bin)
+        content = np.zeros(nbins + 2)
+        content[1:-1] = y
+        hist.SetContent(content)
+        if e is not None:
+            error = np.zeros(nbins + 2)
+            error[1:-1] = e
+            hist.SetError(error)
+        # SetBinContent() counts one entry per call
+        hist.SetEntries(nbins)
+
+        return hist
+
+    def _ReadColumns(self, fname):
+        """
+        Read all columns of a text file into a 2d numpy array in one go.
+
+        Returns None if the file cannot be parsed this way (e.g. because of
+        a malformed line or an unsupported number of columns), in which case
+        the line-by-line parser must be used. The column layout is only
+        autodetected on success.
+        """
+        return self._CheckColumns(self.LoadColumns(fname, self.cmts))
+
+    # Parsed in a ROOT-free module, so that this can be done in another
+    # process (see SpecReader.ReadSpectra())
+    LoadColumns = staticmethod(hdtv.textspec.LoadColumns)
+
+    def _CheckColumns(self, data):
+        """
+        Check the number of columns of data, autodetecting the column layout
+        if necessary
+        """
+        if data is None or data.shape[0] == 0:
+            return None
+        ncols = data.shape[1]
+        if self.ncols is None:
+            if ncols == 1:
+                self.xcol, self.ycol, self.ecol = None, 0, None
+            elif ncols == 2:
+                self.xcol, self.ycol, self.ecol = 0, 1, None
+            elif ncols == 3:
+                self.xcol, self.ycol, self.ecol = 0, 1, 2
+            else:
+                return None
+            self.ncols = ncols
+        elif ncols != self.ncols:
+            return None
+
+        return data
+
+    def _GetSpectrumByLine(self, fname, histname, histtitle):
+        """
+        Process a text file into a ROOT histogram object line by line.
+        This is slow, but gives detailed error messages for malformed files.
         """
         data = []
         f = open(fname)
@@ -208,6 +305,715 @@ class TextSpecReader:
         return hist
 
 
+# Element types of the uncompressed mfile matrix formats (see mfile.h), which
+# simply store all lines of all levels consecutively
+_MFILE_DTYPES = {
+    2: ("<u2", "le2"),  # MAT_LE2
+    3: ("<i4", "le4"),  # MAT_LE4
+    4: (">u2", "he2"),  # MAT_HE2
+    5: (">i4", "he4"),  # MAT_HE4
+    7: ("<f4", "lf4"),  # MAT_LF4
+    8: ("<f8", "lf8"),  # MAT_LF8
+    9: (">f4", "hf4"),  # MAT_HF4
+    10: (">f8", "hf8"),  # MAT_HF8
+    20: ("<i2", "le2s"),  # MAT_LE2S
+    21: (">i2", "he2s"),  # MAT_HE2S
+}
+
+# Compressed and text formats of libmfile, which are worth caching (see
+# SpectrumCache)
+_MFILE_CACHED = {
+    1,  # MAT_LC
+    14,  # MAT_TXT
+}
+
+# Symmetric matrices of which only the lower triangle is stored: line l
+# holds columns 0 to l (see oldmat_getput.c)
+_MFILE_TRIANGULAR = {
+    15: ("<u2", "le2t"),  # MAT_LE2T
+    16: ("<i4", "le4t"),  # MAT_LE4T
+    17: (">u2", "he2t"),  # MAT_HE2T
+    18: (">i4", "he4t"),  # MAT_HE4T
+}
+
+# Trailer appended to uncompressed matrices by libmfile, from which the
+# dimensions are recovered when opening the file (see oldmat_minfo.c)
+_MFILE_MAGIC = b"\nMatFmt: "
+_MFILE_TRAILER_SIZE = 64
+
+
+def WriteMFileTrailer(fname, levels, lines, columns, fmtname):
+    """
+    Append format trailer to an uncompressed matrix file, so that libmfile
+    recognizes its dimensions
+    """
+    dims = [lines, columns] if levels == 1 else [levels, lines, columns]
+    fmt = ".".join(str(n) for n in [*dims, fmtname])
+    # The version is required to terminate the format name
+    fmt += ":2" if fmtname[1] == "f" else ":1"
+    trailer = _MFILE_MAGIC + fmt.encode() + b"\n"
+    with open(fname, "ab") as f:
+        f.write(trailer.ljust(_MFILE_TRAILER_SIZE, b"\0"))
+
+
+def MergeRegions(regions, lines):
+    """
+    Clip regions (pairs of lines, inclusive) to a matrix with the given number
+    of lines and merge overlapping ones, so that each line is used at most once
+    """
+    merged = []
+    for l1, l2 in sorted((min(r), max(r)) for r in regions):
+        if l2 < 0 or l1 >= lines:
+            continue
+        l1, l2 = max(l1, 0), min(l2, lines - 1)
+        if merged and l1 <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], l2)
+        else:
+            merged.append([l1, l2])
+    return merged
+
+
+def CutMany(read, columns, gates, blocksize=None):
+    """
+    Execute many cuts in a single sweep over a matrix: Each line used by any
+    of the gates is read only once, in blocks of consecutive lines, and the sum
+    of all lines read so far is kept. The sum over a region is the difference
+    of this running sum at its two ends, so the cost does not grow with the
+    number of gates (apart from one addition per region boundary).
+
+    Args:
+        read: Function returning lines l1 to l2 - 1 as 2D array for (l1, l2)
+        columns: Number of columns of the matrix
+        gates: List of pairs of cut and background regions, merged as by
+            MergeRegions()
+        blocksize: Number of lines read at once
+
+    Returns:
+        List of cut spectra as numpy arrays (like MappedMatrix.Cut), None
+        for gates without cut regions
+    """
+    if blocksize is None:
+        # Lines per block, about 16 MiB each
+        blocksize = max(1, (1 << 24) // (columns * 8))
+
+    # Region boundaries: The running sum at the first line of a region is
+    # subtracted from, the one after its last line added to the cut (0) or
+    # background (1) sum of the gate.
+    bounds = defaultdict(list)
+    nlines = np.zeros((len(gates), 2), dtype=int)
+    used = []
+    for i, (regions, bgregions) in enumerate(gates):
+        for kind, merged in enumerate((regions, bgregions)):
+            for l1, l2 in merged:
+                bounds[l1].append((i, kind, -1.0))
+                bounds[l2 + 1].append((i, kind, 1.0))
+                nlines[i, kind] += l2 - l1 + 1
+                used.append((l1, l2))
+    positions = sorted(bounds)
+
+    # Runs of consecutive lines used by any gate
+    runs = []
+    for l1, l2 in sorted(used):
+        if runs and l1 <= runs[-1][1] + 1:
+            runs[-1][1] = max(runs[-1][1], l2)
+        else:
+            runs.append([l1, l2])
+
+    sums = np.zeros((len(gates), 2, columns))
+    running = np.zeros(columns)
+
+    def Apply(pos, total):
+        for i, kind, sign in bounds[pos]:
+            sums[i, kind] += sign * total
+
+    for r1, r2 in runs:
+        Apply(r1, running)
+        for l1 in range(r1, r2 + 1, blocksize):
+            l2 = min(l1 + blocksize, r2 + 1)
+            block = np.cumsum(read(l1, l2), axis=0, dtype=np.float64)
+            first, last = bisect_right(positions, l1), bisect_right(positions, l2)
+            for pos in positions[first:last]:
+                Apply(pos, running + block[pos - l1 - 1])
+            running += block[-1]
+
+    cuts = []
+    for (nCut, nBg), (cut, bg) in zip(nlines, sums):
+        if nCut == 0:
+            cuts.append(None)
+            continue
+        if nBg > 0:
+            cut -= bg * (nCut / nBg)
+        cuts.append(cut)
+    return cuts
+
+
+class MappedMatrix:
+    """
+    Memory-mapped mfile matrix
+
+    The contents of the file are accessible as numpy array (levels x lines x
+    columns) without reading them into memory. Only the pages of the file
+    actually used (e.g. for a cut) are read by the operating system.
+    """
+
+    MAX_RANGE_SUMS = 32
+
+    def __init__(self, fname, filetype, levels, lines, columns):
+        self.fname = fname
+        self.levels = levels
+        self.lines = lines
+        self.columns = columns
+        try:
+            dtype, self.fmtname = _MFILE_DTYPES[filetype]
+            dtype = np.dtype(dtype)
+        except KeyError:
+            raise SpecReaderError(f"{fname}: Cannot map file type {filetype}")
+        shape = (levels, lines, columns)
+        if os.path.getsize(fname) < dtype.itemsize * levels * lines * columns:
+            raise SpecReaderError(f"{fname}: File is too small for {shape} matrix")
+        self.data = np.memmap(fname, dtype=dtype, mode="r", shape=shape)
+        # Sums of recently used line ranges, see SumRange()
+        self._rangeSums = OrderedDict()
+        self.integral = None
+
+    def FindCutBin(self, x):
+        """
+        Convert channel to line number (like MFMatrix.FindCutBin)
+        """
+        return int(np.ceil(x - 0.5))
+
+    def MergeRegions(self, regions):
+        """
+        Clip regions (pairs of lines, inclusive) to the matrix and merge
+        overlapping ones, so that each line is used at most once
+        """
+        return MergeRegions(regions, self.lines)
+
+    def SumLines(self, regions, level=0):
+        """
+        Sum up all lines in (merged) regions
+
+        Returns:
+            Sum as numpy array and number of lines used
+        """
+        total = np.zeros(self.columns)
+        nlines = 0
+        for l1, l2 in regions:
+            total += self.SumRange(l1, l2, level)
+            nlines += l2 - l1 + 1
+        return total, nlines
+
+    def SumRange(self, l1, l2, level=0):
+        """
+        Sum up lines l1 to l2 (inclusive). The sums of the last few ranges are
+        kept, so that for a range differing only by a few lines at its ends
+        (e.g. a slightly widened gate), only those lines have to be read.
+        With an integral matrix, only two lines are read for any range.
+        """
+        if self.integral is not None:
+            data = self.integral.data
+            return data[level, l2 + 1] - data[level, l1]
+
+        best, cost = None, l2 - l1 + 1
+        for key in self._rangeSums:
+            lev, c1, c2 = key
+            if lev == level and c1 <= l2 and c2 >= l1:
+                if abs(l1 - c1) + abs(l2 - c2) < cost:
+                    best, cost = key, abs(l1 - c1) + abs(l2 - c2)
+
+        def Sum(a, b):
+            return self.ReadLines(a, b, level).sum(axis=0, dtype=np.float64)
+
+        if best is None:
+            total = Sum(l1, l2 + 1)
+        else:
+            _, c1, c2 = best
+            self._rangeSums.move_to_end(best)
+            total = self._rangeSums[best].copy()
+            if l1 < c1:
+                total += Sum(l1, c1)
+            elif l1 > c1:
+                total -= Sum(c1, l1)
+            if l2 > c2:
+                total += Sum(c2 + 1, l2 + 1)
+            elif l2 < c2:
+                total -= Sum(l2 + 1, c2 + 1)
+
+        self._rangeSums[(level, l1, l2)] = total
+        self._rangeSums.move_to_end((level, l1, l2))
+        while len(self._rangeSums) > self.MAX_RANGE_SUMS:
+            self._rangeSums.popitem(last=False)
+        return total
+
+    def ReadLines(self, l1, l2, level=0):
+        """
+        Lines l1 to l2 - 1 as 2D array
+        """
+        return self.data[level, l1:l2]
+
+    def ClearCache(self):
+        self._rangeSums.clear()
+
+    def Cut(self, regions, bgregions, level=0):
+        """
+        Sum up the lines in regions and subtract the lines in bgregions,
+        scaled to the number of region lines (like VMatrix.Cut)
+
+        Returns:
+            Cut spectrum as numpy array, or None if no region is inside the
+            matrix
+        """
+        regions = self.MergeRegions(regions)
+        if not regions:
+            return None
+        cut, nCut = self.SumLines(regions, level)
+        bg, nBg = self.SumLines(self.MergeRegions(bgregions), level)
+        if nBg > 0:
+            cut -= bg * (nCut / nBg)
+        return cut
+
+    def CutMany(self, gates, level=0):
+        """
+        Execute many cuts (pairs of cut and background regions) at once, see
+        CutMany(). With an integral matrix, each cut is done separately, as
+        it only takes two lines per region anyway.
+        """
+        if self.integral is not None:
+            return [self.Cut(regions, bgregions, level) for regions, bgregions in gates]
+        gates = [
+            (self.MergeRegions(regions), self.MergeRegions(bgregions))
+            for regions, bgregions in gates
+        ]
+        return CutMany(
+            lambda l1, l2: self.ReadLines(l1, l2, level), self.columns, gates
+        )
+
+    def Project(
+        self,
+        trans_fname=None,
+        integral_fname=None,
+        trans_integral_fname=None,
+        nthreads=None,
+        blocksize=None,
+    ):
+        """
+        Compute x and y projections in a single pass over the matrix,
+        optionally writing the transpose and the integral matrices (see
+        SetIntegral()) of the matrix and its transpose at the same time.
+        Blocks of lines are processed in parallel by nthreads threads (default:
+        number of CPUs), while the file contents are hashed in order.
+
+        Returns:
+            x projections (levels x columns), y projections (levels x lines)
+            and blake2b hex digest of the whole file
+        """
+        if nthreads is None:
+            nthreads = os.cpu_count() or 1
+        if blocksize is None:
+            # Lines per block, about 16 MiB each
+            blocksize = max(1, (1 << 24) // (self.columns * self.data.itemsize))
+
+        def Create(fname, dtype, lines, columns):
+            if not fname:
+                return None
+            shape = (self.levels, lines, columns)
+            return np.memmap(fname, dtype=dtype, mode="w+", shape=shape)
+
+        prx = np.zeros((self.levels, self.columns))
+        pry = np.zeros((self.levels, self.lines))
+        trans = Create(trans_fname, self.data.dtype, self.columns, self.lines)
+        integral = Create(integral_fname, "<f8", self.lines + 1, self.columns)
+        tintegral = Create(trans_integral_fname, "<f8", self.columns + 1, self.lines)
+
+        def ProjectBlock(level, l1, l2):
+            block = np.asarray(self.data[level, l1:l2])
+            pry[level, l1:l2] = block.sum(axis=1, dtype=np.float64)
+            if trans is not None:
+                trans[level, :, l1:l2] = block.T
+            if integral is not None:
+                # Integral within the block, see IntegrateBlock()
+                integral[level, l1 + 1 : l2 + 1] = block.cumsum(
+                    axis=0, dtype=np.float64
+                )
+            if tintegral is not None:
+                tintegral[level, 1:, l1:l2] = block.cumsum(axis=1, dtype=np.float64).T
+            return block.sum(axis=0, dtype=np.float64)
+
+        def IntegrateBlock(level, l1, l2, offset):
+            integral[level, l1 + 1 : l2 + 1] += offset
+
+        blocks = [
+            (level, l1, min(l1 + blocksize, self.lines))
+            for level in range(self.levels)
+            for l1 in range(0, self.lines, blocksize)
+        ]
+        digest = hashlib.blake2b()
+        with ThreadPoolExecutor(max_workers=nthreads) as pool:
+            futures = []
+            for level, l1, l2 in blocks:
+                futures.append(pool.submit(ProjectBlock, level, l1, l2))
+                digest.update(self.data[level, l1:l2])
+            colsums = [future.result() for future in futures]
+
+            # Add sum of all lines below each block to its integral lines
+            offset = np.zeros((self.levels, self.columns))
+            futures = []
+            for (level, l1, l2), colsum in zip(blocks, colsums):
+                if integral is not None and l1 > 0:
+                    futures.append(
+                        pool.submit(IntegrateBlock, level, l1, l2, offset[level].copy())
+                    )
+                offset[level] += colsum
+            for future in futures:
+                future.result()
+        prx[:] = offset
+
+        # Anything following the matrix data, i.e. the format trailer
+        with open(self.fname, "rb") as f:
+            f.seek(self.data.nbytes)
+            digest.update(f.read())
+
+        for fname, data, fmtname in (
+            (trans_fname, trans, self.fmtname),
+            (integral_fname, integral, "lf8"),
+            (trans_integral_fname, tintegral, "lf8"),
+        ):
+            if data is not None:
+                data.flush()
+                levels, lines, columns = data.shape
+                del data
+                WriteMFileTrailer(fname, levels, lines, columns, fmtname)
+
+        return prx, pry, digest.hexdigest()
+
+    def WriteTriangle(self, fname, blocksize=None):
+        """
+        Write the lower triangle of a symmetric matrix, i.e. columns 0 to l of
+        each line l, in the corresponding triangular mfile format, which takes
+        only half of the space (see MappedTriangle).
+        Only the lower triangle is kept, even if the matrix is not symmetric.
+
+        Returns:
+            True if the matrix is symmetric (judging from its projections)
+        """
+        if self.lines != self.columns:
+            raise SpecReaderError(f"{self.fname}: Matrix is not square")
+        fmtname = self.fmtname + "t"
+        if fmtname not in (fmt for _, fmt in _MFILE_TRIANGULAR.values()):
+            raise SpecReaderError(f"{self.fname}: No triangular format for {fmtname}")
+        if blocksize is None:
+            blocksize = max(1, (1 << 24) // (self.columns * self.data.itemsize))
+
+        symmetric = True
+        with open(fname, "wb") as f:
+            for level in range(self.levels):
+                colsum = np.zeros(self.columns)
+                rowsum = np.zeros(self.lines)
+                for l1 in range(0, self.lines, blocksize):
+                    l2 = min(l1 + blocksize, self.lines)
+                    block = np.asarray(self.data[level, l1:l2])
+                    colsum += block.sum(axis=0, dtype=np.float64)
+                    rowsum[l1:l2] = block.sum(axis=1, dtype=np.float64)
+                    for i, line in enumerate(block, l1):
+                        f.write(line[: i + 1].tobytes())
+                symmetric = symmetric and np.array_equal(colsum, rowsum)
+        WriteMFileTrailer(fname, self.levels, self.lines, self.columns, fmtname)
+        return symmetric
+
+    def SetIntegral(self, integral):
+        """
+        Use integral matrix for cuts: Line l of the integral matrix (a
+        MappedMatrix with one more line than this one) holds the sum of all
+        lines below l, so that the sum of any range of lines can be obtained
+        from just two of its lines.
+        """
+        if integral is not None and (
+            integral.levels < self.levels
+            or integral.lines != self.lines + 1
+            or integral.columns != self.columns
+        ):
+            raise SpecReaderError(
+                f"{integral.fname}: Integral does not match matrix {self.fname}"
+            )
+        self.integral = integral
+
+
+class MappedTriangle(MappedMatrix):
+    """
+    Memory-mapped symmetric mfile matrix, of which only the lower triangle is
+    stored (le2t, le4t, he2t and he4t formats). Line l of the file holds
+    columns 0 to l; the remaining columns of the symmetric line are collected
+    from column l of the following lines. Apart from that, it behaves like a
+    square MappedMatrix.
+    """
+
+    def __init__(self, fname, filetype, levels, lines):
+        self.fname = fname
+        self.levels = levels
+        self.lines = lines
+        self.columns = lines
+        try:
+            dtype, self.fmtname = _MFILE_TRIANGULAR[filetype]
+            dtype = np.dtype(dtype)
+        except KeyError:
+            raise SpecReaderError(f"{fname}: File type {filetype} is not triangular")
+        shape = (levels, self.TriPos(lines))
+        if os.path.getsize(fname) < dtype.itemsize * levels * shape[1]:
+            raise SpecReaderError(f"{fname}: File is too small for triangular matrix")
+        self.data = np.memmap(fname, dtype=dtype, mode="r", shape=shape)
+        self._rangeSums = OrderedDict()
+        self.integral = None
+
+    @staticmethod
+    def TriPos(line, col=0):
+        """
+        Position of (line, col) within a level of the file
+        """
+        return line * (line + 1) // 2 + col
+
+    def ReadLines(self, l1, l2, level=0):
+        data = self.data[level]
+        lines = np.zeros((l2 - l1, self.columns), dtype=data.dtype)
+
+        # Row segments, which are stored consecutively
+        start = self.TriPos(l1)
+        rows = np.asarray(data[start : self.TriPos(l2)])
+        for i, line in enumerate(range(l1, l2)):
+            pos = self.TriPos(line) - start
+            lines[i, : line + 1] = rows[pos : pos + line + 1]
+
+        # Column segments inside the block are mirrored row segments
+        block = lines[:, l1:l2]
+        block += np.tril(block, -1).T
+
+        # Beyond the block, line c holds columns l1 to l2 - 1
+        if l2 < self.lines:
+            cols = np.arange(l2, self.lines)
+            lines[:, l2:] = data[
+                self.TriPos(cols)[None, :] + np.arange(l1, l2)[:, None]
+            ]
+        return lines
+
+    def Project(
+        self,
+        trans_fname=None,
+        integral_fname=None,
+        trans_integral_fname=None,
+        nthreads=None,
+        blocksize=None,
+    ):
+        """
+        Compute the projection and optionally the integral matrix, like
+        MappedMatrix.Project(). As the matrix is symmetric, there is no
+        transpose, and both projections are equal.
+        """
+        if trans_fname or trans_integral_fname:
+            raise SpecReaderError(f"{self.fname}: Triangular matrix has no transpose")
+        if blocksize is None:
+            # Lines per block, about 16 MiB each
+            blocksize = max(1, (1 << 24) // (self.columns * 8))
+
+        proj = np.zeros((self.levels, self.lines))
+        integral = None
+        if integral_fname:
+            shape = (self.levels, self.lines + 1, self.columns)
+            integral = np.memmap(integral_fname, dtype="<f8", mode="w+", shape=shape)
+        for level in range(self.levels):
+            for l1 in range(0, self.lines, blocksize):
+                l2 = min(l1 + blocksize, self.lines)
+                block = self.ReadLines(l1, l2, level)
+                proj[level, l1:l2] = block.sum(axis=1, dtype=np.float64)
+                if integral is not None:
+                    integral[level, l1 + 1 : l2 + 1] = integral[
+                        level, l1
+                    ] + block.cumsum(axis=0, dtype=np.float64)
+
+        digest = hashlib.blake2b()
+        with open(self.fname, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 24), b""):
+                digest.update(chunk)
+
+        if integral is not None:
+            integral.flush()
+            del integral
+            WriteMFileTrailer(
+                integral_fname, self.levels, self.lines + 1, self.columns, "lf8"
+            )
+        return proj, proj.copy(), digest.hexdigest()
+
+
+class SpectrumCache:
+    """
+    On-disk cache of parsed spectrum files, so that text and compressed
+    spectra do not have to be parsed again each time they are loaded. Other
+    formats are read about as fast as the cache itself and are not cached.
+
+    Entries are the parsed data (raw float64 numpy arrays) in the spectra
+    directory of the hdtv cache, named after a hash of path and format of
+    the file followed by a hash of its size and modification time, and are
+    memory-mapped when used. Storing an entry removes those of previous
+    versions of the same file. If the cache grows beyond spec.cache.size
+    MiB, the least recently used entries are removed.
+    """
+
+    enabled = hdtv.options.Option(default=True, parse=hdtv.options.parse_bool)
+    hdtv.options.RegisterOption("spec.cache", enabled)
+    size = hdtv.options.Option(default=256.0, parse=float)
+    hdtv.options.RegisterOption("spec.cache.size", size)
+
+    # Statistics of this session
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def GetDir():
+        return os.path.join(hdtv.rootext.dlmgr.cachedir, "spectra")
+
+    @staticmethod
+    def Cacheable(fmt, filetype=None):
+        """
+        Check if spectra in format fmt, read by libmfile as filetype, are
+        worth caching, i.e. are text or compressed files
+        """
+        if (fmt or "").split(":")[0].lower() == "col":
+            return True
+        return filetype in _MFILE_CACHED
+
+    @classmethod
+    def GetFile(cls, fname, fmt):
+        """
+        Name of the cache entry for a spectrum file in the given format, or
+        None if the cache is disabled or the file does not exist
+        """
+        if not cls.enabled.Get():
+            return None
+        try:
+            path = os.path.realpath(fname)
+            stat = os.stat(path)
+        except OSError:
+            return None
+        digests = [
+            hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+            for key in [
+                [path, (fmt or "mfile").lower()],
+                [stat.st_size, stat.st_mtime_ns],
+            ]
+        ]
+        return os.path.join(cls.GetDir(), "-".join(digests) + ".npy")
+
+    @classmethod
+    def Load(cls, key):
+        """
+        Parsed data of cache entry key (see GetFile()), or None. Misses are
+        counted by Store(), since whether a file is worth caching may only be
+        known after reading it.
+        """
+        if key is None:
+            return None
+        try:
+            data = np.load(key, mmap_mode="r")
+            # Mark as recently used
+            os.utime(key)
+        except (OSError, ValueError):
+            return None
+        cls.hits += 1
+        return data
+
+    @classmethod
+    def Store(cls, key, fname, fmt, data, filetype=None):
+        """
+        Store parsed data of fname in cache entry key (see GetFile()), unless
+        the file changed in the meantime or is not worth caching (filetype:
+        libmfile file type, see Cacheable())
+        """
+        if key is None or data is None or not cls.Cacheable(fmt, filetype):
+            return
+        # Data of cacheable files is only stored if it was not in the cache
+        cls.misses += 1
+        if key != cls.GetFile(fname, fmt):
+            return
+        tmp = f"{key}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(cls.GetDir(), exist_ok=True)
+            with open(tmp, "wb") as f:
+                np.save(f, np.asarray(data, dtype=np.float64))
+            os.replace(tmp, key)
+        except OSError as msg:
+            hdtv.ui.debug(f"Failed to cache {fname}: {msg}")
+            return
+        # Entries of previous versions of the file are never used again
+        prefix = os.path.basename(key).split("-")[0] + "-"
+        for _, _, path in cls.Entries():
+            if path != key and os.path.basename(path).startswith(prefix):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        cls.Evict()
+
+    @classmethod
+    def Entries(cls):
+        """
+        List of (last use, size, file name) of all cache entries
+        """
+        entries = []
+        try:
+            with os.scandir(cls.GetDir()) as it:
+                for entry in it:
+                    if entry.name.endswith(".npy"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        except OSError:
+            pass
+        return entries
+
+    @classmethod
+    def Evict(cls, limit=None):
+        """
+        Remove least recently used entries until the cache is smaller than
+        limit (default: spec.cache.size) MiB
+        """
+        if limit is None:
+            limit = cls.size.Get()
+        entries = sorted(cls.Entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= limit * 1024**2:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    @classmethod
+    def Clear(cls):
+        """
+        Remove all entries
+        """
+        cls.Evict(limit=0)
+
+    @classmethod
+    def Stats(cls):
+        """
+        Number of entries, their total size, size limit (in bytes) and hits and
+        misses of this session
+        """
+        entries = cls.Entries()
+        return {
+            "entries": len(entries),
+            "size": sum(size for _, size, _ in entries),
+            "limit": cls.size.Get() * 1024**2,
+            "hits": cls.hits,
+            "misses": cls.misses,
+        }
+
+
+# libmfile is not reentrant (e.g. conversions go through a global buffer), so
+# all calls into it are serialized
+_mfile_lock = threading.RLock()
+
+
 class SpecReader:
     @staticmethod
     def GetSpectrum(fname, fmt=None, histname=None, histtitle=None):
@@ -235,41 +1041,151 @@ class SpecReader:
             #     raise SpecReaderError(cio.GetErrorMsg())
             # return hist
             raise SpecReaderError("Format not longer supported")
-        elif fmt.split(":")[0].lower() == "col":
-            # Extract subformat specifier to pass on to TextSpecReader
-            pos = fmt.find(":")
-            if pos > 0:
-                subfmt = fmt[pos + 1 :]
-            else:
-                subfmt = None
 
+        # Parsed files are cached, see SpectrumCache
+        key = SpectrumCache.GetFile(fname, fmt)
+        data = SpectrumCache.Load(key)
+        if fmt.split(":")[0].lower() == "col":
+            if data is None:
+                data = TextSpecReader.LoadColumns(fname)
+                SpectrumCache.Store(key, fname, fmt, data)
             # The following lines may raise a SpecReaderError exception
-            txtio = TextSpecReader(subfmt)
-            return txtio.GetSpectrum(fname, histname, histtitle)
+            return SpecReader._TextSpectrum(fname, fmt, data, histname, histtitle)
         else:
-            mhist = ROOT.MFileHist()
+            # Get spectra out of Mfile Mat structure
+            # Use the spectra given by line
+            if len(fmt.split(".")) == 3:
+                line = int(fmt.split(".")[0]) - 1
+                hdtv.ui.msg("Using spectra in line " + str(line))
+            if data is None:
+                data, filetype = SpecReader._ReadMFileLine(fname, fmt)
+                SpectrumCache.Store(key, fname, fmt, data, filetype)
+            return SpecReader._ArraySpectrum(data, histname, histtitle)
+
+    @staticmethod
+    def ReadSpectra(files, nworkers=None):
+        """
+        Read several spectra (files given as (fname, fmt) pairs, see
+        GetSpectrum()) concurrently with nworkers workers (default: number of
+        CPUs). Text files are parsed in processes. libmfile is not reentrant,
+        so files read by libmfile are read one after another in a single
+        thread, alongside the text files. The ROOT histograms are only
+        created in the calling thread.
 
+        Returns:
+            List of histograms, in the order of files, with a SpecReaderError
+            or OSError in place of each file that could not be read
+        """
+        if nworkers is None:
+            nworkers = os.cpu_count() or 1
+
+        def IsText(fmt):
+            return fmt is not None and fmt.split(":")[0].lower() == "col"
+
+        def IsCached(fname, fmt):
+            return os.path.exists(SpectrumCache.GetFile(fname, fmt) or "")
+
+        # Files to parse, as far as they are not cached
+        parse = [
+            (fname, fmt)
+            for fname, fmt in files
+            if (fmt is None or fmt.lower() != "cracow") and not IsCached(fname, fmt)
+        ]
+        ntext = sum(1 for _, fmt in parse if IsText(fmt))
+        threads = ThreadPoolExecutor(max_workers=1)
+        # Starting processes only pays off for several files
+        procs = (
+            ProcessPoolExecutor(
+                max_workers=nworkers, mp_context=hdtv.textspec.ProcessContext()
+            )
+            if ntext > 1
+            else threads
+        )
+        hists = []
+        with threads, procs:
+            futures = {}
+            for fname, fmt in parse:
+                key = SpectrumCache.GetFile(fname, fmt)
+                if IsText(fmt):
+                    future = procs.submit(hdtv.textspec.LoadColumns, fname)
+                else:
+                    future = threads.submit(SpecReader._ReadMFileLine, fname, fmt)
+                futures[fname, fmt] = (key, future)
+            for fname, fmt in files:
+                try:
+                    if (fname, fmt) not in futures:
+                        hists.append(SpecReader.GetSpectrum(fname, fmt))
+                        continue
+                    key, future = futures[fname, fmt]
+                    if IsText(fmt):
+                        data, filetype = future.result(), None
+                    else:
+                        data, filetype = future.result()
+                    SpectrumCache.Store(key, fname, fmt, data, filetype)
+                    name = os.path.basename(fname)
+                    if IsText(fmt):
+                        hist = SpecReader._TextSpectrum(fname, fmt, data, name, name)
+                    else:
+                        hist = SpecReader._ArraySpectrum(data, name, name)
+                    hists.append(hist)
+                except (OSError, SpecReaderError) as err:
+                    hists.append(err)
+        return hists
+
+    @staticmethod
+    def _ReadMFileLine(fname, fmt):
+        """
+        Read the line of a spectrum file selected by fmt (as in GetSpectrum())
+        into a numpy array using libmfile
+
+        Returns:
+            The array and the libmfile file type
+        """
+        line = 0
+        if fmt and len(fmt.split(".")) == 3:
+            line = int(fmt.split(".")[0]) - 1
+        with _mfile_lock:
+            mhist = ROOT.MFileHist()
             if not fmt or fmt.lower() == "mfile":
                 result = mhist.Open(fname)
             else:
                 result = mhist.Open(fname, fmt)
-
             if result != ROOT.MFileHist.ERR_SUCCESS:
                 raise SpecReaderError(mhist.GetErrorMsg())
 
-            # Get spectra out of Mfile Mat structure
-            # Use the spectra given by line
-            level = 0
-            line = 0
-            if len(fmt.split(".")) == 3:
-                line = int(fmt.split(".")[0]) - 1
-                level = 0
-                hdtv.ui.msg("Using spectra in line " + str(line))
+            data = np.zeros(mhist.GetNColumns())
+            if not mhist.FillBuf1D(data, 0, line):
+                msg = mhist.GetErrorMsg()
+                mhist.Close()
+                raise SpecReaderError(msg)
+            filetype = mhist.GetFileType()
+            mhist.Close()
+        return data, filetype
 
-            hist = mhist.ToTH1D(histname, histtitle, level, line)
-            if not hist:
-                raise SpecReaderError(mhist.GetErrorMsg())
-            return hist
+    @staticmethod
+    def _ArraySpectrum(data, histname, histtitle):
+        """
+        Create histogram like MFileHist.ToTH1D() from data read by
+        _ReadMFileLine()
+        """
+        nbins = len(data)
+        hist = ROOT.TH1D(histname, histtitle, nbins, -0.5, nbins - 0.5)
+        content = np.zeros(nbins + 2)
+        content[1:-1] = data
+        hist.SetContent(content)
+        # SetBinContent() counts one entry per call
+        hist.SetEntries(nbins)
+        return hist
+
+    @staticmethod
+    def _TextSpectrum(fname, fmt, data, histname, histtitle):
+        """
+        Create histogram from columns read by TextSpecReader.LoadColumns()
+        """
+        # Extract subformat specifier to pass on to TextSpecReader
+        pos = fmt.find(":")
+        txtio = TextSpecReader(fmt[pos + 1 :] if pos > 0 else None)
+        return txtio.GetSpectrum(fname, histname, histtitle, data)
 
     @staticmethod
     def GetMatrix(fname, fmt=None, histname=None, histtitle=None):
@@ -278,18 +1194,19 @@ class SpecReader:
         if histtitle is None:
             histtitle = os.path.basename(fname)
 
-        mhist = ROOT.MFileHist()
+        with _mfile_lock:
+            mhist = ROOT.MFileHist()
 
-        # FIXME: error handling
-        if not fmt or fmt.lower() == "mfile":
-            mhist.Open(fname)
-        else:
-            mhist.Open(fname, fmt)
+            # FIXME: error handling
+            if not fmt or fmt.lower() == "mfile":
+                mhist.Open(fname)
+            else:
+                mhist.Open(fname, fmt)
 
-        # FIXME: this ignores possibly specified bin errors
-        hist = mhist.ToTH2D(histname, histtitle, 0)
-        if not hist:
-            raise SpecReaderError(mhist.GetErrorMsg())
+            # FIXME: this ignores possibly specified bin errors
+            hist = mhist.ToTH2D(histname, histtitle, 0)
+            if not hist:
+                raise SpecReaderError(mhist.GetErrorMsg())
         return hist
 
     @staticmethod
@@ -303,19 +1220,85 @@ class SpecReader:
         if histtitle is None:
             histtitle = os.path.basename(fname)
 
-        mhist = ROOT.MFileHist()
+        with _mfile_lock:
+            mhist = ROOT.MFileHist()
 
-        # FIXME: error handling
-        if not fmt or fmt.lower() == "mfile":
-            mhist.Open(fname)
-        else:
-            mhist.Open(fname, fmt)
+            # FIXME: error handling
+            if not fmt or fmt.lower() == "mfile":
+                mhist.Open(fname)
+            else:
+                mhist.Open(fname, fmt)
 
-        # FIXME: this ignores possibly specified bin errors
-        return ROOT.MFMatrix(mhist, 0)
+            # FIXME: this ignores possibly specified bin errors
+            if ROOT.TriMatrix.IsTriangular(mhist.GetFileType()):
+                return ROOT.TriMatrix(mhist, 0)
+            return ROOT.MFMatrix(mhist, 0)
+
+    @staticmethod
+    def GetMappedMatrix(fname, fmt=None):
+        """
+        Map an uncompressed matrix file into memory (see MappedMatrix and,
+        for triangular formats, MappedTriangle).
+
+        Raises a SpecReaderError for compressed or otherwise unsupported
+        file types, which must be read using GetVMatrix() instead.
+        """
+        with _mfile_lock:
+            mhist = ROOT.MFileHist()
+            if not fmt or fmt.lower() == "mfile":
+                result = mhist.Open(fname)
+            else:
+                result = mhist.Open(fname, fmt)
+            if result != ROOT.MFileHist.ERR_SUCCESS:
+                raise SpecReaderError(mhist.GetErrorMsg())
+            info = (
+                mhist.GetFileType(),
+                mhist.GetNLevels(),
+                mhist.GetNLines(),
+                mhist.GetNColumns(),
+            )
+            mhist.Close()
+        if info[0] in _MFILE_TRIANGULAR:
+            return MappedTriangle(fname, *info[:3])
+        return MappedMatrix(fname, *info)
+
+    @staticmethod
+    def GetMFileHist(fname):
+        """
+        Open a file with libmfile (format autodetected)
+        """
+        with _mfile_lock:
+            mhist = ROOT.MFileHist()
+            if mhist.Open(fname) != ROOT.MFileHist.ERR_SUCCESS:
+                raise SpecReaderError(f"{fname}: {mhist.GetErrorMsg()}")
+        return mhist
+
+    @staticmethod
+    def WriteIntegral(fname, integral_fname):
+        """
+        Write integral matrix (see MappedMatrix.SetIntegral()) of the first
+        level of a matrix file in any format understood by libmfile, reading
+        it line by line
+        """
+        with _mfile_lock:
+            mhist = SpecReader.GetMFileHist(fname)
+            lines, columns = mhist.GetNLines(), mhist.GetNColumns()
+            integral = np.memmap(
+                integral_fname, dtype="<f8", mode="w+", shape=(lines + 1, columns)
+            )
+            buf = np.empty(columns)
+            for line in range(lines):
+                if not mhist.FillBuf1D(buf, 0, line):
+                    raise SpecReaderError(f"{fname}: {mhist.GetErrorMsg()}")
+                np.add(integral[line], buf, out=integral[line + 1])
+            mhist.Close()
+        integral.flush()
+        del integral
+        WriteMFileTrailer(integral_fname, 1, lines + 1, columns, "lf8")
 
     @staticmethod
     def WriteSpectrum(hist, fname, fmt):
-        result = ROOT.MFileHist.WriteTH1(hist, fname, fmt)
-        if result != ROOT.MFileHist.ERR_SUCCESS:
-            raise SpecReaderError(ROOT.MFileHist.GetErrorMsg(result))
+        with _mfile_lock:
+            result = ROOT.MFileHist.WriteTH1(hist, fname, fmt)
+            if result != ROOT.MFileHist.ERR_SUCCESS:
+                raise SpecReaderError(ROOT.MFileHist.GetErrorMsg(result))
@@ -93,13 +93,31 @@ class Spectrum(DrawableManager):
             if self.hist:
                 self.hist.Hide()
 
-    def Refresh(self):
+    def Refresh(self, force=False):
+        """
+        Refresh the histogram, then repeat the fits. If the histogram reports
+        which ranges changed (like FileHistogram), only fits depending on
+        those are repeated, unless force is True.
+        """
         if self.viewport is None:
             return
         with LockViewport(self.viewport):
-            DrawableManager.Refresh(self)
-            if self.hist:
-                self.hist.Refresh()
+            if not self.hist:
+                DrawableManager.Refresh(self)
+                return
+            changed = self.hist.Refresh(force=force)
+            if changed is None or force:
+                DrawableManager.Refresh(self)
+                return
+            ids = []
+            for ID, fit in self.dict.items():
+                extent = fit.extent
+                if extent is not None and any(
+                    x1 <= extent[1] and x2 >= extent[0] for x1, x2 in changed
+                ):
+                    ids.append(ID)
+            if ids:
+                self.RefreshObjects(ids)
 
 
 class CutSpectrum(Spectrum):
@@ -126,7 +144,7 @@ class CutSpectrum(Spectrum):
         if self.matrix:
             self.matrix.Hide()
 
-    def Refresh(self):
+    def Refresh(self, force=False):
         """
         Repeat the cut
         """
@@ -0,0 +1,57 @@
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+Parsing of text spectra into numpy arrays. This module must not import
+ROOT, so that worker processes reading text files (see
+hdtv.specreader.SpecReader.ReadSpectra()) start quickly and safely.
+"""
+
+import multiprocessing
+import warnings
+
+import numpy as np
+
+
+def LoadColumns(fname, cmts=("#", "!", "//")):
+    """
+    Load all columns of a text file as 2d numpy array, or None if this is
+    not possible. This does not depend on the format and can be done in
+    another process.
+    """
+    comments = list(cmts) if cmts else None
+    try:
+        with warnings.catch_warnings():
+            # Empty files are handled by the line-by-line parser
+            warnings.simplefilter("error", UserWarning)
+            return np.loadtxt(fname, dtype=float, comments=comments, ndmin=2)
+    except (ValueError, UserWarning):
+        return None
+
+
+def ProcessContext():
+    """
+    Multiprocessing context for worker processes running LoadColumns().
+    Forking the (multithreaded) ROOT process is not safe, so the workers
+    are forked from a fresh server process, or spawned if that is not
+    available.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
@@ -0,0 +1,111 @@
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+import os
+
+import numpy as np
+import pytest
+
+from hdtv.listmode import Gate, ListmodeError, ListmodeFile, Sorter, WriteMatrix
+from hdtv.specreader import MappedMatrix
+
+
+def write_events(fname, nevents=5000, header=b""):
+    rng = np.random.default_rng(42)
+    events = np.empty(nevents, dtype=[("e1", "<f4"), ("e2", "<f4"), ("t", "<f4")])
+    events["e1"] = rng.uniform(-5, 70, nevents)
+    events["e2"] = rng.uniform(-5, 70, nevents)
+    events["t"] = rng.normal(0, 100, nevents)
+    with open(fname, "wb") as f:
+        f.write(header)
+        f.write(events.tobytes())
+    return events
+
+
+def channels(values, nbins, binsize=1.0):
+    bins = np.floor(values / binsize + 0.5)
+    return np.where((bins >= 0) & (bins < nbins), bins, -1)
+
+
+def test_listmode_file(temp_file):
+    events = write_events(temp_file, 1000, header=b"HDR!")
+    lmfile = ListmodeFile(temp_file, header=4)
+    assert lmfile.nevents == 1000
+    chunks = list(lmfile.Chunks(100, 1000, 300))
+    assert [len(chunk) for chunk in chunks] == [300, 300, 300]
+    assert (np.concatenate(chunks) == events[100:]).all()
+    with pytest.raises(ListmodeError):
+        ListmodeFile(temp_file)
+
+
+@pytest.mark.parametrize("nprocs", [1, 3])
+def test_sort_spectrum(temp_file, nprocs):
+    events = write_events(temp_file)
+    sorter = Sorter(
+        ListmodeFile(temp_file),
+        ["e1", "e2"],
+        nbins=40,
+        binsize=1.5,
+        gates=[Gate.Parse("t:50:-80")],
+    )
+    sorter.CHUNKSIZE = 700
+    spec = sorter.Sort(nprocs)
+
+    events = events[(events["t"] >= -80) & (events["t"] <= 50)]
+    expected = np.zeros(40)
+    for field in ("e1", "e2"):
+        bins = channels(events[field], 40, 1.5)
+        expected += np.bincount(bins[bins >= 0].astype(int), minlength=40)
+    assert (spec == expected).all()
+
+
+@pytest.mark.parametrize("sym", [False, True])
+def test_sort_matrix(temp_file, sym):
+    events = write_events(temp_file)
+    sorter = Sorter(ListmodeFile(temp_file), ["e1", "e2"], 64, matrix=True, sym=sym)
+    sorter.CHUNKSIZE = 1024
+    matrix = sorter.Sort(2)
+
+    x = channels(events["e1"], 64)
+    y = channels(events["e2"], 64)
+    valid = (x >= 0) & (y >= 0)
+    expected, _, _ = np.histogram2d(y[valid], x[valid], bins=64, range=[[0, 64]] * 2)
+    if sym:
+        expected += expected.T
+    assert (matrix == expected).all()
+
+    fname = temp_file + ".mtx"
+    assert WriteMatrix(fname, matrix) == "le4"
+    try:
+        assert (MappedMatrix(fname, 3, 1, 64, 64).data[0] == matrix).all()
+    finally:
+        os.remove(fname)
+
+
+def test_sort_invalid(temp_file):
+    write_events(temp_file, 10)
+    lmfile = ListmodeFile(temp_file)
+    with pytest.raises(ListmodeError):
+        Sorter(lmfile, ["e3"], 10)
+    with pytest.raises(ListmodeError):
+        Sorter(lmfile, ["e1"], 10, matrix=True)
+    with pytest.raises(ListmodeError):
+        Sorter(lmfile, ["e1"], 10, gates=[Gate("x", 0, 1)])
+    with pytest.raises(ListmodeError):
+        Gate.Parse("t:0")
@@ -0,0 +1,198 @@
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+
+import os
+
+import numpy as np
+import pytest
+import ROOT
+
+import hdtv.cal
+from hdtv.cut import Cut
+from hdtv.histogram import (
+    CompressedMatrix,
+    ContentsView,
+    CutHistogram,
+    CutWeights,
+    MHisto2D,
+    RHisto2D,
+    THnSparseWrapper,
+)
+from hdtv.matrix import CutCache
+from hdtv.specreader import MappedMatrix, SpecReaderError, WriteMFileTrailer
+
+
+def make_cut(name, nbins=100):
+    rhist = ROOT.TH1D(name, name, nbins, -0.5, nbins - 0.5)
+    for b in range(1, nbins + 1):
+        rhist.SetBinContent(b, b)
+    hist = CutHistogram(rhist, "x", None)
+    hist.typeStr = "cut"
+    return hist
+
+
+@pytest.mark.parametrize(
+    "histtype, dtype",
+    [
+        ("TH1D", np.float64),
+        ("TH1F", np.float32),
+        ("TH1I", np.int32),
+        ("TH2S", np.int16),
+    ],
+)
+def test_contents_view(histtype, dtype):
+    args = (10, -0.5, 9.5) * (2 if histtype.startswith("TH2") else 1)
+    hist = getattr(ROOT, histtype)(histtype, histtype, *args)
+    view = ContentsView(hist)
+    assert view.dtype == dtype
+    assert len(view) == hist.GetNcells()
+    view[3] = 7
+    assert hist.GetBinContent(3) == 7
+
+
+def test_cut_cache_copies():
+    cache = CutCache()
+    key = ("x", ((10, 20),), ())
+    cache.Put(key, make_cut("a"), 10**6)
+    assert cache.Get(("y", ((10, 20),), ())) is None
+
+    first = cache.Get(key)
+    assert first.typeStr == "cut"
+    assert first.axis == "x"
+    assert first.hist.GetBinContent(42) == 42
+    first.hist.SetBinContent(42, 0)
+    assert cache.Get(key).hist.GetBinContent(42) == 42
+
+
+def test_cut_cache_cal():
+    cache = CutCache()
+    key = ("x", ((10, 20),), ())
+    cut = make_cut("a")
+    cut.cal = hdtv.cal.MakeCalibration([0.0, 1.0])
+    cache.Put(key, cut, 10**6)
+
+    # The calibration is the current one, not the one of the cached cut
+    cal = hdtv.cal.MakeCalibration([1.0, 2.0])
+    assert cache.Get(key, cal).cal.Ch2E(10.0) == pytest.approx(21.0)
+
+
+def test_cut_cache_budget():
+    cache = CutCache()
+    size = CutCache.Size(make_cut("a").hist)
+    for i in range(4):
+        cache.Put(("x", ((i, i),), ()), make_cut(str(i)), 3 * size)
+    assert cache.nbytes == 3 * size
+    assert cache.Get(("x", ((0, 0),), ())) is None
+    assert cache.Get(("x", ((1, 1),), ())) is not None
+
+    # Entry 2 is now the least recently used one
+    cache.Put(("x", ((4, 4),), ()), make_cut("4"), 3 * size)
+    assert cache.Get(("x", ((2, 2),), ())) is None
+    assert cache.Get(("x", ((1, 1),), ())) is not None
+
+    cache.Put(("x", ((5, 5),), ()), make_cut("5", nbins=1000), 3 * size)
+    assert cache.Get(("x", ((5, 5),), ())) is None
+
+    cache.Clear()
+    assert cache.nbytes == 0
+    assert not cache.entries
+
+
+def make_th2(sparse=False):
+    rhist = ROOT.TH2D("th2", "th2", 40, -0.5, 39.5, 30, -0.5, 29.5)
+    rhist.Sumw2()
+    for x in range(40):
+        for y in range(30):
+            rhist.Fill(x, y, (x * 7 + y * 3) % 11)
+    if sparse:
+        return THnSparseWrapper(ROOT.THnSparseD.CreateSparse("sparse", "", rhist))
+    return rhist
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("axis", ["x", "y"])
+def test_rhisto2d_cut(sparse, axis):
+    cut = Cut()
+    for pos in (10, 14):
+        cut.SetMarker("region", pos)
+    for pos in (3, 4, 20, 25):
+        cut.SetMarker("bg", pos)
+
+    histo2D = RHisto2D(make_th2(sparse))
+    hist = histo2D.ExecuteCut(cut.regionMarkers, cut.bgMarkers, axis)
+
+    rhist = make_th2()
+    projector = rhist.ProjectionY if axis == "x" else rhist.ProjectionX
+    expected = projector("fg", 11, 15, "e")
+    expected.Add(projector("bg1", 4, 5, "e"), -5 / 8)
+    expected.Add(projector("bg2", 21, 26, "e"), -5 / 8)
+    for b in range(expected.GetNcells()):
+        assert np.isclose(hist.hist.GetBinContent(b), expected.GetBinContent(b))
+        assert np.isclose(hist.hist.GetBinError(b), expected.GetBinError(b))
+
+
+def test_sparse_projections():
+    rhist = make_th2()
+    sparse = make_th2(sparse=True)
+    for proj, expected in (
+        (sparse.ProjectionX("px", 0, -1, "e"), rhist.ProjectionX("ex", 0, -1, "e")),
+        (sparse.ProjectionY("py", 5, 9, "e"), rhist.ProjectionY("ey", 5, 9, "e")),
+    ):
+        assert proj.GetNbinsX() == expected.GetNbinsX()
+        for b in range(expected.GetNcells()):
+            assert np.isclose(proj.GetBinContent(b), expected.GetBinContent(b))
+            assert np.isclose(proj.GetBinError(b), expected.GetBinError(b))
+
+
+def test_compressed_matrix_save(temp_file):
+    x = np.array([1, 3, 3, 0, 2])
+    y = np.array([2, 0, 1, 1, 2])
+    contents = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+    matrix = CompressedMatrix.FromBins((4, 3), x, y, contents)
+    assert (matrix.lines["x"][0] == [0, 1, 2, 3, 5]).all()
+    assert (matrix.lines["y"][0] == [0, 1, 3, 5]).all()
+
+    matrix.Save(temp_file)
+    loaded = CompressedMatrix.Load(temp_file)
+    assert loaded.nbins == (4, 3)
+    weights = np.array([CutWeights(4, [(2, 3)], [(0, 0)])])
+    cuts, sumw2 = loaded.Cut(weights, "x")
+    assert np.allclose(cuts, [[2.0, -5.0, 5.0]])
+    assert np.allclose(sumw2, [[2.0, 4.0 * 4 + 3.0, 5.0]])
+
+
+def test_mhisto2d_triangle_levels(tmp_path):
+    # Symmetric matrix with two different levels, packed into a triangle
+    rng = np.random.default_rng(42)
+    data = rng.integers(0, 100, (2, 32, 32))
+    data += data.transpose(0, 2, 1)
+    square = str(tmp_path / "square.mtx")
+    data.astype("<i4").tofile(square)
+    WriteMFileTrailer(square, 2, 32, 32, "le4")
+    fname = str(tmp_path / "tri.mtx")
+    assert MappedMatrix(square, 3, 2, 32, 32).WriteTriangle(fname)
+
+    histo = MHisto2D(fname, True, integral=True)
+    assert os.path.exists(str(tmp_path / "tri.imtx"))
+    assert histo.xproj.counts == pytest.approx(data[0].sum(axis=1))
+    assert histo.mmatrix.Cut([(3, 5)], []) == pytest.approx(data[0, 3:6].sum(axis=0))
+
+    with pytest.raises(SpecReaderError):
+        MHisto2D(fname, False)
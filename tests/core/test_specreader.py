@@ -0,0 +1,312 @@
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+import hashlib
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+import hdtv.rootext.dlmgr
+import hdtv.textspec
+from hdtv.specreader import (
+    CutMany,
+    MappedMatrix,
+    MappedTriangle,
+    SpecReaderError,
+    SpectrumCache,
+    TextSpecReader,
+)
+
+
+@pytest.mark.parametrize(
+    "fmt, content",
+    [
+        (None, "# counts\n3\n5\n\n7\n"),
+        (None, "1.5 3\n0.5 5 ! comment\n2.5 7\n"),
+        (None, "1 3 1.5\n0 5 2.5\n// comment\n2 7 3.5\n"),
+        ("yx", "3 1\n5 0\n7 2\n"),
+        ("iyex", "0 3 1 10\n0 5 2 12.5\n0 7 3 11\n"),
+    ],
+)
+def test_text_spec_reader_bulk(temp_file, fmt, content):
+    with open(temp_file, "w") as f:
+        f.write(content)
+
+    fast = TextSpecReader(fmt).GetSpectrum(temp_file, "fast", "fast")
+    slow = TextSpecReader(fmt)._GetSpectrumByLine(temp_file, "slow", "slow")
+
+    assert fast.GetNbinsX() == slow.GetNbinsX()
+    for b in range(slow.GetNbinsX() + 2):
+        assert fast.GetBinLowEdge(b) == slow.GetBinLowEdge(b)
+        assert fast.GetBinContent(b) == slow.GetBinContent(b)
+        assert fast.GetBinError(b) == slow.GetBinError(b)
+    assert fast.GetEntries() == slow.GetEntries()
+
+
+@pytest.mark.parametrize(
+    "fmt, content",
+    [
+        (None, "1 2 3 4\n"),
+        (None, "1 2\n3\n"),
+        ("xy", "1 2\n3 a\n"),
+    ],
+)
+def test_text_spec_reader_invalid(temp_file, fmt, content):
+    with open(temp_file, "w") as f:
+        f.write(content)
+
+    with pytest.raises(SpecReaderError):
+        TextSpecReader(fmt).GetSpectrum(temp_file, "invalid", "invalid")
+
+
+def test_bin_low_edges():
+    centers = np.sort(np.random.default_rng(42).uniform(0, 1000, 1000))
+
+    expected = []
+    w = (centers[1] - centers[0]) / 2.0
+    expected.append(centers[0] - w)
+    for i in range(1, len(centers)):
+        w = (centers[i] - centers[i - 1]) - w
+        expected.append(centers[i] - w)
+    expected.append(centers[-1] + w)
+
+    assert list(TextSpecReader().GetBinLowEdges(list(centers))) == expected
+
+
+@pytest.mark.parametrize("filetype, dtype", [(3, "<i4"), (5, ">i4"), (7, "<f4")])
+def test_mapped_matrix_cut(temp_file, filetype, dtype):
+    data = np.arange(40 * 30).reshape(40, 30) % 17
+    data.astype(dtype).tofile(temp_file)
+
+    matrix = MappedMatrix(temp_file, filetype, 1, 40, 30)
+    assert (matrix.data[0] == data).all()
+    assert matrix.MergeRegions([(12, 5), (7, 14), (35, 50), (-3, -1)]) == [
+        [5, 14],
+        [35, 39],
+    ]
+
+    cut = matrix.Cut([(5, 9), (8, 12)], [(20, 21), (30, 31)])
+    expected = data[5:13].sum(axis=0) - 2 * (
+        data[20:22].sum(axis=0) + data[30:32].sum(axis=0)
+    )
+    assert np.allclose(cut, expected)
+    assert matrix.Cut([(50, 60)], []) is None
+
+
+def test_mapped_matrix_too_small(temp_file):
+    np.zeros(10, dtype="<i4").tofile(temp_file)
+    with pytest.raises(SpecReaderError):
+        MappedMatrix(temp_file, 3, 1, 4, 4)
+
+
+def test_mapped_matrix_project(temp_file):
+    data = np.arange(50 * 40).reshape(50, 40) % 23
+    data.astype("<i4").tofile(temp_file)
+    trans_fname = temp_file + ".tmtx"
+
+    matrix = MappedMatrix(temp_file, 3, 1, 50, 40)
+    prx, pry, digest = matrix.Project(trans_fname, nthreads=3, blocksize=7)
+    assert (prx[0] == data.sum(axis=0)).all()
+    assert (pry[0] == data.sum(axis=1)).all()
+    with open(temp_file, "rb") as f:
+        assert digest == hashlib.blake2b(f.read()).hexdigest()
+
+    with open(trans_fname, "rb") as f:
+        raw = f.read()
+    os.remove(trans_fname)
+    trans = np.frombuffer(raw[:-64], dtype="<i4").reshape(40, 50)
+    assert (trans == data.T).all()
+    assert raw[-64:].rstrip(b"\0") == b"\nMatFmt: 40.50.le4:1\n"
+
+
+def test_mapped_matrix_range_sums(temp_file):
+    data = np.arange(60 * 20).reshape(60, 20) % 13
+    data.astype("<i4").tofile(temp_file)
+
+    matrix = MappedMatrix(temp_file, 3, 1, 60, 20)
+    for l1, l2 in [(10, 30), (8, 33), (12, 29), (31, 40), (0, 59), (10, 30)]:
+        assert (matrix.SumRange(l1, l2) == data[l1 : l2 + 1].sum(axis=0)).all()
+    assert len(matrix._rangeSums) == 5
+
+    matrix.ClearCache()
+    assert not matrix._rangeSums
+
+
+def test_mapped_matrix_integral(temp_file):
+    data = np.arange(70 * 30).reshape(70, 30) % 11
+    data.astype("<i4").tofile(temp_file)
+    integral_fname = temp_file + ".imtx"
+
+    matrix = MappedMatrix(temp_file, 3, 1, 70, 30)
+    matrix.Project(integral_fname=integral_fname, nthreads=2, blocksize=9)
+    integral = MappedMatrix(integral_fname, 8, 1, 71, 30)
+    assert (integral.data[0, 0] == 0).all()
+    assert (integral.data[0, 1:] == data.cumsum(axis=0)).all()
+
+    matrix.SetIntegral(integral)
+    cut = matrix.Cut([(3, 17), (40, 90)], [(20, 24)])
+    expected = data[3:18].sum(axis=0) + data[40:].sum(axis=0)
+    expected = expected - 45 / 5 * data[20:25].sum(axis=0)
+    assert np.allclose(cut, expected)
+
+    with pytest.raises(SpecReaderError):
+        integral.SetIntegral(matrix)
+    del integral
+    os.remove(integral_fname)
+
+
+@pytest.mark.parametrize("blocksize", [None, 1, 4])
+def test_cut_many(temp_file, blocksize):
+    data = np.arange(80 * 25).reshape(80, 25) % 19
+    data.astype("<i4").tofile(temp_file)
+
+    matrix = MappedMatrix(temp_file, 3, 1, 80, 25)
+    gates = [
+        ([(10, 14)], [(20, 23), (60, 65)]),
+        ([(12, 30)], []),
+        ([(90, 95)], [(0, 3)]),
+        ([(3, 3), (40, 44)], [(11, 13)]),
+        ([(-4, 2)], [(75, 99)]),
+    ]
+    merged = [
+        (matrix.MergeRegions(regions), matrix.MergeRegions(bgregions))
+        for regions, bgregions in gates
+    ]
+    cuts = CutMany(lambda l1, l2: data[l1:l2], 25, merged, blocksize)
+    assert cuts[2] is None
+    for (regions, bgregions), cut in zip(gates, cuts):
+        if cut is not None:
+            assert np.allclose(cut, matrix.Cut(regions, bgregions))
+    for cut, expected in zip(matrix.CutMany(gates), cuts):
+        assert cut is None if expected is None else np.allclose(cut, expected)
+
+
+def test_mapped_triangle(temp_file):
+    data = np.arange(45 * 45).reshape(45, 45) % 29
+    data = data + data.T
+    data.astype("<i4").tofile(temp_file)
+    packed_fname = temp_file + ".tri"
+    integral_fname = temp_file + ".imtx"
+
+    matrix = MappedMatrix(temp_file, 3, 1, 45, 45)
+    assert matrix.WriteTriangle(packed_fname, blocksize=4)
+    with open(packed_fname, "rb") as f:
+        raw = f.read()
+    assert len(raw) == 45 * 46 // 2 * 4 + 64
+    assert raw[-64:].rstrip(b"\0") == b"\nMatFmt: 45.45.le4t:1\n"
+
+    tri = MappedTriangle(packed_fname, 16, 1, 45)
+    for l1, l2 in [(0, 45), (0, 1), (10, 17), (44, 45), (30, 31)]:
+        assert (tri.ReadLines(l1, l2) == data[l1:l2]).all()
+    cut = tri.Cut([(5, 9), (8, 12)], [(20, 21), (40, 50)])
+    assert np.allclose(cut, matrix.Cut([(5, 9), (8, 12)], [(20, 21), (40, 50)]))
+
+    prx, pry, digest = tri.Project(integral_fname=integral_fname, blocksize=6)
+    assert (prx[0] == data.sum(axis=0)).all()
+    assert (pry[0] == data.sum(axis=1)).all()
+    assert digest == hashlib.blake2b(raw).hexdigest()
+    integral = MappedMatrix(integral_fname, 8, 1, 46, 45)
+    assert (integral.data[0, 0] == 0).all()
+    assert (integral.data[0, 1:] == data.cumsum(axis=0)).all()
+    with pytest.raises(SpecReaderError):
+        tri.Project(trans_fname=temp_file + ".tmtx")
+    del integral, tri
+    os.remove(integral_fname)
+
+    # Not symmetric: only the lower triangle is kept
+    np.tril(data).astype("<i4").tofile(temp_file)
+    assert not MappedMatrix(temp_file, 3, 1, 45, 45).WriteTriangle(packed_fname)
+    tri = MappedTriangle(packed_fname, 16, 1, 45)
+    lower = np.tril(data)
+    assert (tri.ReadLines(0, 45) == lower + np.tril(lower, -1).T).all()
+    del tri
+    os.remove(packed_fname)
+
+
+def test_textspec_workers(temp_file):
+    np.savetxt(temp_file, np.arange(10.0))
+    ctx = hdtv.textspec.ProcessContext()
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        data = pool.submit(hdtv.textspec.LoadColumns, temp_file).result()
+    assert np.array_equal(data, np.arange(10.0).reshape(-1, 1))
+
+    # The workers do not need to load ROOT
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    code = "import sys, hdtv.textspec; sys.exit('ROOT' in sys.modules)"
+    subprocess.run([sys.executable, "-c", code], check=True, env=env)
+
+
+def test_spectrum_cache(temp_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(hdtv.rootext.dlmgr, "cachedir", str(tmp_path))
+    monkeypatch.setattr(SpectrumCache, "hits", 0)
+    monkeypatch.setattr(SpectrumCache, "misses", 0)
+    np.savetxt(temp_file, np.arange(100.0))
+    data = TextSpecReader.LoadColumns(temp_file)
+
+    key = SpectrumCache.GetFile(temp_file, "col")
+    assert key != SpectrumCache.GetFile(temp_file, "col:xy")
+    assert SpectrumCache.Load(key) is None
+    SpectrumCache.Store(key, temp_file, "col", data)
+    cached = SpectrumCache.Load(key)
+    assert isinstance(cached, np.memmap)
+    assert np.array_equal(cached, data)
+    assert SpectrumCache.Stats()["entries"] == 1
+    assert (SpectrumCache.hits, SpectrumCache.misses) == (1, 1)
+
+    # Changed files get a new entry
+    with open(temp_file, "a") as f:
+        f.write("100\n")
+    os.utime(temp_file, ns=(0, 0))
+    assert SpectrumCache.GetFile(temp_file, "col") != key
+    # Data read before the change is not stored
+    other = SpectrumCache.GetFile(temp_file, "mfile")
+    SpectrumCache.Store(key, temp_file, "col", data)
+    SpectrumCache.Store(other, temp_file, "mfile", np.zeros(1000), filetype=1)
+    assert SpectrumCache.Stats()["entries"] == 2
+
+    # Uncompressed binary files are not cached
+    os.utime(temp_file, ns=(1, 1))
+    binary = SpectrumCache.GetFile(temp_file, "mfile")
+    SpectrumCache.Store(binary, temp_file, "mfile", np.zeros(1000), filetype=3)
+    assert not os.path.exists(binary)
+    # ... and do not count as misses
+    assert (SpectrumCache.hits, SpectrumCache.misses) == (1, 3)
+
+    # Entries of previous versions of a file are removed
+    SpectrumCache.Store(binary, temp_file, "mfile", np.zeros(1000), filetype=1)
+    assert os.path.exists(binary)
+    assert not os.path.exists(other)
+    other, old = binary, key
+    key = SpectrumCache.GetFile(temp_file, "col")
+    SpectrumCache.Store(key, temp_file, "col", data)
+    assert not os.path.exists(old)
+    assert SpectrumCache.Stats()["entries"] == 2
+
+    # Least recently used entries are evicted first
+    os.utime(key, ns=(0, 0))
+    SpectrumCache.Evict(limit=SpectrumCache.Stats()["size"] / 1024**2 - 1e-6)
+    assert not os.path.exists(key)
+    assert os.path.exists(other)
+
+    SpectrumCache.Clear()
+    assert SpectrumCache.Stats()["entries"] == 0
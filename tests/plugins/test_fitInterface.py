@@ -29,7 +29,9 @@ from tests.helpers.utils import hdtvcmd
 monkey_patch_ui()
 
 import __main__
+import hdtv.cal
 import hdtv.cmdline
+import hdtv.fitter
 import hdtv.options
 import hdtv.session
 
@@ -105,6 +107,24 @@ def test_cmd_fit_peakfind():
     assert "WARNING: Adding invalid fit" in ferr
 
 
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_cmd_fit_execute_parallel():
+    spec_interface.LoadSpectra(testspectrum)
+    hdtvcmd("fit peakfind -a -t 0.002")
+    spec = spectra.dict[spectra.activeID]
+    ids = sorted(spec.ids)
+    assert len(ids) > 10
+
+    f, ferr = hdtvcmd("fit execute --all")
+    serial = [[p.pos.nominal_value for p in spec.dict[ID].peaks] for ID in ids]
+    f, ferr = hdtvcmd("fit execute --all --parallel 4")
+    assert "failed" not in ferr
+    parallel = [[p.pos.nominal_value for p in spec.dict[ID].peaks] for ID in ids]
+    for ID, s, p in zip(ids, serial, parallel):
+        assert f"Executing fit {ID} in spectrum" in f
+        assert p == pytest.approx(s, rel=1e-4)
+
+
 @pytest.mark.filterwarnings("ignore::RuntimeWarning")
 @pytest.mark.parametrize("peak", ["theuerkauf", "ee"])
 @pytest.mark.parametrize("bg", ["polynomial", "exponential", "interpolation"])
@@ -165,6 +185,170 @@ def test_cmd_fit_copy():
     assert workFit.fitter == newFit.fitter
 
 
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("likelihood", ["normal", "poisson"])
+@pytest.mark.parametrize("tails", [False, True])
+def test_cmd_fit_gradient(likelihood, tails):
+    spec_interface.LoadSpectra(testspectrum)
+    setup_fit()
+    hdtvcmd(
+        "fit function peak activate theuerkauf",
+        f"fit parameter likelihood {likelihood}",
+        "fit parameter sh free",
+    )
+    if tails:
+        hdtvcmd("fit parameter tl free", "fit parameter tr free")
+    results = {}
+    for gradient in ["False", "True"]:
+        f, ferr = hdtvcmd(f"fit parameter gradient {gradient}", "fit execute")
+        assert "2 peaks in WorkFit" in f
+        peaks = spec_interface.spectra.workFit.peaks
+        results[gradient] = [
+            (p.pos.nominal_value, p.vol.nominal_value, p.width.nominal_value)
+            for p in peaks
+        ]
+    for numeric, analytic in zip(results["False"], results["True"]):
+        assert analytic == pytest.approx(numeric, rel=1e-3)
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("likelihood", ["normal", "poisson"])
+@pytest.mark.parametrize("gradient", [False, True])
+@pytest.mark.parametrize("tails", [False, True])
+@pytest.mark.parametrize("integrate", [False, True])
+def test_cmd_fit_engine(likelihood, gradient, tails, integrate):
+    spec_interface.LoadSpectra(testspectrum)
+    setup_fit()
+    hdtvcmd(
+        "fit function peak activate theuerkauf",
+        "fit function background activate polynomial",
+        f"fit parameter likelihood {likelihood}",
+        f"fit parameter gradient {gradient}",
+        f"fit parameter integrate {integrate}",
+    )
+    if tails:
+        hdtvcmd(
+            "fit parameter tl free", "fit parameter tr free", "fit parameter sh free"
+        )
+    results = {}
+    for engine in ["root", "direct"]:
+        f, ferr = hdtvcmd(f"fit parameter engine {engine}", "fit execute")
+        assert "2 peaks in WorkFit" in f
+        peaks = spec_interface.spectra.workFit.peaks
+        results[engine] = [
+            (p.pos.nominal_value, p.vol.nominal_value, p.width.nominal_value)
+            for p in peaks
+        ]
+    for root, direct in zip(results["root"], results["direct"]):
+        assert direct == pytest.approx(root, rel=1e-3)
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_cmd_fit_warmstart():
+    spec_interface.LoadSpectra(testspectrum)
+    setup_fit()
+    hdtvcmd(
+        "fit function peak activate theuerkauf",
+        "fit parameter tl free",
+        "fit execute",
+    )
+    workFit = spec_interface.spectra.workFit
+    cold = [(p.vol.nominal_value, p.width.nominal_value) for p in workFit.peaks]
+
+    # Setting the parameter already refits (warm started)
+    hdtvcmd("fit parameter warmstart True")
+    prev = [(p.vol.nominal_value, p.width.nominal_value) for p in workFit.peaks]
+    f, ferr = hdtvcmd("fit execute")
+    assert "2 peaks in WorkFit" in f
+    start, bgstart = workFit.GetStartValues()
+    assert [(s["vol"], s["width"]) for s in start] == pytest.approx(prev)
+    assert bgstart is None
+    warm = [(p.vol.nominal_value, p.width.nominal_value) for p in workFit.peaks]
+    assert warm == pytest.approx(cold, rel=1e-3)
+
+    # Copies map the start values to their calibration
+    newFit = copy.copy(workFit)
+    newFit.cal = hdtv.cal.MakeCalibration([0.0, 2.0])
+    start, bgstart = newFit.GetStartValues()
+    assert [s["width"] for s in start] == pytest.approx(
+        [p.width.nominal_value / 2.0 for p in workFit.peaks]
+    )
+
+
+@pytest.fixture
+def fitpeaks_calls(monkeypatch):
+    """
+    Record the start values passed to Fitter.FitPeaks()
+    """
+    calls = []
+    fitpeaks = hdtv.fitter.Fitter.FitPeaks
+
+    def FitPeaks(self, *args, start=None, bgstart=None, **kwargs):
+        calls.append((start, bgstart))
+        return fitpeaks(self, *args, start=start, bgstart=bgstart, **kwargs)
+
+    monkeypatch.setattr(hdtv.fitter.Fitter, "FitPeaks", FitPeaks)
+    return calls
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_cmd_fit_warmstart_intbg(fitpeaks_calls):
+    spec_interface.LoadSpectra(testspectrum)
+    hdtvcmd(
+        "fit function peak activate theuerkauf",
+        "fit function background activate polynomial",
+        "fit parameter background 2",
+        "fit marker peak set 580",
+        "fit marker peak set 610",
+        "fit marker region set 570",
+        "fit marker region set 615",
+        "fit execute",
+    )
+    workFit = spec_interface.spectra.workFit
+    cold = [(p.vol.nominal_value, p.width.nominal_value) for p in workFit.peaks]
+
+    # Setting the parameter already refits (warm started)
+    hdtvcmd("fit parameter warmstart True")
+    prev = [(p.vol.nominal_value, p.width.nominal_value) for p in workFit.peaks]
+    coeffs = [p.nominal_value for p in workFit.bgParams]
+    f, ferr = hdtvcmd("fit execute")
+    assert "2 peaks in WorkFit" in f
+    start, bgstart = fitpeaks_calls[-1]
+    assert [(s["vol"], s["width"]) for s in start] == pytest.approx(prev)
+    assert bgstart == pytest.approx(coeffs)
+    warm = [(p.vol.nominal_value, p.width.nominal_value) for p in workFit.peaks]
+    assert warm == pytest.approx(cold, rel=1e-3)
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_cmd_fit_warmstart_clear(fitpeaks_calls):
+    spec_interface.LoadSpectra(testspectrum)
+    hdtvcmd("fit parameter warmstart True")
+    setup_fit()
+    hdtvcmd("fit execute", "fit execute")
+    workFit = spec_interface.spectra.workFit
+    start, bgstart = workFit.GetStartValues()
+    assert len(start) == 2
+
+    # Fits of other regions are not warm started ...
+    hdtvcmd("fit marker region set 575")
+    assert workFit.GetStartValues() == (None, None)
+
+    # ... neither after clearing the fit, nor after storing it
+    hdtvcmd("fit execute", "fit clear")
+    workFit = spec_interface.spectra.workFit
+    assert workFit.GetStartValues() == (None, None)
+    setup_fit()
+    hdtvcmd("fit execute", "fit store", "fit clear")
+    workFit = spec_interface.spectra.workFit
+    assert workFit.GetStartValues() == (None, None)
+    del fitpeaks_calls[:]
+    f, ferr = setup_fit()
+    f, ferr = hdtvcmd("fit execute")
+    assert "2 peaks in WorkFit" in f
+    assert fitpeaks_calls == [(None, None)]
+
+
 def test_interpolation_incomplete():
     spec_interface.LoadSpectra(testspectrum)
     assert len(spec_interface.spectra.dict) == 1
@@ -43,6 +43,7 @@ import hdtv.plugins.fitInterface
 import hdtv.plugins.fitlist
 import hdtv.plugins.fitmap
 import hdtv.plugins.fittex
+import hdtv.plugins.listmode
 import hdtv.plugins.matInterface
 import hdtv.plugins.peakfinder
 import hdtv.plugins.printing
@@ -115,6 +116,7 @@ cmdlist = [
     "matrix get",
     "matrix list",
     # "matrix project",
+    "matrix sort",
     "matrix view",
     "nuclide",
     "print",
@@ -125,6 +127,8 @@ cmdlist = [
     "root matrix view",
     "spectrum activate",
     "spectrum add",
+    "spectrum cache clear",
+    "spectrum cache stats",
     "spectrum calbin",
     "spectrum copy",
     "spectrum delete",
@@ -137,6 +141,7 @@ cmdlist = [
     "spectrum normalize",
     "spectrum rebin",
     "spectrum show",
+    "spectrum sort",
     "spectrum substract",
     "spectrum update",
     "spectrum write",
@@ -17,9 +17,11 @@
 # along with HDTV; if not, write to the Free Software Foundation,
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
+import numpy as np
 import pytest
 
 from hdtv.util import monkey_patch_ui
+from tests.helpers.utils import hdtvcmd
 
 monkey_patch_ui()
 
@@ -35,6 +37,8 @@ except RuntimeError:
     pass
 
 import hdtv.plugins.matInterface
+from hdtv.plugins.matInterface import MatInterface
+from hdtv.specreader import WriteMFileTrailer
 
 spectra = __main__.spectra
 
@@ -83,6 +87,52 @@ def test_cmd_cut_activate(matrix):
     raise NotImplementedError
 
 
+def test_cmd_cut_batch(tmp_path):
+    rng = np.random.default_rng(42)
+    data = rng.integers(0, 100, (64, 64))
+    data += data.T
+    fname = str(tmp_path / "test.mtx")
+    data.astype("<i4").tofile(fname)
+    WriteMFileTrailer(fname, 1, 64, 64, "le4")
+    gatefile = str(tmp_path / "gates.txt")
+    with open(gatefile, "w") as f:
+        f.write("10 12\n20 22 30 33\n")
+
+    hdtvcmd(f"matrix get sym {fname}")
+    output = str(tmp_path / "cut_{id}.txt")
+    f, ferr = hdtvcmd(f"cut batch {gatefile} -o {output} -f txt")
+    assert ferr == ""
+    assert f.count("Wrote cut spectrum") == 2
+
+    matrix = spectra.dict[spectra.activeID].matrix
+    cuts = [matrix.dict[ID] for ID in sorted(matrix.ids)]
+    assert len(cuts) == 2
+    expected = [
+        data[10:13].sum(axis=0),
+        data[20:23].sum(axis=0) - data[30:34].sum(axis=0) * 3 / 4,
+    ]
+    for cut, counts in zip(cuts, expected):
+        assert cut.spec.hist.counts == pytest.approx(counts)
+    assert len(list(tmp_path.glob("cut_*.txt"))) == 2
+
+
+def test_read_gate_file(temp_file):
+    with open(temp_file, "w") as f:
+        f.write("# gate bg1 bg2\n1332 1334 1340 1345\n\n1175 1171  # no bg\n")
+    cuts = MatInterface.ReadGateFile(temp_file)
+    assert len(cuts) == 2
+    gate = cuts[0].regionMarkers[0]
+    assert (gate.p1.pos_cal, gate.p2.pos_cal) == (1332, 1334)
+    assert len(cuts[0].bgMarkers) == 1
+    assert len(cuts[1].regionMarkers) == 1
+    assert len(cuts[1].bgMarkers) == 0
+
+    with open(temp_file, "w") as f:
+        f.write("1332 1334 1340\n")
+    with pytest.raises(hdtv.cmdline.HDTVCommandError):
+        MatInterface.ReadGateFile(temp_file)
+
+
 @pytest.mark.skip(reason="need example matrix")
 def test_cmd_cut_clear(matrix):
     raise NotImplementedError
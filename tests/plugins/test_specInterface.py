@@ -22,6 +22,7 @@ import re
 import warnings
 from math import ceil
 
+import numpy as np
 import pytest
 
 from hdtv.util import monkey_patch_ui
@@ -96,6 +97,25 @@ def test_cmd_spectrum_get_pattern(pattern):
     assert len(s.spectra.dict) == 1
 
 
+@pytest.mark.parametrize("workers", [1, 3])
+def test_cmd_spectrum_get_parallel(tmp_path, workers):
+    assert len(s.spectra.dict) == 0
+    for n in [10, 2, 1, 3]:
+        np.savetxt(tmp_path / f"spec{n}.txt", np.full(20, n))
+    (tmp_path / "spec4.txt").write_text("1 2 3 4\n")
+    hdtv.options.Set("spec.get.workers", str(workers))
+    try:
+        f, ferr = hdtvcmd(f"spectrum get {tmp_path}/spec*.txt'col {testspectrum}")
+    finally:
+        hdtv.options.Reset("spec.get.workers")
+    assert "Could not load" in ferr
+    assert len(s.spectra.dict) == 5
+    names = [get_spec(i).name for i in range(5)]
+    assert names == [f"spec{n}.txt" for n in [1, 2, 3, 10]] + ["osiris_bg.spc"]
+    for i, n in enumerate([1, 2, 3, 10]):
+        assert get_spec(i).hist.hist.GetSum() == 20 * n
+
+
 # Loading cal as spec file. This is really stupid, but it works.
 @pytest.mark.parametrize(
     "specfiles", [["tests/share/osiris_bg.spc", "tests/share/osiris_bg.cal"]]
@@ -331,6 +351,37 @@ def test_cmd_spectrum_resample():
         assert "Total area changed by" in f
 
 
+def test_cmd_spectrum_resample_replicas():
+    assert len(s.spectra.dict) == 0
+    hdtvcmd(f"spectrum get {testspectrum}")
+    orig_counts = get_spec(0).hist.counts.copy()
+
+    f, ferr = hdtvcmd("spectrum resample -s 42 -r 3 0")
+    assert ferr == ""
+    assert "Resampled spectrum 0 into 1, 2, 3" in f
+    assert len(s.spectra.dict) == 4
+    assert (get_spec(0).hist.counts == orig_counts).all()
+    replicas = [get_spec(i).hist.counts for i in (1, 2, 3)]
+    assert not (replicas[0] == replicas[1]).all()
+
+    # The replicas are reproducible with the same seed
+    hdtvcmd("spectrum resample -s 42 -r 3 0")
+    for i in (1, 2, 3):
+        assert (get_spec(i + 3).hist.counts == replicas[i - 1]).all()
+
+
+def test_cmd_spectrum_resample_replicas_array(temp_file):
+    assert len(s.spectra.dict) == 0
+    hdtvcmd(f"spectrum get {testspectrum}")
+
+    f, ferr = hdtvcmd(f"spectrum resample -s 42 -r 5 -a {temp_file}.npy 0")
+    assert ferr == ""
+    assert len(s.spectra.dict) == 1
+    replicas = np.load(f"{temp_file}.npy")
+    os.remove(f"{temp_file}.npy")
+    assert replicas.shape == (5, len(get_spec(0).hist.counts))
+
+
 @pytest.mark.parametrize(
     "copy, matches",
     [
@@ -434,6 +485,29 @@ def test_cmd_spectrum_add_normalize(specfile0, specfile1):
     assert spec0_count + spec1_count - 2 * spec2_count < 0.00001 * spec2_count
 
 
+def test_cmd_spectrum_add_calibrated():
+    assert len(s.spectra.dict) == 0
+    hdtvcmd(f"spectrum get {testspectrum}")
+    hdtvcmd(f"spectrum get {testspectrum}")
+    hdtvcmd("calibration position set 0.5 1.3 -s 1")
+    spec0_count = get_spec(0).hist.hist.GetSum()
+    spec1_count = get_spec(1).hist.hist.GetSum()
+    spec0_errors = get_spec(0).hist.errors.copy()
+    f, ferr = hdtvcmd("spectrum add 0 1")
+    assert "Adding 1 to 0" in f
+    # The calibrated spectrum covers only part of the uncalibrated one
+    new_count = get_spec(0).hist.hist.GetSum()
+    assert spec0_count < new_count <= spec0_count + spec1_count
+    assert (get_spec(0).hist.errors >= spec0_errors).all()
+    assert (get_spec(0).hist.errors > spec0_errors).any()
+    # The statistics follow the new contents
+    hist = get_spec(0).hist
+    centers = (hist.edges[:-1] + hist.edges[1:]) / 2
+    assert hist.hist.GetMean() == pytest.approx(
+        np.average(centers, weights=hist.counts)
+    )
+
+
 @pytest.mark.parametrize("specfile0, specfile1", [(testspectrum, testspectrum)])
 def test_cmd_spectrum_subtract(specfile0, specfile1):
     assert len(s.spectra.dict) == 0
@@ -448,9 +522,55 @@ def test_cmd_spectrum_subtract(specfile0, specfile1):
     assert spec0_count - spec1_count - new_count < 0.00001 * spec0_count
 
 
-@pytest.mark.skip(reason="What is spectrum update supposed to do?")
-def test_cmd_spectrum_update():
-    pass
+def test_cmd_spectrum_update(temp_file):
+    counts = np.arange(50.0)
+    np.savetxt(temp_file, counts)
+    hdtvcmd(f"spectrum get {temp_file}'col")
+    spec = get_spec(0)
+    hist = spec.hist.hist
+    assert not spec.FileChanged()
+
+    # Rewriting identical contents is not a change
+    np.savetxt(temp_file, counts)
+    os.utime(temp_file, ns=(0, 0))
+    assert not spec.FileChanged()
+    assert spec.hist.Refresh() == []
+
+    counts[10:13] += 5
+    counts[40] = 0
+    np.savetxt(temp_file, counts)
+    assert spec.FileChanged()
+    assert spec.hist.Refresh() == [(9.5, 12.5), (39.5, 40.5)]
+    assert spec.hist.hist is hist
+    assert [hist.GetBinContent(b) for b in range(1, 51)] == list(counts)
+    # The statistics follow the new contents
+    assert hist.GetMean() == pytest.approx(np.average(np.arange(50.0), weights=counts))
+    assert not spec.FileChanged()
+
+    f, ferr = hdtvcmd("spectrum update -f")
+    assert ferr == ""
+
+    # A missing file keeps the data and is reported only once
+    os.remove(temp_file)
+    assert spec.FileChanged()
+    assert spec.hist.Refresh() == []
+    assert [hist.GetBinContent(b) for b in range(1, 51)] == list(counts)
+    assert not spec.FileChanged()
+
+
+def test_cmd_spectrum_watch(temp_file):
+    np.savetxt(temp_file, np.arange(50.0))
+    hdtvcmd(f"spectrum get {temp_file}'col")
+    f, ferr = hdtvcmd("spectrum watch 0")
+    assert ferr == ""
+    assert s.watched
+    assert s._watchTimer is not None
+
+    # Deleting the last watched spectrum stops the timer
+    hdtvcmd("spectrum delete 0")
+    assert s.PollWatched() == []
+    assert not s.watched
+    assert s._watchTimer is None
 
 
 def get_spec(specid):